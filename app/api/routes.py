@@ -1,12 +1,24 @@
-from fastapi import APIRouter, Body, Request
-from fastapi.responses import FileResponse, HTMLResponse
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Request
+from fastapi.responses import FileResponse, HTMLResponse, StreamingResponse
+import hmac
 import os
 import logging
 
 logger = logging.getLogger(__name__)
 
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+def require_admin_token(x_admin_token: str = Header(None)):
+    if not ADMIN_TOKEN or x_admin_token is None or not hmac.compare_digest(
+        x_admin_token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8")
+    ):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
 router = APIRouter()
 
+# 管理用 API: ADMIN_TOKEN を設定したときだけ main.py で登録し、X-Admin-Token ヘッダーを確認する
+admin_router = APIRouter(dependencies=[Depends(require_admin_token)])
+
 @router.get("/")
 async def index_page():
     base = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'static'))
@@ -18,6 +30,90 @@ async def index_page():
     """
     return HTMLResponse(html)
 
+@router.get("/api/health")
+async def health_api():
+    """
+    ヘルスチェック API（死活監視用。内部状態は /api/admin/health）
+    
+    レスポンス:
+    {
+      "status": "ok" | "degraded"
+    }
+    """
+    from modules.cky.service.dep_model_service import get_dep_model
+    model, tokenizer = get_dep_model()
+    return {"status": "ok" if model is not None and tokenizer is not None else "degraded"}
+
+@admin_router.get("/api/admin/health")
+async def admin_health_api(request: Request):
+    """
+    ヘルスチェック詳細 API（管理用）
+    
+    レスポンス:
+    {
+      "status": "ok" | "degraded",
+      "ginza_loaded": true,
+      "dep_model": {
+        "model_loaded": true,
+        "inference": {"workers": 1, "max_queue": 8, "queue_depth": 0, "running": 0, ...},
+        "scheduler": {"pending_requests": 0, "pending_pairs": 0, ...},
+        "prediction_cache": {...},
+        "batching": {...}
+      },
+      "segmentation_cache": {"entries": 12, "hits": 40, "misses": 12, "coalesced": 3, ...}
+    }
+    """
+    from modules.cky.service.dep_model_service import get_dep_model_health
+    from modules.bunsetu.service.bunsetu_service import get_segmentation_cache_stats
+    dep_model = get_dep_model_health()
+    return {
+        "status": "ok" if dep_model["model_loaded"] else "degraded",
+        "ginza_loaded": getattr(request.app.state, "ginza_model", None) is not None,
+        "dep_model": dep_model,
+        "segmentation_cache": get_segmentation_cache_stats()
+    }
+
+@admin_router.get("/api/admin/debug-capture")
+async def debug_capture_api(limit: int = 50, kind: str = None, pattern: str = None):
+    """
+    トリプル抽出のデバッグキャプチャを参照（サンプリングされた直近レコード。管理用）
+
+    クエリ: limit (既定 50), kind ("extract_triples"), pattern (パターン文字列で絞り込み)
+
+    レスポンス:
+    {
+      "status": "success",
+      "capture": {"enabled": true, "sample_rate": 0.01, "captured": 12, "dropped": 0, ...},
+      "records": [{"ts": ..., "kind": "extract_triples", "pattern": "[X1]は[Y1]", "bindings": {...}, "triples": [...]}]
+    }
+    """
+    from modules.matching.components.debug_capture import get_debug_capture
+    capture = get_debug_capture()
+    return {
+        "status": "success",
+        "capture": capture.stats(),
+        "records": capture.query(limit=limit, kind=kind, pattern=pattern)
+    }
+
+@admin_router.post("/api/admin/debug-capture")
+async def debug_capture_config_api(request: Request):
+    """
+    デバッグキャプチャの設定変更（管理用）
+
+    リクエスト: {"sample_rate": 0.05}   (0 で無効化)
+    """
+    try:
+        body = await request.json()
+        from modules.matching.components.debug_capture import get_debug_capture
+        capture = get_debug_capture()
+        sample_rate = body.get('sample_rate', None)
+        capture.configure(sample_rate=float(sample_rate) if sample_rate is not None else None)
+        logger.info(f"[Debug Capture API] sample_rate={capture.sample_rate}")
+        return {"status": "success", "capture": capture.stats()}
+    except Exception as e:
+        logger.error(f"[Debug Capture API] Error: {str(e)}")
+        return {"status": "error", "message": str(e)}
+
 @router.get("/api/patterns")
 async def patterns_api():
     """
@@ -71,6 +167,59 @@ async def bunsetu_api(request: Request, text: str = Body(..., embed=True)):
     from modules.bunsetu.service.bunsetu_service import segment_bunsetu_service
     return await segment_bunsetu_service(text, request)
 
+@router.post("/api/bunsetu/batch")
+async def bunsetu_batch_api(request: Request):
+    """
+    複数テキストの文節分割（nlp.pipe でまとめて解析）
+
+    リクエスト:
+    {
+      "texts": ["文1", "文2", ...],
+      "batch_size": 64    (省略可, 既定 BUNSETU_BATCH_SIZE, 上限 BUNSETU_MAX_BATCH_SIZE)
+    }
+
+    プロセス数はサーバー側の BUNSETU_N_PROCESS で決まり、リクエストでは変えられない
+
+    レスポンス (application/x-ndjson, 入力順に 1 行 1 JSON):
+      {"index": 0, "bunsetsu": [{"bunsetu": [...]}, ...]}
+    """
+    import json
+
+    try:
+        body = await request.json()
+        texts = body.get('texts', [])
+        if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+            raise ValueError("texts must be a list of strings")
+        batch_size = body.get('batch_size', None)
+        batch_size = int(batch_size) if batch_size is not None else None
+        if batch_size is not None and batch_size < 1:
+            raise ValueError("batch_size must be positive")
+
+        from modules.bunsetu.components.ginza import MAX_BATCH_SIZE
+        if batch_size is not None:
+            batch_size = min(batch_size, MAX_BATCH_SIZE)
+
+        logger.info(f"[Bunsetu Batch API] Received {len(texts)} texts")
+
+        from modules.bunsetu.service.bunsetu_service import segment_bunsetu_batch_service
+
+        async def generate():
+            index = 0
+            try:
+                async for bunsetsu_list in segment_bunsetu_batch_service(texts, request, batch_size):
+                    yield json.dumps({"index": index, "bunsetsu": bunsetsu_list}, ensure_ascii=False) + "\n"
+                    index += 1
+            except Exception as e:
+                logger.error(f"[Bunsetu Batch API] Error at index {index}: {str(e)}")
+                yield json.dumps({"status": "error", "index": index, "message": str(e)}, ensure_ascii=False) + "\n"
+
+        return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+    except Exception as e:
+        logger.error(f"[Bunsetu Batch API] Error: {str(e)}")
+        error_line = json.dumps({"status": "error", "message": str(e)}, ensure_ascii=False) + "\n"
+        return StreamingResponse(iter([error_line]), media_type="application/x-ndjson")
+
 @router.post("/api/cky")
 async def cky_api(request: Request):
     """
@@ -78,12 +227,15 @@ async def cky_api(request: Request):
     
     リクエスト:
     {
-      "data": [ 編集済み分節データ ]
+      "data": [ 編集済み分節データ ],
+      "session_id": "...",   // 省略可: 既存の解析セッションを再利用（data と併せて送る場合は data の内容と一致すること）
+      "prune": false         // 省略可: true で pred=0 の split の下にしかないスパンを展開・推論しない
     }
     
     レスポンス:
     {
       "status": "success",
+      "session_id": "...",   // expand-cell / matching で再利用できる解析セッション ID
       "cky_matrix": [...],
       "combinations": [...],
       "tree_structures": {...}
@@ -92,11 +244,13 @@ async def cky_api(request: Request):
     try:
         body = await request.json()
         bunsetsu_data = body.get('data', [])
+        session_id = body.get('session_id', None)
+        prune = parse_prune_flag(body)
         
-        logger.info(f"[CKY API] Received {len(bunsetsu_data)} bunsetsu items")
+        logger.info(f"[CKY API] Received {len(bunsetsu_data)} bunsetsu items (prune={prune})")
         
         from modules.cky.service.cky_service import cky_parse_service
-        result = await cky_parse_service(bunsetsu_data, request)
+        result = await cky_parse_service(bunsetsu_data, request, session_id=session_id, prune=prune)
         
         return result
     
@@ -118,7 +272,7 @@ async def cky_matching_api(request: Request):
     CKY パーサー + パターンマッチング統合API
     
     リクエスト: 
-      - Form 1: { data: 編集済み分節データ } (CKY→マッチング)
+      - Form 1: { data: 編集済み分節データ, session_id: 省略可, prune: 省略可 } (CKY→マッチング)
       - Form 2: { tree: ツリーノード, bunsetsu_list: 分節情報 } (ツリー選択→マッチング)
     
     処理: 
@@ -138,14 +292,16 @@ async def cky_matching_api(request: Request):
         body = await request.json()
         logger.debug(f"[CKY Matching API] Request body keys: {body.keys()}")
 
-        if 'data' in body:
+        if 'data' in body or 'session_id' in body:
             bunsetsu_data = body.get('data', [])
+            session_id = body.get('session_id', None)
             selected_patterns = body.get('selected_patterns', None)
+            prune = parse_prune_flag(body)
             
-            logger.info(f"[CKY Matching API] Form 1: Received {len(bunsetsu_data)} bunsetsu items")
+            logger.info(f"[CKY Matching API] Form 1: Received {len(bunsetsu_data)} bunsetsu items (prune={prune})")
 
             from modules.cky.service.cky_service import cky_parse_service
-            cky_result = await cky_parse_service(bunsetsu_data, request)
+            cky_result = await cky_parse_service(bunsetsu_data, request, session_id=session_id, prune=prune)
             
             if cky_result.get('status') != 'success':
                 logger.error(f"[CKY Matching API] CKY parsing failed: {cky_result.get('message', 'Unknown error')}")
@@ -212,7 +368,7 @@ async def cky_matching_api(request: Request):
             logger.error(f"[CKY Matching API] Invalid request format. Body keys: {list(body.keys())}")
             return {
                 "status": "error",
-                "message": "Invalid request format. Expected either 'data' or 'tree'+'bunsetsu_list'",
+                "message": "Invalid request format. Expected either 'data'/'session_id' or 'tree'+'bunsetsu_list'",
                 "triples": []
             }
         
@@ -256,7 +412,8 @@ async def cky_matching_api(request: Request):
             "triples": matching_result.get('triples', []),
             "matched_patterns": matching_result.get('matched_patterns', []),
             "pattern_status": matching_result.get('pattern_status', {}),
-            "structural_analysis": matching_result.get('structural_analysis')
+            "structural_analysis": matching_result.get('structural_analysis'),
+            "prefilter": matching_result.get('prefilter')
         }
 
         if response_data['status'] == 'error':
@@ -289,8 +446,13 @@ async def cky_expand_cell_api(request: Request):
     リクエスト:
     {
       "data": 編集済み分節データ,
+      "session_id": "...",   // 省略可: /api/cky が返した解析セッション ID（data と併せて送る場合は data の内容と一致すること）
       "cell": [i, j],        // クリックされたセル
-      "pred_threshold": 1     // pred >= threshold のみ展開
+      "pred_threshold": 1,    // pred >= threshold のみ展開
+      "offset": 0,            // 省略可: 先頭からスキップするツリー数
+      "limit": 20,            // 省略可: 返すツリー数の上限（省略時は全件）
+      "format": "tree",       // 省略可: "tree"（展開済み）または "dag"（共有ノード ID 参照）
+      "prune": false          // 省略可: /api/cky と同じ枝刈りモードのセッションを使う
     }
     
     レスポンス:
@@ -300,37 +462,46 @@ async def cky_expand_cell_api(request: Request):
       "cell_text": "...",
       "cell_types": ["core", "func", ...],
       "is_terminal": bool,
-      "trees": [
+      "total_trees": 42,      // セルから展開できるツリーの総数
+      "offset": 0,
+      "limit": 20,
+      "tree_list": [
         {
-          "split_idx": 0,
-          "left": [i, k],
-          "right": [k+1, j],
-          "left_text": "...",
-          "right_text": "...",
-          "pred": 0 or 1,
-          "color": "green" or "red",
-          "confidence": 0.95,
-          "tree": { /* ノード構造 */ }
+          "tree_id": "tree_0",
+          "tree_number": 1,
+          "left_split": "...",
+          "right_split": "...",
+          "root_pred": 0 or 1,
+          "tree": { /* ノード構造 */ }   // format="dag" の場合はノード ID
         },
         ...
-      ]
+      ],
+      "nodes": { "i-j-rank": { ..., "children": ["i-k-r1", "k+1-j-r2"] } }   // format="dag" の場合のみ
     }
     """
     try:
         body = await request.json()
         bunsetsu_data = body.get('data', [])
+        session_id = body.get('session_id', None)
         cell = body.get('cell', None)
         pred_threshold = body.get('pred_threshold', 1)
+        offset, limit = parse_page_params(body)
+        output_format = parse_tree_format(body)
+        prune = parse_prune_flag(body)
         
         if not cell or len(cell) != 2:
             return {"status": "error", "message": "Invalid cell parameter"}
         
         cell_i, cell_j = cell
         
-        logger.info(f"[CKY Expand Cell] Expanding from cell ({cell_i}, {cell_j})")
+        logger.info(f"[CKY Expand Cell] Expanding from cell ({cell_i}, {cell_j}), offset={offset}, limit={limit}")
         
         from modules.cky.service.cky_service import cky_expand_cell_service
-        result = await cky_expand_cell_service(bunsetsu_data, cell_i, cell_j, pred_threshold, request)
+        result = await cky_expand_cell_service(
+            bunsetsu_data, cell_i, cell_j, pred_threshold, request,
+            session_id=session_id, offset=offset, limit=limit, output_format=output_format,
+            prune=prune
+        )
         
         return result
     
@@ -338,6 +509,72 @@ async def cky_expand_cell_api(request: Request):
         logger.error(f"[CKY Expand Cell API] Error: {str(e)}")
         return {"status": "error", "message": str(e)}
 
+@router.post("/api/cky/expand-cell/stream")
+async def cky_expand_cell_stream_api(request: Request):
+    """
+    /api/cky/expand-cell のストリーミング版（NDJSON）
+    
+    リクエスト: /api/cky/expand-cell と同じ
+    
+    レスポンス (application/x-ndjson, 1 行 1 JSON):
+      1 行目: {"status": "success", "cell": [i, j], "cell_text": "...", "total_trees": 42, ...}
+      2 行目以降: {"tree_id": "tree_0", "tree": {...}, "tree_number": 1, ...}
+                 format="dag" の場合は "tree" がノード ID になり、その行で初出のノードを "nodes" に含む
+    """
+    import json
+
+    try:
+        body = await request.json()
+        bunsetsu_data = body.get('data', [])
+        session_id = body.get('session_id', None)
+        cell = body.get('cell', None)
+        offset, limit = parse_page_params(body)
+        output_format = parse_tree_format(body)
+        prune = parse_prune_flag(body)
+
+        if not cell or len(cell) != 2:
+            raise ValueError("Invalid cell parameter")
+
+        cell_i, cell_j = cell
+
+        logger.info(f"[CKY Expand Cell Stream] Streaming from cell ({cell_i}, {cell_j}), offset={offset}, limit={limit}")
+
+        from modules.cky.service.cky_service import cky_expand_cell_stream_service
+        return StreamingResponse(
+            cky_expand_cell_stream_service(
+                bunsetsu_data, cell_i, cell_j, request,
+                session_id=session_id, offset=offset, limit=limit, output_format=output_format,
+                prune=prune
+            ),
+            media_type="application/x-ndjson"
+        )
+
+    except Exception as e:
+        logger.error(f"[CKY Expand Cell Stream API] Error: {str(e)}")
+        error_line = json.dumps({"status": "error", "message": str(e)}, ensure_ascii=False) + "\n"
+        return StreamingResponse(iter([error_line]), media_type="application/x-ndjson")
+
+def parse_page_params(body):
+    offset = int(body.get('offset') or 0)
+    limit = body.get('limit', None)
+    if limit is not None:
+        limit = int(limit)
+    if offset < 0 or (limit is not None and limit < 0):
+        raise ValueError("offset and limit must be non-negative")
+    return offset, limit
+
+def parse_tree_format(body):
+    output_format = body.get('format', 'tree') or 'tree'
+    if output_format not in ('tree', 'dag'):
+        raise ValueError(f"Unknown format '{output_format}' (expected 'tree' or 'dag')")
+    return output_format
+
+def parse_prune_flag(body):
+    prune = body.get('prune', False)
+    if isinstance(prune, str):
+        return prune.strip().lower() in ('1', 'true', 'yes')
+    return bool(prune)
+
 @router.post("/api/matching/pattern-status")
 async def matching_pattern_status_api(request: Request):
     """
@@ -377,7 +614,8 @@ async def matching_pattern_status_api(request: Request):
         "total_patterns": 453,
         "matchable_patterns": 12,
         "matched_patterns": 8,
-        "selected_patterns": 5
+        "selected_patterns": 5,
+        "prefilter": {"patterns": 454, "rejected": 391, "rejection_rate": 0.86}
       }
     }
     """
@@ -414,7 +652,9 @@ async def matching_pattern_status_api(request: Request):
         try:
 
             from modules.matching.components.matcher_v3_final import PatternMatcherV3Final
+            from modules.matching.components.pattern_automaton import get_pattern_automaton
             matcher = PatternMatcherV3Final()
+            automaton = get_pattern_automaton(struct_groups)
         except ImportError as ie:
             logger.error(f"[Pattern Status API] Import error: {str(ie)}")
             raise
@@ -426,6 +666,7 @@ async def matching_pattern_status_api(request: Request):
 
         matched_patterns_list = []
         matched_pattern_map = {}
+        results = matcher.match_all(tree, automaton)
         
         for pattern_id_str, pattern_data in struct_groups.items():
             pattern_id = int(pattern_id_str)
@@ -434,7 +675,7 @@ async def matching_pattern_status_api(request: Request):
             if not pattern_str:
                 continue
 
-            result = matcher.match_and_extract(tree, pattern_str, pattern_id=pattern_id)
+            result = results.get(str(pattern_id_str))
             if result and result.get("match"):
                 matched_patterns_list.append(pattern_id)
                 matched_pattern_map[pattern_id_str] = {
@@ -475,7 +716,8 @@ async def matching_pattern_status_api(request: Request):
                 "total_patterns": len(struct_groups),
                 "matchable_patterns": matchable_count,
                 "matched_patterns": matched_count,
-                "selected_patterns": matched_count
+                "selected_patterns": matched_count,
+                "prefilter": matcher.prefilter_stats
             }
         }
     
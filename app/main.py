@@ -24,15 +24,24 @@ async def lifespan(app: FastAPI):
     
     yield
 
-    pass
+    from modules.matching.components.debug_capture import get_debug_capture
+    get_debug_capture().close()
+
+    # 予測キャッシュの未書き込み分を反映
+    from modules.cky.service.dep_model_service import get_prediction_cache
+    prediction_cache = get_prediction_cache()
+    if prediction_cache is not None:
+        prediction_cache.close()
 
 app = FastAPI(lifespan=lifespan)
 
 static_dir = os.path.join(os.path.dirname(__file__), "static")
 app.mount("/static", StaticFiles(directory=static_dir), name="static")
 
-from api.routes import router
+from api.routes import ADMIN_TOKEN, admin_router, router
 app.include_router(router)
+if ADMIN_TOKEN:
+    app.include_router(admin_router)
 
 if __name__ == "__main__":
     import uvicorn
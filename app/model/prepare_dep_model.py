@@ -0,0 +1,174 @@
+"""
+依存モデルの CPU 向けバリアントを作成し、fp32 との一致率レポートを出力する
+
+  python app/model/prepare_dep_model.py [--variants int8 torchscript onnx]
+                                        [--pairs held_out_pairs.jsonl] [--limit 2000]
+
+作成物 (app/model/dep_model_variants/):
+  int8/         動的量子化 (nn.Linear → qint8) した TorchScript
+  torchscript/  fp32 の TorchScript
+  onnx/         ONNX Runtime (CPU) 用のグラフ
+  report.json   各バリアントの pred 一致率・confidence 差・スループット
+
+評価用の split ペアは --pairs の JSONL ({"left": ..., "right": ...}) か、
+無ければ DEP_PREDICTION_CACHE_PATH の予測キャッシュに蓄積されたペアを使う
+（サーバーは DEP_PREDICTION_CACHE_PATH を指定したときだけ予測をディスクに残すので、どちらかが必要）。
+サーバー側は DEP_MODEL_VARIANT=int8|torchscript|onnx で切り替える。
+"""
+from pathlib import Path
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import time
+
+ROOT = Path(__file__).resolve().parent
+APP_DIR = ROOT.parent
+if str(APP_DIR) not in sys.path:
+    sys.path.insert(0, str(APP_DIR))
+
+import torch
+from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+from modules.cky.components.dep_model_variants import (
+    export_onnx, export_traced, load_variant, model_input_names, quantize_int8, variant_dir
+)
+from modules.cky.service.dep_model_service import predict_uncached
+
+MODEL_DIR = ROOT / "dep_model"
+VARIANTS_DIR = ROOT / "dep_model_variants"
+CACHE_DB = os.environ.get("DEP_PREDICTION_CACHE_PATH")
+
+def load_pairs(path, limit, seed):
+    pairs = []
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    item = json.loads(line)
+                    pairs.append({"left": item["left"], "right": item["right"]})
+    elif CACHE_DB and os.path.exists(CACHE_DB):
+        conn = sqlite3.connect(CACHE_DB)
+        for (pair_key,) in conn.execute("SELECT DISTINCT pair_key FROM pair_predictions"):
+            left, right = json.loads(pair_key)
+            pairs.append({"left": left, "right": right})
+        conn.close()
+
+    random.Random(seed).shuffle(pairs)
+    return pairs[:limit]
+
+def evaluate(model, tokenizer, pairs, repeats):
+    predict_uncached(model, tokenizer, pairs[:8])
+    results = None
+    started = time.perf_counter()
+    for _ in range(repeats):
+        results = predict_uncached(model, tokenizer, pairs)
+    elapsed = (time.perf_counter() - started) / repeats
+    if results is None:
+        raise RuntimeError("prediction failed (see log)")
+    return results, len(pairs) / elapsed
+
+def compare(reference, results):
+    flips = sum(1 for a, b in zip(reference, results) if a["pred"] != b["pred"])
+    diffs = [abs(a["confidence"] - b["confidence"]) for a, b in zip(reference, results)]
+    return {
+        "pairs": len(reference),
+        "pred_agreement": 1 - flips / len(reference),
+        "pred_flips": flips,
+        "confidence_mean_abs_diff": sum(diffs) / len(diffs),
+        "confidence_max_abs_diff": max(diffs)
+    }
+
+def dir_size_mb(path):
+    return sum(p.stat().st_size for p in Path(path).rglob("*") if p.is_file()) / (1024 * 1024)
+
+def main():
+    parser = argparse.ArgumentParser(description="Prepare CPU-optimized dependency model variants")
+    parser.add_argument("--variants", nargs="+", default=["int8", "torchscript", "onnx"],
+                        choices=["int8", "torchscript", "onnx"])
+    parser.add_argument("--pairs", help="held-out split pairs (JSONL with left/right)")
+    parser.add_argument("--limit", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    if not MODEL_DIR.exists():
+        print(f"Model not found: {MODEL_DIR}")
+        raise SystemExit(1)
+
+    pairs = load_pairs(args.pairs, args.limit, args.seed)
+    if not pairs:
+        if CACHE_DB:
+            print(f"No held-out pairs in {CACHE_DB}: pass --pairs, or run the server with "
+                  "DEP_PREDICTION_CACHE_PATH set to this file to fill it.")
+        else:
+            print("No held-out pairs: pass --pairs, or set DEP_PREDICTION_CACHE_PATH to a prediction cache "
+                  "filled by a server running with the same setting.")
+        raise SystemExit(1)
+
+    tokenizer = AutoTokenizer.from_pretrained(str(MODEL_DIR), local_files_only=True)
+    model = AutoModelForSequenceClassification.from_pretrained(
+        str(MODEL_DIR), local_files_only=True, torchscript=True
+    )
+    model.eval()
+
+    example = tokenizer(
+        [f"{pair['left']} [SEP] {pair['right']}" for pair in pairs[:2]],
+        return_tensors="pt", padding=True, truncation=True, max_length=512
+    )
+    input_names = model_input_names(example)
+
+    for variant in args.variants:
+        path = variant_dir(str(VARIANTS_DIR), variant)
+        print(f"Exporting {variant} -> {path}")
+        if variant == "int8":
+            export_traced(quantize_int8(model), example, input_names, path, variant)
+        elif variant == "torchscript":
+            export_traced(model, example, input_names, path, variant)
+        else:
+            try:
+                import onnxruntime  # noqa: F401
+            except ImportError:
+                print("  onnxruntime is not installed; skipping the onnx variant")
+                continue
+            export_onnx(model, example, input_names, path)
+
+    print(f"Evaluating on {len(pairs)} held-out pairs")
+    reference_model = AutoModelForSequenceClassification.from_pretrained(str(MODEL_DIR), local_files_only=True)
+    reference_model.eval()
+    reference, reference_speed = evaluate(reference_model, tokenizer, pairs, args.repeats)
+
+    report = {
+        "model_dir": str(MODEL_DIR),
+        "torch_threads": torch.get_num_threads(),
+        "fp32": {"pairs_per_sec": reference_speed, "size_mb": dir_size_mb(MODEL_DIR)},
+        "variants": {}
+    }
+    for variant in args.variants:
+        path = variant_dir(str(VARIANTS_DIR), variant)
+        if not Path(path, "variant.json").exists():
+            continue
+        results, speed = evaluate(load_variant(variant, str(VARIANTS_DIR)), tokenizer, pairs, args.repeats)
+        entry = compare(reference, results)
+        entry["pairs_per_sec"] = speed
+        entry["speedup"] = speed / reference_speed
+        entry["size_mb"] = dir_size_mb(path)
+        report["variants"][variant] = entry
+
+    out = VARIANTS_DIR / "report.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    print(f"{'variant':<12} {'agree':>8} {'flips':>6} {'|dconf| mean':>13} {'max':>7} {'pairs/s':>9} {'speedup':>8} {'MB':>8}")
+    print(f"{'fp32':<12} {1:>8.4f} {0:>6} {0:>13.4f} {0:>7.3f} {reference_speed:>9.1f} {1:>8.2f} {report['fp32']['size_mb']:>8.1f}")
+    for variant, entry in report["variants"].items():
+        print(f"{variant:<12} {entry['pred_agreement']:>8.4f} {entry['pred_flips']:>6} "
+              f"{entry['confidence_mean_abs_diff']:>13.4f} {entry['confidence_max_abs_diff']:>7.3f} "
+              f"{entry['pairs_per_sec']:>9.1f} {entry['speedup']:>8.2f} {entry['size_mb']:>8.1f}")
+    print(f"Wrote agreement report to {out}")
+
+if __name__ == "__main__":
+    main()
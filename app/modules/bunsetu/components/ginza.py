@@ -1,55 +1,175 @@
+from collections import OrderedDict
 import asyncio
+import os
+import threading
+
+BATCH_SIZE = int(os.environ.get("BUNSETU_BATCH_SIZE", 64))
+BATCH_N_PROCESS = int(os.environ.get("BUNSETU_N_PROCESS", 1))
+MAX_BATCH_SIZE = int(os.environ.get("BUNSETU_MAX_BATCH_SIZE", 256))
+STEM_TYPE_CACHE_SIZE = int(os.environ.get("BUNSETU_STEM_TYPE_CACHE_SIZE", 32768))
+
+CORE_POS = {"NOUN", "PROPN", "VERB", "ADJ", "ADV", "PRON", "DET", "INTJ"}
+CONTENT_POS = {"NOUN", "PROPN", "VERB", "ADJ", "ADV", "PRON"}
+
+_stem_types = OrderedDict()
+# group_into_bunsetsu は asyncio.to_thread のワーカーから同時に呼ばれる
+_stem_types_lock = threading.Lock()
 
 def is_core(pos):
+    return pos in CORE_POS
 
-    core_pos = {"NOUN", "PROPN", "VERB", "ADJ", "ADV", "PRON", "DET", "INTJ"}
-    return pos in core_pos
+def stem_type_of(morph):
+    # MorphAnalysis.key ごとに 1 回だけ素性を引く（LRU で STEM_TYPE_CACHE_SIZE 件まで）
+    key = morph.key
+    with _stem_types_lock:
+        if key in _stem_types:
+            _stem_types.move_to_end(key)
+            return _stem_types[key]
+    feats = morph.to_dict()
+    inf = feats.get("Inf", "").split(",")
+    form = feats.get("Form", "").split(",")
+    if "Stative" in inf or "Renyou" in form:
+        stem_type = "sa_hen"
+    elif "Truncated" in form:
+        stem_type = "other"
+    else:
+        stem_type = None
+    with _stem_types_lock:
+        _stem_types[key] = stem_type
+        if len(_stem_types) > STEM_TYPE_CACHE_SIZE:
+            _stem_types.popitem(last=False)
+    return stem_type
 
-def collect_bunsetu(token, visited):
-    if token.i in visited:
-        return []
-    visited.add(token.i)
-    bunsetu = [token]
-    for child in token.children:
+class BunsetsuColumns:
+    """
+    文節分割結果の列指向表現
 
-        if child.pos_ not in {"NOUN", "PROPN", "VERB", "ADJ", "ADV", "PRON"}:
-            bunsetu.extend(collect_bunsetu(child, visited))
-    return bunsetu
+    形態素ごとの列 (texts / pos / tags / types / stem_types) と、
+    文節 k の形態素範囲 offsets[k]:offsets[k + 1] を持つ
+    """
+    __slots__ = ("texts", "pos", "tags", "types", "stem_types", "offsets")
 
-def group_into_bunsetsu(doc):
-    bunsetsu_list = []
-    visited = set()
+    def __init__(self):
+        self.texts = []
+        self.pos = []
+        self.tags = []
+        self.types = []
+        self.stem_types = []
+        self.offsets = [0]
 
-    content_pos = {"NOUN", "PROPN", "VERB", "ADJ", "ADV", "PRON"}
-    for token in doc:
-        if token.pos_ in content_pos and token.i not in visited:
-            bunsetu_tokens = collect_bunsetu(token, visited)
+    def __len__(self):
+        return len(self.offsets) - 1
 
-            bunsetu_tokens.sort(key=lambda t: t.i)
-            bunsetu = []
-            for t in bunsetu_tokens:
+    @classmethod
+    def from_list(cls, bunsetsu_list):
+        columns = cls()
+        for item in bunsetsu_list:
+            for morph in item["bunsetu"]:
+                columns.texts.append(morph["text"])
+                columns.pos.append(morph["pos"])
+                columns.tags.append(morph["tag"])
+                columns.types.append(morph["type"])
+                columns.stem_types.append(morph.get("stem_type"))
+            columns.offsets.append(len(columns.texts))
+        return columns
 
+    def to_list(self):
+        bunsetsu_list = []
+        offsets = self.offsets
+        for k in range(len(offsets) - 1):
+            bunsetu = []
+            for p in range(offsets[k], offsets[k + 1]):
                 morph = {
-                    "text": t.text,
-                    "pos": t.pos_,
-                    "tag": t.tag_,
-                    "type": "core" if is_core(t.pos_) else "func"
+                    "text": self.texts[p],
+                    "pos": self.pos[p],
+                    "tag": self.tags[p],
+                    "type": self.types[p]
                 }
-
-                if "Inf=Stative" in str(t.morph) or "Form=Renyou" in str(t.morph):
-                    morph["stem_type"] = "sa_hen"
-
-                morph_str = str(t.morph)
-                if "Form=Truncated" in morph_str:
-                    if "stem_type" not in morph:
-                        morph["stem_type"] = "other"
-                
+                if self.stem_types[p] is not None:
+                    morph["stem_type"] = self.stem_types[p]
                 bunsetu.append(morph)
             bunsetsu_list.append({"bunsetu": bunsetu})
-    return bunsetsu_list
+        return bunsetsu_list
+
+def group_into_bunsetsu_columns(doc):
+    n = len(doc)
+    texts = [None] * n
+    pos = [None] * n
+    tags = [None] * n
+    heads = [0] * n
+    morphs = [None] * n
+    for t in doc:
+        i = t.i
+        texts[i] = t.text
+        pos[i] = t.pos_
+        tags[i] = t.tag_
+        heads[i] = t.head.i
+        morphs[i] = t.morph
 
-async def segment_bunsetu(text, nlp):
+    # 内容語は自分自身が文節の主辞、付属語は係り先をたどって最初に出会う内容語の文節に属する
+    # (根まで内容語が無ければどの文節にも属さない)
+    owner = [-2] * n
+    for i in range(n):
+        path = []
+        k = i
+        while owner[k] == -2:
+            if pos[k] in CONTENT_POS:
+                owner[k] = k
+            elif heads[k] == k:
+                owner[k] = -1
+            else:
+                path.append(k)
+                k = heads[k]
+        for p in path:
+            owner[p] = owner[k]
+
+    members = {}
+    for i in range(n):
+        if owner[i] >= 0:
+            members.setdefault(owner[i], []).append(i)
+
+    columns = BunsetsuColumns()
+    for head in range(n):
+        if owner[head] != head:
+            continue
+        for i in members[head]:
+            columns.texts.append(texts[i])
+            columns.pos.append(pos[i])
+            columns.tags.append(tags[i])
+            columns.types.append("core" if pos[i] in CORE_POS else "func")
+            columns.stem_types.append(stem_type_of(morphs[i]))
+        columns.offsets.append(len(columns.texts))
+    return columns
+
+def group_into_bunsetsu(doc):
+    return group_into_bunsetsu_columns(doc).to_list()
+
+def model_version(nlp):
+    meta = nlp.meta
+    return f"{meta.get('lang')}_{meta.get('name')}-{meta.get('version')}:{','.join(nlp.pipe_names)}"
+
+async def segment_bunsetu(text, nlp, as_columns=False):
     def _segment():
-        doc = nlp(text)
-        return group_into_bunsetsu(doc)
+        columns = group_into_bunsetsu_columns(nlp(text))
+        return columns if as_columns else columns.to_list()
     return await asyncio.to_thread(_segment)
+
+def segment_bunsetu_batch(texts, nlp, batch_size=None, n_process=None, as_columns=False):
+    # nlp.pipe は n_process > 1 でも入力順に Doc を返す
+    docs = nlp.pipe(
+        texts,
+        batch_size=batch_size or BATCH_SIZE,
+        n_process=n_process or BATCH_N_PROCESS
+    )
+    for doc in docs:
+        columns = group_into_bunsetsu_columns(doc)
+        yield columns if as_columns else columns.to_list()
+
+async def segment_bunsetu_stream(texts, nlp, batch_size=None, n_process=None, as_columns=False):
+    results = segment_bunsetu_batch(texts, nlp, batch_size, n_process, as_columns)
+    done = object()
+    while True:
+        bunsetsu_list = await asyncio.to_thread(next, results, done)
+        if bunsetsu_list is done:
+            break
+        yield bunsetsu_list
@@ -0,0 +1,190 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from .ginza import BunsetsuColumns
+
+def normalize_text(text):
+    return unicodedata.normalize("NFKC", text)
+
+class SegmentationCache:
+    def __init__(self, model_version, db_path=None, max_entries=10000, ttl=None):
+        self.model_version = model_version
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.ttl = ttl or None
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._conn = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.coalesced = 0
+
+        if db_path:
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS segmentations ("
+                "model_version TEXT NOT NULL, text TEXT NOT NULL, "
+                "result TEXT NOT NULL, created_at REAL NOT NULL, "
+                "PRIMARY KEY (model_version, text))"
+            )
+            # GiNZA のバージョンや構成が変わっていたら古い結果は捨てる
+            self._conn.execute("DELETE FROM segmentations WHERE model_version != ?", (model_version,))
+            if self.ttl:
+                self._conn.execute("DELETE FROM segmentations WHERE created_at < ?", (time.time() - self.ttl,))
+            self._conn.commit()
+
+    def get(self, text):
+        with self._lock:
+            now = time.time()
+            entry = self._entries.get(text)
+            if entry is not None:
+                if self._is_fresh(entry[1], now):
+                    self._entries.move_to_end(text)
+                    self.hits += 1
+                    return entry[0]
+                del self._entries[text]
+                self.expired += 1
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT result, created_at FROM segmentations WHERE model_version = ? AND text = ?",
+                    (self.model_version, text)
+                ).fetchone()
+                if row is not None and self._is_fresh(row[1], now):
+                    columns = BunsetsuColumns.from_list(json.loads(row[0]))
+                    self._remember(text, columns, row[1])
+                    self.disk_hits += 1
+                    return columns
+
+            self.misses += 1
+            return None
+
+    def put(self, text, columns):
+        with self._lock:
+            created_at = time.time()
+            self._remember(text, columns, created_at)
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO segmentations (model_version, text, result, created_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    (self.model_version, text, json.dumps(columns.to_list(), ensure_ascii=False), created_at)
+                )
+                self._conn.commit()
+
+    @property
+    def persistent(self):
+        return self._conn is not None
+
+    async def lookup(self, keys):
+        if self.persistent:
+            # SQLite を引くことがあるのでイベントループの外で
+            return await asyncio.to_thread(lambda: [self.get(key) for key in keys])
+        return [self.get(key) for key in keys]
+
+    async def store(self, key, columns):
+        if self.persistent:
+            await asyncio.to_thread(self.put, key, columns)
+        else:
+            self.put(key, columns)
+
+    def join(self, key):
+        """実行中の解析があればその Future を返す（無ければ None）"""
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+        return future
+
+    def begin(self, key):
+        future = asyncio.get_running_loop().create_future()
+        # 待ち手がいないまま失敗しても "exception was never retrieved" を出さない
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        return future
+
+    def finish(self, key, future, columns):
+        self._inflight.pop(key, None)
+        if not future.done():
+            future.set_result(columns)
+
+    def abort(self, key, future, error=None):
+        self._inflight.pop(key, None)
+        if future.done():
+            return
+        if isinstance(error, Exception):
+            future.set_exception(error)
+        else:
+            future.cancel()
+
+    async def get_or_segment(self, key, segment):
+        """
+        key は normalize_text 済みのテキスト。segment() は BunsetsuColumns を返すコルーチン
+
+        同じ key の解析（キャッシュ参照を含む）が実行中なら、新たに解析せずその結果を待つ
+        """
+        future = self.join(key)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = self.begin(key)
+        try:
+            columns = (await self.lookup([key]))[0]
+            if columns is None:
+                columns = await segment()
+                await self.store(key, columns)
+        except BaseException as e:
+            self.abort(key, future, e)
+            raise
+        self.finish(key, future, columns)
+        return columns
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM segmentations")
+                self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "model_version": self.model_version,
+                "db_path": self.db_path,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._inflight),
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else None
+            }
+
+    def _is_fresh(self, created_at, now):
+        return self.ttl is None or now - created_at <= self.ttl
+
+    def _remember(self, text, columns, created_at):
+        self._entries[text] = (columns, created_at)
+        self._entries.move_to_end(text)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
@@ -1,7 +1,114 @@
-from modules.bunsetu.components.ginza import segment_bunsetu
+import asyncio
+import logging
+import os
+
+from modules.bunsetu.components.ginza import model_version, segment_bunsetu, segment_bunsetu_stream
+from modules.bunsetu.components.segmentation_cache import SegmentationCache, normalize_text
+
+logger = logging.getLogger(__name__)
+
+SEGMENTATION_CACHE_ENABLED = os.environ.get("BUNSETU_CACHE", "1") not in ("0", "false", "no")
+SEGMENTATION_CACHE_PATH = os.environ.get("BUNSETU_CACHE_PATH") or None
+SEGMENTATION_CACHE_MAX_ENTRIES = int(os.environ.get("BUNSETU_CACHE_MAX_ENTRIES", 10000))
+SEGMENTATION_CACHE_TTL = float(os.environ.get("BUNSETU_CACHE_TTL", 0))
+
+_segmentation_cache = None
+
+def get_segmentation_cache(nlp):
+    global _segmentation_cache
+
+    if not SEGMENTATION_CACHE_ENABLED:
+        return None
+
+    version = model_version(nlp)
+    if _segmentation_cache is not None and _segmentation_cache.model_version == version:
+        return _segmentation_cache
+    if _segmentation_cache is not None:
+        _segmentation_cache.close()
+
+    try:
+        cache = SegmentationCache(version, SEGMENTATION_CACHE_PATH, SEGMENTATION_CACHE_MAX_ENTRIES, SEGMENTATION_CACHE_TTL)
+    except Exception as e:
+        logger.warning(f"[Bunsetu] Segmentation cache at {SEGMENTATION_CACHE_PATH} unavailable, using memory only: {str(e)}")
+        cache = SegmentationCache(version, None, SEGMENTATION_CACHE_MAX_ENTRIES, SEGMENTATION_CACHE_TTL)
+
+    logger.info(f"[Bunsetu] Segmentation cache ready (model={version}, db={cache.db_path})")
+    _segmentation_cache = cache
+    return cache
+
+def get_segmentation_cache_stats():
+    return _segmentation_cache.stats() if _segmentation_cache is not None else None
 
 async def segment_bunsetu_service(text, request):
     nlp = getattr(request.app.state, "ginza_model", None)
     if nlp is None:
         raise Exception("Ginza model not loaded")
-    return await segment_bunsetu(text, nlp)
+
+    cache = get_segmentation_cache(nlp)
+    if cache is None:
+        return await segment_bunsetu(text, nlp)
+
+    # 正規化したテキストはキャッシュのキーにだけ使い、解析は元のテキストで行う
+    columns = await cache.get_or_segment(
+        normalize_text(text),
+        lambda: segment_bunsetu(text, nlp, as_columns=True)
+    )
+    return columns.to_list()
+
+async def segment_bunsetu_batch_service(texts, request, batch_size=None):
+    nlp = getattr(request.app.state, "ginza_model", None)
+    if nlp is None:
+        raise Exception("Ginza model not loaded")
+
+    cache = get_segmentation_cache(nlp)
+    if cache is None:
+        async for bunsetsu_list in segment_bunsetu_stream(texts, nlp, batch_size):
+            yield bunsetsu_list
+        return
+
+    keys = [normalize_text(text) for text in texts]
+    # key -> BunsetsuColumns、または実行中の解析の Future
+    results = {}
+    # このバッチが解析を受け持つ key -> (Future, 元のテキスト)
+    owned = {}
+    for text, key in zip(texts, keys):
+        if key in results or key in owned:
+            continue
+        future = cache.join(key)
+        if future is not None:
+            results[key] = future
+        else:
+            owned[key] = (cache.begin(key), text)
+
+    try:
+        owned_keys = list(owned)
+        for key, columns in zip(owned_keys, await cache.lookup(owned_keys)):
+            if columns is not None:
+                cache.finish(key, owned.pop(key)[0], columns)
+                results[key] = columns
+
+        # 未解析のテキストは重複を除いて初出順に 1 回だけ nlp.pipe に流す
+        missing = list(owned)
+        stream = segment_bunsetu_stream([owned[key][1] for key in missing], nlp, batch_size, as_columns=True)
+        computed = 0
+
+        for key in keys:
+            while key not in results:
+                columns = await stream.__anext__()
+                done_key = missing[computed]
+                await cache.store(done_key, columns)
+                cache.finish(done_key, owned.pop(done_key)[0], columns)
+                results[done_key] = columns
+                computed += 1
+            columns = results[key]
+            if isinstance(columns, asyncio.Future):
+                columns = results[key] = await asyncio.shield(columns)
+            yield columns.to_list()
+    except Exception as e:
+        for key, (future, _) in owned.items():
+            cache.abort(key, future, e)
+        raise
+    finally:
+        # 途中で打ち切られた場合も、待っている他のリクエストを残さない
+        for key, (future, _) in owned.items():
+            cache.abort(key, future)
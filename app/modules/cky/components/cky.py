@@ -1,5 +1,9 @@
+from array import array
+
+from .morph_store import BunsetsuList, get_morph_store
+
 def normalize_bunsetsu(bunsetsu_data):
-    bunsetsu_list = []
+    bunsetsu_list = BunsetsuList()
     for idx, item in enumerate(bunsetsu_data):
         morphs = item.get("bunsetu", [])
         text = "".join([m.get("text", "") for m in morphs])
@@ -24,51 +28,273 @@ def normalize_bunsetsu(bunsetsu_data):
         })
     return bunsetsu_list
 
-def build_cky_table(bunsetsu_list):
-    n = len(bunsetsu_list)
-    table = {}
+class CKYSplit:
+    __slots__ = ("chart", "i", "j", "k", "split_idx")
 
-    for i in range(n):
-        table[(i, i)] = {
-            "span": [i, i],
-            "text": bunsetsu_list[i]["text"],
-            "is_terminal": True,
-            "splits": []
+    BASE_FIELDS = ("k", "split_idx", "left", "right", "left_text", "right_text")
+    SCORED_FIELDS = BASE_FIELDS + ("pred", "confidence")
+
+    def __init__(self, chart, i, j, k, split_idx):
+        self.chart = chart
+        self.i = i
+        self.j = j
+        self.k = k
+        self.split_idx = split_idx
+
+    @property
+    def FIELDS(self):
+        return self.SCORED_FIELDS if self.is_scored else self.BASE_FIELDS
+
+    @property
+    def position(self):
+        return self.chart.split_position(self.i, self.j, self.split_idx)
+
+    @property
+    def is_scored(self):
+        return self.chart.preds is not None and self.chart.preds[self.position] >= 0
+
+    @property
+    def pred(self):
+        if not self.is_scored:
+            return None
+        return self.chart.preds[self.position]
+
+    @property
+    def confidence(self):
+        if not self.is_scored:
+            return None
+        return self.chart.confidences[self.position]
+
+    @property
+    def left(self):
+        return [self.i, self.k]
+
+    @property
+    def right(self):
+        return [self.k + 1, self.j]
+
+    @property
+    def left_text(self):
+        return self.chart.span_text(self.i, self.k)
+
+    @property
+    def right_text(self):
+        return self.chart.span_text(self.k + 1, self.j)
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self.FIELDS
+
+    def get(self, key, default=None):
+        if key not in self.FIELDS:
+            return default
+        return getattr(self, key)
+
+    def to_dict(self):
+        split = {
+            "k": self.k,
+            "split_idx": self.split_idx,
+            "left": self.left,
+            "right": self.right,
+            "left_text": self.left_text,
+            "right_text": self.right_text
+        }
+        if self.is_scored:
+            split["pred"] = self.pred
+            split["confidence"] = self.confidence
+        return split
+
+    copy = to_dict
+
+class CKYCell:
+    __slots__ = ("chart", "i", "j")
+
+    FIELDS = ("span", "text", "is_terminal", "splits")
+
+    def __init__(self, chart, i, j):
+        self.chart = chart
+        self.i = i
+        self.j = j
+
+    @property
+    def span(self):
+        return [self.i, self.j]
+
+    @property
+    def text(self):
+        return self.chart.span_text(self.i, self.j)
+
+    @property
+    def is_terminal(self):
+        return self.i == self.j
+
+    @property
+    def splits(self):
+        return self.chart.splits_for(self.i, self.j)
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self.FIELDS
+
+    def get(self, key, default=None):
+        if key not in self.FIELDS:
+            return default
+        return getattr(self, key)
+
+    def to_dict(self):
+        return {
+            "span": self.span,
+            "text": self.text,
+            "is_terminal": self.is_terminal,
+            "splits": [split.to_dict() for split in self.splits]
         }
 
-    for span_length in range(2, n + 1):
+    copy = to_dict
+
+class CKYChart:
+    __slots__ = ("n", "joined", "offsets", "split_offsets", "split_points", "cells", "preds", "confidences")
+
+    def __init__(self, texts):
+        n = len(texts)
+        self.n = n
+        self.joined = "".join(texts)
+
+        self.offsets = array("l", [0])
+        for text in texts:
+            self.offsets.append(self.offsets[-1] + len(text))
+
+        self.split_offsets = array("l", [0])
+        self.split_points = array("l")
+        self.cells = [None] * (n * n)
+        for i in range(n):
+            for j in range(n):
+                if j > i:
+                    self.split_points.extend(range(i, j))
+                self.split_offsets.append(len(self.split_points))
+                if j == i or (j > i and self.split_offsets[-1] > self.split_offsets[-2]):
+                    self.cells[i * n + j] = CKYCell(self, i, j)
+
+        self.preds = None
+        self.confidences = None
+
+    def span_text(self, i, j):
+        return self.joined[self.offsets[i]:self.offsets[j + 1]]
+
+    def split_points_for(self, i, j):
+        idx = i * self.n + j
+        return self.split_points[self.split_offsets[idx]:self.split_offsets[idx + 1]]
+
+    def splits_for(self, i, j):
+        return [CKYSplit(self, i, j, k, split_idx)
+                for split_idx, k in enumerate(self.split_points_for(i, j))]
+
+    def split_position(self, i, j, split_idx):
+        return self.split_offsets[i * self.n + j] + split_idx
+
+    def set_split_pred(self, i, j, split_idx, pred, confidence):
+        if self.preds is None:
+            self.preds = array("b", [-1]) * len(self.split_points)
+            self.confidences = array("d", [0.0]) * len(self.split_points)
+        position = self.split_position(i, j, split_idx)
+        self.preds[position] = pred
+        self.confidences[position] = confidence
+
+    def discard_cell(self, i, j):
+        if i != j:
+            self.cells[i * self.n + j] = None
+
+    def num_splits(self, i, j):
+        idx = i * self.n + j
+        return self.split_offsets[idx + 1] - self.split_offsets[idx]
+
+    def _cell(self, key):
+        try:
+            i, j = key
+        except (TypeError, ValueError):
+            return None
+        if not (0 <= i <= j < self.n):
+            return None
+        return self.cells[i * self.n + j]
+
+    def __contains__(self, key):
+        return self._cell(key) is not None
+
+    def __getitem__(self, key):
+        cell = self._cell(key)
+        if cell is None:
+            raise KeyError(key)
+        return cell
+
+    def get(self, key, default=None):
+        cell = self._cell(key)
+        return default if cell is None else cell
+
+    def keys(self):
+        n = self.n
+        for span_length in range(1, n + 1):
+            for i in range(n - span_length + 1):
+                j = i + span_length - 1
+                if self.cells[i * n + j] is not None:
+                    yield (i, j)
+
+    __iter__ = keys
+
+    def items(self):
+        for key in self.keys():
+            yield key, self.cells[key[0] * self.n + key[1]]
+
+    def values(self):
+        for _, cell in self.items():
+            yield cell
+
+    def __len__(self):
+        return sum(1 for cell in self.cells if cell is not None)
+
+    def to_dict(self):
+        return {key: cell.to_dict() for key, cell in self.items()}
+
+def build_cky_table(bunsetsu_list):
+    return CKYChart([b["text"] for b in bunsetsu_list])
+
+async def prune_cky_table(table, score_pairs):
+    n = table.n
+    if n < 2:
+        return table
+
+    reachable = {(0, n - 1)}
+    for span_length in range(n, 1, -1):
+        splits = []
         for i in range(n - span_length + 1):
             j = i + span_length - 1
+            if (i, j) in reachable and (i, j) in table:
+                splits.extend(table[(i, j)].splits)
+        if not splits:
+            continue
+
+        results = await score_pairs([
+            {"left": split.left_text, "right": split.right_text, "left_span": split.left, "right_span": split.right}
+            for split in splits
+        ])
+        for split, result in zip(splits, results):
+            pred = result.get("pred", 0)
+            table.set_split_pred(split.i, split.j, split.split_idx, pred, result.get("confidence", 0.0))
+            if pred != 0:
+                reachable.add(tuple(split.left))
+                reachable.add(tuple(split.right))
 
-            splits = []
-            split_idx = 0
-            for k in range(i, j):
-                left_span = (i, k)
-                right_span = (k + 1, j)
-
-                if left_span in table and right_span in table:
-                    left_cell = table[left_span]
-                    right_cell = table[right_span]
-
-                    splits.append({
-                        "k": k,
-                        "split_idx": split_idx,
-                        "left": [i, k],
-                        "right": [k + 1, j],
-                        "left_text": left_cell["text"],
-                        "right_text": right_cell["text"]
-                    })
-                    split_idx += 1
+    for i in range(n):
+        for j in range(i + 1, n):
+            if (i, j) not in reachable:
+                table.discard_cell(i, j)
 
-            if splits:
-                combined_text = "".join([bunsetsu_list[idx]["text"] for idx in range(i, j + 1)])
-                table[(i, j)] = {
-                    "span": [i, j],
-                    "text": combined_text,
-                    "is_terminal": False,
-                    "splits": splits
-                }
-    
     return table
 
 def organize_table_by_span(table, n):
@@ -97,7 +323,7 @@ def count_splits(table, n):
         for i in range(n - span_length + 1):
             j = i + span_length - 1
             if (i, j) in table:
-                num_splits = len(table[(i, j)].get("splits", []))
+                num_splits = table.num_splits(i, j)
                 splits_by_span[span_key] += num_splits
                 total_splits += num_splits
     
@@ -117,10 +343,13 @@ def build_cky_matrix(table, n):
 
 def build_combinations_list(table, n):
     combos = []
+    combo_spans = set()
+    visited = set()
 
     def traverse_and_add_tree_ids(table, i, j, n, path_prefix=""):
-        if (i, j) not in table:
+        if (i, j) not in table or (i, j) in visited:
             return
+        visited.add((i, j))
         
         cell = table[(i, j)]
 
@@ -146,6 +375,7 @@ def build_combinations_list(table, n):
             traverse_and_add_tree_ids(table, right_i, right_j, n, tree_id)
 
         if splits_with_ids:
+            combo_spans.add((i, j))
             combos.append({
                 "span": [i, j],
                 "text": cell.get("text", ""),
@@ -161,8 +391,7 @@ def build_combinations_list(table, n):
                 cell = table[(i, j)]
                 if not cell.get("is_terminal", False):
 
-                    existing = any(c["span"] == [i, j] for c in combos)
-                    if not existing:
+                    if (i, j) not in combo_spans:
 
                         splits_with_ids = []
                         for split_idx, split in enumerate(cell.get("splits", [])):
@@ -172,6 +401,7 @@ def build_combinations_list(table, n):
                             splits_with_ids.append(split_copy)
                         
                         if splits_with_ids:
+                            combo_spans.add((i, j))
                             combos.append({
                                 "span": [i, j],
                                 "text": cell.get("text", ""),
@@ -183,40 +413,23 @@ def build_combinations_list(table, n):
 def build_trees(table, n, bunsetsu_list=None):
     trees = {}
 
-    def compute_flat_sequence_for_span(i, j, bunsetsu_list):
-        flat_seq = []
-        if bunsetsu_list:
-            for idx in range(i, j + 1):
-                if idx < len(bunsetsu_list):
-                    bunsetsu = bunsetsu_list[idx]
-                    morphs = bunsetsu.get("morphs", [])
-                    types_list = bunsetsu.get("types", [])
-                    for morph_text, typ in zip(morphs, types_list):
-                        flat_seq.append({"type": typ, "text": morph_text})
-
-        for i_seq in range(1, len(flat_seq) - 1):
-            if (flat_seq[i_seq]["type"] == "func" and
-                flat_seq[i_seq-1]["type"] == "core" and
-                flat_seq[i_seq+1]["type"] == "core"):
-                flat_seq[i_seq]["type"] = "core"
-        
-        return flat_seq
+    subtree_cache = {}
+    morph_store = get_morph_store(bunsetsu_list)
 
     def build_subtree(i, j, chosen_split_idx=None):
+        key = (i, j, chosen_split_idx)
+        if key not in subtree_cache:
+            subtree_cache[key] = build_subtree_uncached(i, j, chosen_split_idx)
+        return subtree_cache[key]
+
+    def build_subtree_uncached(i, j, chosen_split_idx=None):
 
         if (i, j) not in table:
             return None
         cell = table[(i, j)]
 
-        types = []
-        if bunsetsu_list and i < len(bunsetsu_list) and j < len(bunsetsu_list):
-
-            for idx in range(i, j + 1):
-                if idx < len(bunsetsu_list):
-                    bunsetsu = bunsetsu_list[idx]
-                    types.extend(bunsetsu.get("types", []))
-
-        flat_seq = compute_flat_sequence_for_span(i, j, bunsetsu_list)
+        types = morph_store.types_for(i, j)
+        flat_seq = morph_store.flat_sequence(i, j)
         
         if cell.get("is_terminal", False):
             node = {
@@ -229,7 +442,8 @@ def build_trees(table, n, bunsetsu_list=None):
                 node["types"] = types
             return node
 
-        splits = cell.get("splits", [])
+        splits = [s for s in cell.get("splits", [])
+                  if tuple(s["left"]) in table and tuple(s["right"]) in table]
         chosen = None
         if chosen_split_idx is not None:
             for s in splits:
@@ -279,12 +493,8 @@ def build_trees(table, n, bunsetsu_list=None):
         if cell.get("is_terminal", False):
             leaf_id = f"leaf-{i}-{j}"
 
-            types = []
-            if bunsetsu_list and i < len(bunsetsu_list):
-                bunsetsu = bunsetsu_list[i]
-                types = bunsetsu.get("types", [])
-
-            flat_seq = compute_flat_sequence_for_span(i, j, bunsetsu_list)
+            types = morph_store.types_for(i, j)
+            flat_seq = morph_store.flat_sequence(i, j)
             
             leaf_node = {
                 "span": cell.get("span"),
@@ -303,24 +513,31 @@ def build_trees(table, n, bunsetsu_list=None):
                 left_node = build_subtree(*split.get("left"), None)
                 right_node = build_subtree(*split.get("right"), None)
 
-                combined_flat_seq = (left_node.get("flat_sequence", []) + 
-                                   right_node.get("flat_sequence", []))
+                if left_node is None or right_node is None:
+                    root_node = {
+                        "span": cell.get("span"),
+                        "text": cell.get("text"),
+                        "is_terminal": False,
+                        "split": split.copy(),
+                        "flat_sequence": morph_store.flat_sequence(i, j),
+                        "pred": split.get("pred"),
+                        "is_leaf_due_to_pred": True
+                    }
+                else:
+                    combined_flat_seq = (left_node.get("flat_sequence", []) + 
+                                       right_node.get("flat_sequence", []))
 
-                root_node = {
-                    "span": cell.get("span"),
-                    "text": cell.get("text"),
-                    "is_terminal": False,
-                    "split": split.copy(),
-                    "flat_sequence": combined_flat_seq,
-                    "children": [left_node, right_node],
-                    "pred": split.get("pred")
-                }
-
-                types = []
-                for idx in range(i, j + 1):
-                    if bunsetsu_list and idx < len(bunsetsu_list):
-                        bunsetsu = bunsetsu_list[idx]
-                        types.extend(bunsetsu.get("types", []))
+                    root_node = {
+                        "span": cell.get("span"),
+                        "text": cell.get("text"),
+                        "is_terminal": False,
+                        "split": split.copy(),
+                        "flat_sequence": combined_flat_seq,
+                        "children": [left_node, right_node],
+                        "pred": split.get("pred")
+                    }
+
+                types = morph_store.types_for(i, j)
                 if types:
                     root_node["types"] = types
                 
@@ -382,45 +599,62 @@ def get_color_for_pred(pred):
         return "gray"
     return "green" if pred == 1 else "red"
 
-def get_split_pred_from_combinations(combinations, span_i, span_j, split_idx=None):
-    for combo in combinations:
-        if combo.get("span") == [span_i, span_j]:
+class SplitIndex:
+    __slots__ = ("by_span", "by_tree_id")
+
+    def __init__(self, combinations):
+        self.by_span = {}
+        self.by_tree_id = {}
+        for combo in combinations:
             splits = combo.get("splits", [])
-            if split_idx is not None:
+            if not splits:
+                continue
+            self.by_span.setdefault(tuple(combo.get("span", [])), splits)
+            for split in splits:
+                tree_id = split.get("tree_id")
+                if tree_id is not None:
+                    self.by_tree_id.setdefault(tree_id, (split, combo))
 
-                if split_idx < len(splits):
-                    split = splits[split_idx]
-                    return {
-                        "pred": split.get("pred", 0),
-                        "confidence": split.get("confidence", 0.0)
-                    }
-            else:
+    def splits_for(self, span_i, span_j):
+        return self.by_span.get((span_i, span_j), [])
 
-                if splits:
-                    split = splits[0]
-                    return {
-                        "pred": split.get("pred", 0),
-                        "confidence": split.get("confidence", 0.0)
-                    }
+    def find_tree_id(self, tree_id):
+        return self.by_tree_id.get(tree_id, (None, None))
+
+def get_split_pred_from_combinations(combinations, span_i, span_j, split_idx=None, split_index=None):
+    if split_index is None:
+        split_index = SplitIndex(combinations)
+
+    splits = split_index.splits_for(span_i, span_j)
+    if split_idx is not None:
+
+        if split_idx < len(splits):
+            split = splits[split_idx]
+            return {
+                "pred": split.get("pred", 0),
+                "confidence": split.get("confidence", 0.0)
+            }
+    else:
+
+        if splits:
+            split = splits[0]
+            return {
+                "pred": split.get("pred", 0),
+                "confidence": split.get("confidence", 0.0)
+            }
     return None
 
-def expand_tree_from_cell(table, combinations, cell_i, cell_j, bunsetsu_list=None, pred_threshold=1):
-    
-    def get_types_for_span(i, j, bunsetsu_list):
-        types = []
-        if bunsetsu_list:
-            for idx in range(i, j + 1):
-                if idx < len(bunsetsu_list):
-                    bunsetsu = bunsetsu_list[idx]
-                    types.extend(bunsetsu.get("types", []))
-        return types
+def expand_tree_from_cell(table, combinations, cell_i, cell_j, bunsetsu_list=None, pred_threshold=1, split_index=None):
+    if split_index is None:
+        split_index = SplitIndex(combinations)
+    morph_store = get_morph_store(bunsetsu_list)
     
     def expand_node(i, j, parent_pred=None):
         if (i, j) not in table:
             return None
         
         cell = table[(i, j)]
-        types = get_types_for_span(i, j, bunsetsu_list)
+        types = morph_store.types_for(i, j)
 
         if cell.get("is_terminal", False):
             return {
@@ -460,7 +694,8 @@ def expand_tree_from_cell(table, combinations, cell_i, cell_j, bunsetsu_list=Non
         target_split = splits[0]
         split_info = get_split_pred_from_combinations(
             combinations, i, j, 
-            split_idx=target_split.get("split_idx")
+            split_idx=target_split.get("split_idx"),
+            split_index=split_index
         )
         
         if split_info is not None:
@@ -512,7 +747,7 @@ def expand_tree_from_cell(table, combinations, cell_i, cell_j, bunsetsu_list=Non
     
     cell = table[(cell_i, cell_j)]
     cell_text = cell.get("text", "")
-    types = get_types_for_span(cell_i, cell_j, bunsetsu_list)
+    types = morph_store.types_for(cell_i, cell_j)
 
     if cell.get("is_terminal", False):
         return {
@@ -531,7 +766,8 @@ def expand_tree_from_cell(table, combinations, cell_i, cell_j, bunsetsu_list=Non
 
         split_info = get_split_pred_from_combinations(
             combinations, cell_i, cell_j, 
-            split_idx=split.get("split_idx")
+            split_idx=split.get("split_idx"),
+            split_index=split_index
         )
         
         if split_info is not None:
@@ -589,147 +825,219 @@ def expand_tree_from_cell(table, combinations, cell_i, cell_j, bunsetsu_list=Non
         "all_patterns": all_patterns
     }
 
-def enumerate_all_trees_from_cell(table, combinations, cell_i, cell_j, bunsetsu_list=None):
-    
-    def get_types_for_span(i, j, bunsetsu_list):
-        types = []
-        if bunsetsu_list:
-            for idx in range(i, j + 1):
-                if idx < len(bunsetsu_list):
-                    bunsetsu = bunsetsu_list[idx]
-                    types.extend(bunsetsu.get("types", []))
-        return types
-    
-    def compute_flat_sequence_for_span(i, j, bunsetsu_list):
-        flat_seq = []
-        if bunsetsu_list:
-            for idx in range(i, j + 1):
-                if idx < len(bunsetsu_list):
-                    bunsetsu = bunsetsu_list[idx]
-                    morphs = bunsetsu.get("morphs", [])
-                    types_list = bunsetsu.get("types", [])
-                    for morph_text, typ in zip(morphs, types_list):
-                        flat_seq.append({"type": typ, "text": morph_text})
-
-        for i_seq in range(1, len(flat_seq) - 1):
-            if (flat_seq[i_seq]["type"] == "func" and
-                flat_seq[i_seq-1]["type"] == "core" and
-                flat_seq[i_seq+1]["type"] == "core"):
-                flat_seq[i_seq]["type"] = "core"
-        
-        return flat_seq
-    
-    def build_all_subtrees(i, j, depth=0):
-        if (i, j) not in table:
-            return []
+def lookup_split_pred(span_to_splits, span_i, span_j, split):
+    combo_splits = span_to_splits.get((span_i, span_j), [])
+    split_idx = split.get("split_idx")
+    if split_idx is None and combo_splits:
+        combo_split = combo_splits[0]
+    elif split_idx is not None and split_idx < len(combo_splits):
+        combo_split = combo_splits[split_idx]
+    else:
+        return split.get("pred", 0), split.get("confidence", 0.0)
+    return combo_split.get("pred", 0), combo_split.get("confidence", 0.0)
+
+def get_types_for_span(i, j, bunsetsu_list):
+    return get_morph_store(bunsetsu_list).types_for(i, j)
+
+def get_pos_tags_for_span(i, j, bunsetsu_list):
+    return get_morph_store(bunsetsu_list).pos_tags_for(i, j)
+
+def compute_flat_sequence_for_span(i, j, bunsetsu_list):
+    return get_morph_store(bunsetsu_list).flat_sequence(i, j)
+
+class SubtreeStore:
+    __slots__ = ("table", "bunsetsu_list", "morph_store", "span_to_splits", "tree_counts",
+                 "split_plans", "nodes", "children", "span_types", "leaf_sequences")
+
+    def __init__(self, table, combinations, bunsetsu_list=None, tree_counts=None, n=None, split_index=None):
+        if split_index is None:
+            split_index = SplitIndex(combinations)
+        if tree_counts is None:
+            tree_counts = count_trees_by_cell(table, combinations, n if n is not None else len(bunsetsu_list or []), split_index)
+        self.table = table
+        self.bunsetsu_list = bunsetsu_list
+        self.morph_store = get_morph_store(bunsetsu_list)
+        self.span_to_splits = split_index.by_span
+        self.tree_counts = tree_counts
+        self.split_plans = {}
+        self.nodes = {}
+        self.children = {}
+        self.span_types = {}
+        self.leaf_sequences = {}
+
+    @staticmethod
+    def node_id(key):
+        return "{}-{}-{}".format(*key)
+
+    def count(self, i, j):
+        return self.tree_counts.get((i, j), {}).get("total", 0)
+
+    def types_for(self, i, j):
+        if (i, j) not in self.span_types:
+            self.span_types[(i, j)] = self.morph_store.types_for(i, j)
+        return self.span_types[(i, j)]
+
+    def leaf_sequence_for(self, i, j):
+        if (i, j) not in self.leaf_sequences:
+            self.leaf_sequences[(i, j)] = self.morph_store.flat_sequence(i, j)
+        return self.leaf_sequences[(i, j)]
+
+    def split_plan(self, i, j):
+        if (i, j) not in self.split_plans:
+            plan = []
+            for split in self.table[(i, j)].get("splits", []):
+                pred, confidence = lookup_split_pred(self.span_to_splits, i, j, split)
+                if pred == 0:
+                    size = 1
+                else:
+                    size = self.count(*split.get("right")) * self.count(*split.get("left"))
+                plan.append((split, pred, confidence, size))
+            self.split_plans[(i, j)] = plan
+        return self.split_plans[(i, j)]
+
+    def node(self, i, j, rank, cache=True):
+        key = (i, j, rank)
+        if key in self.nodes:
+            return self.nodes[key]
+
+        node, children = self._build_node(i, j, rank)
+        if node is not None and cache:
+            self.nodes[key] = node
+            self.children[key] = children
+        return node
+
+    def _build_node(self, i, j, rank):
+        if (i, j) not in self.table:
+            return None, None
         
-        cell = table[(i, j)]
-        types = get_types_for_span(i, j, bunsetsu_list)
-        flat_seq = compute_flat_sequence_for_span(i, j, bunsetsu_list)
+        cell = self.table[(i, j)]
+        types = self.types_for(i, j)
 
         if cell.get("is_terminal", False):
-            return [{
+            if rank != 0:
+                return None, None
+            return {
                 "span": [i, j],
                 "text": cell.get("text", ""),
                 "types": types,
-                "flat_sequence": flat_seq,
+                "flat_sequence": self.leaf_sequence_for(i, j),
                 "is_terminal": True,
                 "pred": None,
                 "color": "gray",
                 "confidence": None
-            }]
-
-        splits = cell.get("splits", [])
-        all_trees = []
-        
-        for split_idx, split in enumerate(splits):
-            left_i, left_j = split.get("left")
-            right_i, right_j = split.get("right")
-
-            split_info = get_split_pred_from_combinations(
-                combinations, i, j,
-                split_idx=split.get("split_idx")
-            )
-            
-            if split_info is not None:
-                pred = split_info["pred"]
-                confidence = split_info["confidence"]
-            else:
-                pred = split.get("pred", 0)
-                confidence = split.get("confidence", 0.0)
+            }, None
+
+        found = False
+        for split, pred, confidence, size in self.split_plan(i, j):
+            if size:
+                found = True
+            if rank >= size:
+                rank -= size
+                continue
 
             if pred == 0:
-                tree = {
+                return {
                     "span": [i, j],
                     "text": cell.get("text", ""),
                     "types": types,
-                    "flat_sequence": flat_seq,
+                    "flat_sequence": self.leaf_sequence_for(i, j),
                     "is_terminal": False,
                     "pred": pred,
                     "color": get_color_for_pred(pred),
                     "confidence": confidence,
                     "is_leaf_due_to_pred": True
-                }
-                all_trees.append(tree)
-                continue
+                }, None
 
-            left_trees = build_all_subtrees(left_i, left_j, depth + 1)
-            right_trees = build_all_subtrees(right_i, right_j, depth + 1)
+            left_i, left_j = split.get("left")
+            right_i, right_j = split.get("right")
+            left_rank, right_rank = divmod(rank, self.count(right_i, right_j))
+            left_tree = self.node(left_i, left_j, left_rank)
+            right_tree = self.node(right_i, right_j, right_rank)
 
-            for left_tree in left_trees:
-                for right_tree in right_trees:
+            return {
+                "span": [i, j],
+                "text": cell.get("text", ""),
+                "types": types,
+                "flat_sequence": left_tree.get("flat_sequence", []) + right_tree.get("flat_sequence", []),
+                "is_terminal": False,
+                "pred": pred,
+                "color": get_color_for_pred(pred),
+                "confidence": confidence,
+                "children": [left_tree, right_tree]
+            }, ((left_i, left_j, left_rank), (right_i, right_j, right_rank))
 
-                    combined_flat_seq = (left_tree.get("flat_sequence", []) + 
-                                        right_tree.get("flat_sequence", []))
-                    
-                    tree = {
-                        "span": [i, j],
-                        "text": cell.get("text", ""),
-                        "types": types,
-                        "flat_sequence": combined_flat_seq,
-                        "is_terminal": False,
-                        "pred": pred,
-                        "color": get_color_for_pred(pred),
-                        "confidence": confidence,
-                        "children": [left_tree, right_tree]
-                    }
-                    all_trees.append(tree)
-        
-        return all_trees if all_trees else [{
+        if found or rank != 0:
+            return None, None
+        return {
             "span": [i, j],
             "text": cell.get("text", ""),
             "types": types,
-            "flat_sequence": flat_seq,
+            "flat_sequence": self.leaf_sequence_for(i, j),
             "is_terminal": False,
             "pred": None,
             "color": "gray",
             "confidence": None
-        }]
+        }, None
 
-    if (cell_i, cell_j) not in table:
-        return {
-            "status": "error",
-            "message": f"Cell ({cell_i}, {cell_j}) not found"
-        }
-    
-    cell = table[(cell_i, cell_j)]
-    cell_text = cell.get("text", "")
-    types = get_types_for_span(cell_i, cell_j, bunsetsu_list)
-    
-    if cell.get("is_terminal", False):
-        return {
-            "status": "success",
-            "cell": [cell_i, cell_j],
-            "cell_text": cell_text,
-            "cell_types": types,
-            "is_terminal": True,
-            "tree_list": []
-        }
+    def dag_nodes(self, root_keys, emitted=None):
+        if emitted is None:
+            emitted = set()
+
+        dag = {}
+        stack = list(root_keys)
+        while stack:
+            key = stack.pop()
+            if key in emitted or key not in self.nodes:
+                continue
+            emitted.add(key)
+
+            node = dict(self.nodes[key])
+            children = self.children.get(key)
+            if children:
+                node.pop("flat_sequence", None)
+                node["children"] = [self.node_id(child) for child in children]
+                stack.extend(children)
+            dag[self.node_id(key)] = node
+
+        return dag
+
+def expand_dag_tree(nodes, node_id):
+    node = dict(nodes[node_id])
+    if "children" in node:
+        children = [expand_dag_tree(nodes, child_id) for child_id in node["children"]]
+        node["children"] = children
+        node["flat_sequence"] = children[0].get("flat_sequence", []) + children[1].get("flat_sequence", [])
+    return node
+
+def iter_trees_from_cell(table, combinations, cell_i, cell_j, bunsetsu_list=None, start=0, tree_counts=None, store=None, cache_roots=False, split_index=None):
+    if store is None:
+        store = SubtreeStore(table, combinations, bunsetsu_list, tree_counts, cell_j + 1, split_index)
+
+    for rank in range(start, store.count(cell_i, cell_j)):
+        tree = store.node(cell_i, cell_j, rank, cache=cache_roots)
+        if tree is None:
+            return
+        yield tree
+
+def unrank_tree_from_cell(table, combinations, cell_i, cell_j, rank, bunsetsu_list=None, tree_counts=None, split_index=None):
+    return next(iter_trees_from_cell(
+        table, combinations, cell_i, cell_j, bunsetsu_list, start=rank, tree_counts=tree_counts,
+        split_index=split_index
+    ), None)
 
-    all_trees = build_all_subtrees(cell_i, cell_j)
+def iter_tree_list_from_cell(table, combinations, cell_i, cell_j, bunsetsu_list=None, offset=0, limit=None, tree_counts=None, store=None, output_format="tree", split_index=None):
+    if store is None:
+        store = SubtreeStore(table, combinations, bunsetsu_list, tree_counts, cell_j + 1, split_index)
+    dag_emitted = set()
 
-    tree_list = []
-    for idx, tree in enumerate(all_trees):
+    trees = iter_trees_from_cell(
+        table, combinations, cell_i, cell_j, bunsetsu_list,
+        start=offset, store=store, cache_roots=(output_format == "dag")
+    )
+
+    for idx, tree in enumerate(trees, start=offset):
+        if limit is not None and idx >= offset + limit:
+            break
 
         left_text = ""
         right_text = ""
@@ -743,26 +1051,110 @@ def enumerate_all_trees_from_cell(table, combinations, cell_i, cell_j, bunsetsu_
                 left_text = "".join([bunsetsu_list[i].get("text", "") for i in range(left_span[0], left_span[1] + 1) if i < len(bunsetsu_list)])
                 right_text = "".join([bunsetsu_list[i].get("text", "") for i in range(right_span[0], right_span[1] + 1) if i < len(bunsetsu_list)])
 
-        root_pred = tree.get("pred")
-        
-        tree_list.append({
+        item = {
             "tree_id": f"tree_{idx}",
             "tree": tree,
             "tree_number": idx + 1,
             "left_split": left_text,
             "right_split": right_text,
-            "root_pred": root_pred
-        })
+            "root_pred": tree.get("pred")
+        }
+
+        if output_format == "dag":
+            root_key = (cell_i, cell_j, idx)
+            item["tree"] = store.node_id(root_key)
+            item["nodes"] = store.dag_nodes([root_key], dag_emitted)
+
+        yield item
+
+def describe_cell(table, combinations, cell_i, cell_j, bunsetsu_list=None, tree_counts=None, split_index=None):
+    if (cell_i, cell_j) not in table:
+        return {
+            "status": "error",
+            "message": f"Cell ({cell_i}, {cell_j}) not found"
+        }
     
+    cell = table[(cell_i, cell_j)]
+    is_terminal = cell.get("is_terminal", False)
+    if tree_counts is None and not is_terminal:
+        tree_counts = count_trees_by_cell(table, combinations, cell_j + 1, split_index)
+
     return {
         "status": "success",
         "cell": [cell_i, cell_j],
-        "cell_text": cell_text,
-        "cell_types": types,
-        "is_terminal": False,
-        "tree_list": tree_list
+        "cell_text": cell.get("text", ""),
+        "cell_types": get_types_for_span(cell_i, cell_j, bunsetsu_list),
+        "is_terminal": is_terminal,
+        "total_trees": 0 if is_terminal else tree_counts.get((cell_i, cell_j), {}).get("total", 0)
     }
 
+def enumerate_all_trees_from_cell(table, combinations, cell_i, cell_j, bunsetsu_list=None, offset=0, limit=None, tree_counts=None, output_format="tree", split_index=None):
+    if split_index is None:
+        split_index = SplitIndex(combinations)
+    if (cell_i, cell_j) in table and not table[(cell_i, cell_j)].get("is_terminal", False) and tree_counts is None:
+        tree_counts = count_trees_by_cell(table, combinations, cell_j + 1, split_index)
+
+    result = describe_cell(table, combinations, cell_i, cell_j, bunsetsu_list, tree_counts)
+    if result["status"] != "success":
+        return result
+
+    if result["is_terminal"]:
+        result["tree_list"] = []
+    else:
+        result["tree_list"] = list(iter_tree_list_from_cell(
+            table, combinations, cell_i, cell_j, bunsetsu_list, offset, limit, tree_counts,
+            output_format=output_format, split_index=split_index
+        ))
+    result["offset"] = offset
+    result["limit"] = limit
+
+    if output_format == "dag":
+        result["format"] = "dag"
+        result["nodes"] = {}
+        for item in result["tree_list"]:
+            result["nodes"].update(item.pop("nodes", {}))
+
+    return result
+
+def count_trees_by_cell(table, combinations, n, split_index=None):
+    if split_index is None:
+        split_index = SplitIndex(combinations)
+    span_to_splits = split_index.by_span
+
+    counts = {}
+    for span_length in range(1, n + 1):
+        for i in range(n - span_length + 1):
+            j = i + span_length - 1
+            if (i, j) not in table:
+                continue
+
+            cell = table[(i, j)]
+            if cell.get("is_terminal", False):
+                counts[(i, j)] = {"total": 1, "pred1": 0, "pred0": 0}
+                continue
+
+            total = 0
+            pred1 = 0
+            pred0 = 0
+            for split in cell.get("splits", []):
+                pred, _ = lookup_split_pred(span_to_splits, i, j, split)
+
+                if pred == 0:
+                    total += 1
+                    pred0 += 1
+                    continue
+
+                left_count = counts.get(tuple(split.get("left")), {}).get("total", 0)
+                right_count = counts.get(tuple(split.get("right")), {}).get("total", 0)
+                trees = left_count * right_count
+                total += trees
+                if pred == 1:
+                    pred1 += trees
+
+            counts[(i, j)] = {"total": total or 1, "pred1": pred1, "pred0": pred0}
+
+    return counts
+
 def collect_all_split_patterns(table, combinations, node, bunsetsu_list=None, pred_threshold=1, path=""):
     
     patterns = []
@@ -825,36 +1217,14 @@ def collect_all_split_patterns(table, combinations, node, bunsetsu_list=None, pr
     
     return patterns
 
-def expand_tree_by_pred(table, combinations, tree_id, bunsetsu_list=None, pred_threshold=1):
+def expand_tree_by_pred(table, combinations, tree_id, bunsetsu_list=None, pred_threshold=1, split_index=None):
+    if split_index is None:
+        split_index = SplitIndex(combinations)
     
+    morph_store = get_morph_store(bunsetsu_list)
+
     def find_split_by_tree_id(table, combinations, tree_id):
-        for combo in combinations:
-            for split in combo.get("splits", []):
-                if split.get("tree_id") == tree_id:
-                    return split, combo
-        return None, None
-    
-    def get_types_for_span(i, j, bunsetsu_list):
-        types = []
-        if bunsetsu_list:
-            for idx in range(i, j + 1):
-                if idx < len(bunsetsu_list):
-                    bunsetsu = bunsetsu_list[idx]
-                    types.extend(bunsetsu.get("types", []))
-        return types
-    
-    def get_pos_tags_for_span(i, j, bunsetsu_list):
-        pos_tags = []
-        stem_types = []
-        tags = []
-        if bunsetsu_list:
-            for idx in range(i, j + 1):
-                if idx < len(bunsetsu_list):
-                    bunsetsu = bunsetsu_list[idx]
-                    pos_tags.extend(bunsetsu.get("pos_tags", []))
-                    stem_types.extend(bunsetsu.get("stem_types", []))
-                    tags.extend(bunsetsu.get("tags", []))
-        return pos_tags, stem_types, tags
+        return split_index.find_tree_id(tree_id)
 
     root_split, root_combo = find_split_by_tree_id(table, combinations, tree_id)
     if root_split is None:
@@ -878,35 +1248,14 @@ def expand_tree_by_pred(table, combinations, tree_id, bunsetsu_list=None, pred_t
             return None
         
         cell = table[(i, j)]
-        types = get_types_for_span(i, j, bunsetsu_list)
-        pos_tags, stem_types, tags = get_pos_tags_for_span(i, j, bunsetsu_list)
+        types = morph_store.types_for(i, j)
+        pos_tags, stem_types, tags = morph_store.pos_tags_for(i, j)
 
         if cell.get("is_terminal", False):
             leaf_spans.append([i, j])
 
-            leaf_types = get_types_for_span(i, j, bunsetsu_list)
-
-            terminal_flat_sequence = []
-
-            if cell.get("morphs"):
-                for morph_text, typ in zip(cell.get("morphs", []), leaf_types):
-                    terminal_flat_sequence.append({
-                        "type": typ,
-                        "text": morph_text
-                    })
-
-            elif bunsetsu_list:
-                for k in range(i, j + 1):
-                    if k < len(bunsetsu_list):
-                        bunsetsu = bunsetsu_list[k]
-                        morphs = bunsetsu.get("morphs", [])
-
-                        morphs_types = bunsetsu.get("types", [])
-                        for morph_text, typ in zip(morphs, morphs_types):
-                            terminal_flat_sequence.append({
-                                "type": typ,
-                                "text": morph_text
-                            })
+            leaf_types = morph_store.types_for(i, j)
+            terminal_flat_sequence = morph_store.flat_sequence(i, j, promote=False)
             
             return {
                 "span": [i, j],
@@ -926,21 +1275,8 @@ def expand_tree_by_pred(table, combinations, tree_id, bunsetsu_list=None, pred_t
 
             leaf_spans.append([i, j])
 
-            leaf_types = get_types_for_span(i, j, bunsetsu_list)
-
-            leaf_flat_sequence = []
-            if bunsetsu_list:
-                for k in range(i, j + 1):
-                    if k < len(bunsetsu_list):
-                        bunsetsu = bunsetsu_list[k]
-                        morphs = bunsetsu.get("morphs", [])
-
-                        morphs_types = bunsetsu.get("types", [])
-                        for morph_text, typ in zip(morphs, morphs_types):
-                            leaf_flat_sequence.append({
-                                "type": typ,
-                                "text": morph_text
-                            })
+            leaf_types = morph_store.types_for(i, j)
+            leaf_flat_sequence = morph_store.flat_sequence(i, j, promote=False)
             
             return {
                 "span": [i, j],
@@ -970,21 +1306,8 @@ def expand_tree_by_pred(table, combinations, tree_id, bunsetsu_list=None, pred_t
 
             leaf_spans.append([i, j])
 
-            leaf_types = get_types_for_span(i, j, bunsetsu_list)
-
-            leaf_flat_sequence = []
-            if bunsetsu_list:
-                for k in range(i, j + 1):
-                    if k < len(bunsetsu_list):
-                        bunsetsu = bunsetsu_list[k]
-                        morphs = bunsetsu.get("morphs", [])
-
-                        morphs_types = bunsetsu.get("types", [])
-                        for morph_text, typ in zip(morphs, morphs_types):
-                            leaf_flat_sequence.append({
-                                "type": typ,
-                                "text": morph_text
-                            })
+            leaf_types = morph_store.types_for(i, j)
+            leaf_flat_sequence = morph_store.flat_sequence(i, j, promote=False)
             
             return {
                 "span": [i, j],
@@ -1002,7 +1325,8 @@ def expand_tree_by_pred(table, combinations, tree_id, bunsetsu_list=None, pred_t
 
         split_info = get_split_pred_from_combinations(
             combinations, i, j, 
-            split_idx=target_split.get("split_idx")
+            split_idx=target_split.get("split_idx"),
+            split_index=split_index
         )
         
         if split_info is not None:
@@ -1044,26 +1368,7 @@ def expand_tree_by_pred(table, combinations, tree_id, bunsetsu_list=None, pred_t
 
             leaf_spans.append([i, j])
 
-            leaf_flat_sequence = []
-
-            if cell.get("morphs"):
-                for morph_text, typ in zip(cell.get("morphs", []), types):
-                    leaf_flat_sequence.append({
-                        "type": typ,
-                        "text": morph_text
-                    })
-
-            elif bunsetsu_list:
-                for k in range(i, j + 1):
-                    if k < len(bunsetsu_list):
-                        bunsetsu = bunsetsu_list[k]
-                        morphs = bunsetsu.get("morphs", [])
-                        morphs_types = bunsetsu.get("types", [])
-                        for morph_text, typ in zip(morphs, morphs_types):
-                            leaf_flat_sequence.append({
-                                "type": typ,
-                                "text": morph_text
-                            })
+            leaf_flat_sequence = morph_store.flat_sequence(i, j, promote=False)
             
             return {
                 "span": [i, j],
@@ -1146,7 +1451,7 @@ def expand_tree_by_pred(table, combinations, tree_id, bunsetsu_list=None, pred_t
         }
     }
 
-async def process_cky(bunsetsu_data):
+async def process_cky(bunsetsu_data, score_pairs=None):
     try:
 
         bunsetsu_list = normalize_bunsetsu(bunsetsu_data)
@@ -1159,24 +1464,32 @@ async def process_cky(bunsetsu_data):
             }
 
         table = build_cky_table(bunsetsu_list)
+        if score_pairs is not None:
+            await prune_cky_table(table, score_pairs)
 
-        organized_table = organize_table_by_span(table, n)
+        cells = table.to_dict()
+        organized_table = organize_table_by_span(cells, n)
 
-        cky_matrix = build_cky_matrix(table, n)
+        cky_matrix = build_cky_matrix(cells, n)
         combinations = build_combinations_list(table, n)
+        split_index = SplitIndex(combinations)
 
         tree_index = build_tree_structures(table, n, combinations)
 
         tree_nodes = build_trees(table, n, bunsetsu_list)
 
         stats = count_splits(table, n)
+        if score_pairs is not None:
+            stats["pruned"] = True
 
         return {
             "status": "success",
             "bunsetsu": bunsetsu_list,
+            "chart": table,
             "cky_table": organized_table,
             "cky_matrix": cky_matrix,
             "combinations": combinations,
+            "split_index": split_index,
             "trees": tree_index,
             "tree_nodes": tree_nodes,
             "summary": {
@@ -0,0 +1,95 @@
+import json
+import os
+from types import SimpleNamespace
+
+import torch
+
+VARIANTS = ("fp32", "int8", "torchscript", "onnx")
+INPUT_ORDER = ("input_ids", "attention_mask", "token_type_ids")
+VARIANT_FILES = {
+    "int8": "model.pt",
+    "torchscript": "model.pt",
+    "onnx": "model.onnx"
+}
+
+class TracedSequenceClassifier:
+    def __init__(self, module, input_names):
+        self.module = module
+        self.input_names = input_names
+
+    def eval(self):
+        self.module.eval()
+        return self
+
+    def __call__(self, **inputs):
+        outputs = self.module(*[inputs[name] for name in self.input_names])
+        return SimpleNamespace(logits=outputs[0])
+
+class OnnxSequenceClassifier:
+    def __init__(self, session, input_names):
+        self.session = session
+        self.input_names = input_names
+
+    def eval(self):
+        return self
+
+    def __call__(self, **inputs):
+        feeds = {name: inputs[name].cpu().numpy() for name in self.input_names}
+        logits = self.session.run(["logits"], feeds)[0]
+        return SimpleNamespace(logits=torch.from_numpy(logits))
+
+def variant_dir(variants_dir, variant):
+    return os.path.join(variants_dir, variant)
+
+def model_input_names(encoded):
+    return [name for name in INPUT_ORDER if name in encoded]
+
+def quantize_int8(model):
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+def write_variant_meta(path, variant, input_names):
+    with open(os.path.join(path, "variant.json"), "w", encoding="utf-8") as f:
+        json.dump({"variant": variant, "input_names": input_names}, f, ensure_ascii=False, indent=2)
+
+def read_variant_meta(path):
+    with open(os.path.join(path, "variant.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def export_traced(model, example_inputs, input_names, path, variant):
+    os.makedirs(path, exist_ok=True)
+    with torch.no_grad():
+        traced = torch.jit.trace(model, tuple(example_inputs[name] for name in input_names), strict=False)
+    torch.jit.save(traced, os.path.join(path, VARIANT_FILES[variant]))
+    write_variant_meta(path, variant, input_names)
+
+def export_onnx(model, example_inputs, input_names, path):
+    os.makedirs(path, exist_ok=True)
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["logits"] = {0: "batch"}
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(example_inputs[name] for name in input_names),
+            os.path.join(path, VARIANT_FILES["onnx"]),
+            input_names=input_names,
+            output_names=["logits"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14
+        )
+    write_variant_meta(path, "onnx", input_names)
+
+def load_variant(variant, variants_dir):
+    path = variant_dir(variants_dir, variant)
+    meta = read_variant_meta(path)
+    model_file = os.path.join(path, VARIANT_FILES[variant])
+
+    if variant == "onnx":
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        threads = os.environ.get("DEP_TORCH_NUM_THREADS")
+        if threads:
+            options.intra_op_num_threads = int(threads)
+        session = onnxruntime.InferenceSession(model_file, options, providers=["CPUExecutionProvider"])
+        return OnnxSequenceClassifier(session, meta["input_names"])
+
+    return TracedSequenceClassifier(torch.jit.load(model_file), meta["input_names"]).eval()
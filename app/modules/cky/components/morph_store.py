@@ -0,0 +1,75 @@
+from array import array
+
+class MorphStore:
+    __slots__ = ("n", "offsets", "texts", "types", "pos_tags", "tags", "stem_types", "between_core")
+
+    def __init__(self, bunsetsu_list):
+        self.n = len(bunsetsu_list)
+        self.offsets = array("l", [0])
+        self.texts = []
+        self.types = []
+        self.pos_tags = []
+        self.tags = []
+        self.stem_types = []
+
+        for bunsetsu in bunsetsu_list:
+            morphs = bunsetsu.get("morphs", [])
+            types = bunsetsu.get("types", [])
+            pos_tags = bunsetsu.get("pos_tags", [])
+            tags = bunsetsu.get("tags", [])
+            stem_types = bunsetsu.get("stem_types", [])
+            for idx, morph_text in enumerate(morphs):
+                self.texts.append(morph_text)
+                self.types.append(types[idx] if idx < len(types) else "core")
+                self.pos_tags.append(pos_tags[idx] if idx < len(pos_tags) else "UNK")
+                self.tags.append(tags[idx] if idx < len(tags) else "UNK")
+                self.stem_types.append(stem_types[idx] if idx < len(stem_types) else None)
+            self.offsets.append(len(self.texts))
+
+        # core に挟まれた func（span の両端以外なら core に昇格する）
+        self.between_core = bytearray(len(self.types))
+        for p in range(1, len(self.types) - 1):
+            if self.types[p] == "func" and self.types[p - 1] == "core" and self.types[p + 1] == "core":
+                self.between_core[p] = 1
+
+    def span_range(self, i, j):
+        return self.offsets[min(i, self.n)], self.offsets[min(j + 1, self.n)]
+
+    def types_for(self, i, j):
+        start, end = self.span_range(i, j)
+        return self.types[start:end]
+
+    def pos_tags_for(self, i, j):
+        start, end = self.span_range(i, j)
+        return self.pos_tags[start:end], self.stem_types[start:end], self.tags[start:end]
+
+    def flat_sequence(self, i, j, promote=True):
+        start, end = self.span_range(i, j)
+        types = self.types
+        texts = self.texts
+        between_core = self.between_core
+        flat_seq = []
+        for p in range(start, end):
+            typ = types[p]
+            if promote and between_core[p] and start < p < end - 1:
+                typ = "core"
+            flat_seq.append({"type": typ, "text": texts[p]})
+        return flat_seq
+
+class BunsetsuList(list):
+    __slots__ = ("_morph_store",)
+
+    def __init__(self, items=()):
+        super().__init__(items)
+        self._morph_store = None
+
+    @property
+    def morph_store(self):
+        if self._morph_store is None:
+            self._morph_store = MorphStore(self)
+        return self._morph_store
+
+def get_morph_store(bunsetsu_list):
+    if isinstance(bunsetsu_list, BunsetsuList):
+        return bunsetsu_list.morph_store
+    return MorphStore(bunsetsu_list or [])
@@ -0,0 +1,156 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+# 1 件あたりの概算バイト数（n=12〜20 の合成データで tracemalloc と突き合わせた値）
+MORPH_BYTES = 256
+SPLIT_BYTES = 800
+CELL_SPLIT_BYTES = 768
+INDEX_BYTES = 96
+NODE_BYTES = 1536
+NODE_SPAN_BYTES = 64
+COUNT_BYTES = 320
+CELL_BYTES = 128
+
+def make_session_id(bunsetsu_data, prune=False):
+    payload = json.dumps(bunsetsu_data, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    if prune:
+        payload = "prune:" + payload
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+def estimate_session_bytes(session):
+    """
+    セッションが保持するデータの概算サイズ
+
+    tree_counts と response は後から付くので、付けたときに ParseSessionCache.resize で見積もり直す
+    """
+    morphs = sum(len(b.get("morphs", [])) for b in session.get("bunsetsu_list", []))
+    splits = sum(len(c.get("splits", [])) for c in session.get("combinations", []))
+    size = morphs * MORPH_BYTES + splits * SPLIT_BYTES
+
+    # process_cky の結果に残る cky_matrix / cky_table のセル（split は combinations とは別の dict）
+    result = session.get("result") or {}
+    cells = [cell for row in result.get("cky_matrix", []) for cell in row if cell]
+    size += sum(len(cell.get("splits", [])) for cell in cells) * CELL_SPLIT_BYTES
+
+    split_index = session.get("split_index")
+    if split_index is not None:
+        size += len(split_index.by_tree_id) * INDEX_BYTES
+
+    for node in session.get("tree_nodes", {}).values():
+        span = node.get("span") or [0, 0]
+        size += NODE_BYTES + (span[1] - span[0]) * NODE_SPAN_BYTES
+
+    if session.get("tree_counts") is not None:
+        size += len(session["tree_counts"]) * COUNT_BYTES
+
+    # response は result の構造を参照するだけだが、cky_matrix の各セルに件数を書き足す
+    if session.get("response") is not None:
+        size += len(cells) * CELL_BYTES
+
+    return size
+
+class ParseSessionCache:
+    def __init__(self, max_entries=128, ttl_seconds=1800, max_bytes=256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, session_id):
+        if not session_id:
+            return None
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            session, expires_at, size = entry
+            if expires_at < time.monotonic():
+                self._remove(session_id)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(session_id)
+            self._entries[session_id] = (session, time.monotonic() + self.ttl_seconds, size)
+            self.hits += 1
+            return session
+
+    def put(self, session_id, session, size=None):
+        if size is None:
+            size = estimate_session_bytes(session)
+        with self._lock:
+            if session_id in self._entries:
+                self._remove(session_id)
+            if size > self.max_bytes:
+                return False
+            self._entries[session_id] = (session, time.monotonic() + self.ttl_seconds, size)
+            self._total_bytes += size
+            self._evict()
+            return True
+
+    def resize(self, session_id, session):
+        """後から付けたデータ (tree_counts / response) を含めてサイズを見積もり直す"""
+        size = estimate_session_bytes(session)
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None or entry[0] is not session:
+                return False
+            self._total_bytes += size - entry[2]
+            if size > self.max_bytes:
+                self._remove(session_id)
+                self.evictions += 1
+                return False
+            self._entries[session_id] = (entry[0], entry[1], size)
+            self._evict(keep=session_id)
+            return True
+
+    def discard(self, session_id):
+        with self._lock:
+            if session_id in self._entries:
+                self._remove(session_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "total_bytes": self._total_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+    def _remove(self, session_id):
+        _, _, size = self._entries.pop(session_id)
+        self._total_bytes -= size
+
+    def _evict(self, keep=None):
+        now = time.monotonic()
+        for session_id in [sid for sid, (_, expires_at, _) in self._entries.items() if expires_at < now]:
+            self._remove(session_id)
+            self.evictions += 1
+
+        # 古い順に追い出す（keep は見積もり直したばかりのセッション）
+        while self._entries and (len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes):
+            session_id = next(iter(self._entries))
+            if session_id == keep:
+                if len(self._entries) == 1:
+                    break
+                self._entries.move_to_end(session_id)
+                continue
+            self._remove(session_id)
+            self.evictions += 1
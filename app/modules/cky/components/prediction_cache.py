@@ -0,0 +1,228 @@
+import hashlib
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+WRITE_BATCH_ROWS = 2000
+WRITE_INTERVAL_SECONDS = 0.5
+
+def compute_model_revision(model_path):
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(model_path):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            digest.update(os.path.relpath(path, model_path).encode("utf-8"))
+            digest.update(f":{stat.st_size}:{stat.st_mtime_ns};".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+def make_pair_key(pair):
+    return json.dumps([pair.get("left", ""), pair.get("right", "")], ensure_ascii=False)
+
+class PairPredictionCache:
+    """
+    ペア単位の予測キャッシュ（メモリ LRU + 任意で SQLite）
+
+    SQLite への書き込みはバックグラウンドのスレッドがまとめて行う（put_many はキューに積むだけ）。
+    get_many はディスクを引くことがあるので、イベントループからはスレッド経由で呼ぶ。
+    _lock はメモリ LRU と統計だけ、_db_lock は SQLite 接続だけを守る（ディスク I/O 中に LRU を塞がない）。
+
+    行は revision（モデルとバリアント）ごとに分かれているので、同じ DB ファイルを複数のモデルで共有できる。
+    prune_stale=True のときだけ、開くときに他の revision の行を消す。
+    """
+    def __init__(self, revision, db_path=None, max_entries=100000, prune_stale=False):
+        self.revision = revision
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._conn = None
+        self._writes = queue.Queue()
+        self._writer = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.written = 0
+        self.write_batches = 0
+
+        if db_path:
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS pair_predictions ("
+                "revision TEXT NOT NULL, pair_key TEXT NOT NULL, "
+                "pred INTEGER NOT NULL, confidence REAL NOT NULL, "
+                "PRIMARY KEY (revision, pair_key))"
+            )
+            if prune_stale:
+                deleted = self._conn.execute("DELETE FROM pair_predictions WHERE revision != ?", (revision,)).rowcount
+                logger.info(f"[PredictionCache] Pruned {deleted} predictions of other revisions")
+            self._conn.commit()
+            self._writer = threading.Thread(target=self._write_loop, name="dep-cache-writer", daemon=True)
+            self._writer.start()
+
+    @property
+    def persistent(self):
+        return self._conn is not None
+
+    def get_many(self, pairs):
+        results = [None] * len(pairs)
+        keys = [make_pair_key(pair) for pair in pairs]
+        with self._lock:
+            missing = []
+            for idx, key in enumerate(keys):
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    results[idx] = {"pred": entry[0], "confidence": entry[1]}
+                    self.hits += 1
+                else:
+                    missing.append(idx)
+
+        if missing and self._conn is not None:
+            found = self._load([keys[idx] for idx in missing])
+            still_missing = []
+            with self._lock:
+                for idx in missing:
+                    entry = found.get(keys[idx])
+                    if entry is None:
+                        still_missing.append(idx)
+                        continue
+                    self._remember(keys[idx], entry)
+                    results[idx] = {"pred": entry[0], "confidence": entry[1]}
+                    self.disk_hits += 1
+            missing = still_missing
+
+        with self._lock:
+            self.misses += len(missing)
+        return results
+
+    def put_many(self, pairs, predictions):
+        rows = []
+        with self._lock:
+            for pair, prediction in zip(pairs, predictions):
+                key = make_pair_key(pair)
+                entry = (int(prediction["pred"]), float(prediction["confidence"]))
+                self._remember(key, entry)
+                rows.append((self.revision, key, entry[0], entry[1]))
+        if rows and self._writer is not None:
+            self._writes.put(rows)
+
+    def clear(self):
+        # 消すのはこの revision の行だけ（DB を共有している他のモデルの行は残す）
+        self._drain_writes()
+        with self._lock:
+            self._entries.clear()
+        with self._db_lock:
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM pair_predictions WHERE revision = ?", (self.revision,))
+                self._conn.commit()
+
+    def close(self):
+        # 残っている書き込みを反映してから閉じる
+        if self._writer is not None:
+            self._writes.put(None)
+            self._writer.join()
+            self._writer = None
+        with self._db_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "revision": self.revision,
+                "db_path": self.db_path,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else None,
+                "pending_writes": self._writes.qsize(),
+                "written": self.written,
+                "write_batches": self.write_batches
+            }
+
+    def _write_loop(self):
+        while True:
+            rows = self._writes.get()
+            if rows is None:
+                return
+            # 少し待って複数リクエストの書き込みを 1 回の commit にまとめる
+            stop = False
+            try:
+                while len(rows) < WRITE_BATCH_ROWS:
+                    more = self._writes.get(timeout=WRITE_INTERVAL_SECONDS)
+                    if more is None:
+                        stop = True
+                        break
+                    rows.extend(more)
+            except queue.Empty:
+                pass
+            self._write(rows)
+            if stop:
+                return
+
+    def _write(self, rows):
+        with self._db_lock:
+            if self._conn is None:
+                return
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO pair_predictions (revision, pair_key, pred, confidence) "
+                    "VALUES (?, ?, ?, ?)",
+                    rows
+                )
+                self._conn.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"[PredictionCache] Could not persist {len(rows)} predictions: {str(e)}")
+                return
+        with self._lock:
+            self.written += len(rows)
+            self.write_batches += 1
+
+    def _drain_writes(self):
+        while True:
+            try:
+                rows = self._writes.get_nowait()
+            except queue.Empty:
+                return
+            if rows is None:
+                self._writes.put(None)
+                return
+
+    def _load(self, keys):
+        found = {}
+        with self._db_lock:
+            if self._conn is None:
+                return found
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT pair_key, pred, confidence FROM pair_predictions "
+                    f"WHERE revision = ? AND pair_key IN ({placeholders})",
+                    [self.revision, *chunk]
+                )
+                for key, pred, confidence in rows:
+                    found[key] = (pred, confidence)
+        return found
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
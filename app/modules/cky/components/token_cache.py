@@ -0,0 +1,98 @@
+class SentenceTokenCache:
+    def __init__(self, tokenizer, pieces, max_length=512):
+        self.tokenizer = tokenizer
+        self.pieces = list(pieces)
+        self.max_length = max_length
+        self.model_input_names = list(getattr(tokenizer, "model_input_names", ["input_ids", "attention_mask"]))
+        self.cls_id = getattr(tokenizer, "cls_token_id", None)
+        self.sep_id = getattr(tokenizer, "sep_token_id", None)
+        self.enabled = self.cls_id is not None and self.sep_id is not None and bool(self.pieces)
+        self.span_cache = {}
+        self.direct_spans = 0
+        self.assembled_spans = 0
+
+        if not self.enabled:
+            return
+
+        self.piece_ids = self._encode(self.pieces)
+
+        # 隣接する分節を連結したときにサブワードの切れ目が変わる境界は連結で組み立てない
+        joined = self._encode([a + b for a, b in zip(self.pieces, self.pieces[1:])])
+        self.safe_boundary = [
+            joined[k] == self.piece_ids[k] + self.piece_ids[k + 1]
+            for k in range(len(self.pieces) - 1)
+        ]
+
+        self.enabled = self._verify_pair_layout()
+
+    def assemblable(self, i, j):
+        # 連結で組み立てるのは照合済みの 1〜2 分節の span だけ
+        # （3 分節以上は形態素解析が隣接ペアと違う切り方をし得るので、span ごとに直接トークン化する）
+        return j - i < 2 and all(self.safe_boundary[i:j])
+
+    def prefetch(self, spans):
+        """直接トークン化が必要な span をまとめて 1 回でトークン化しておく"""
+        todo = sorted({
+            (i, j) for i, j in spans
+            if (i, j) not in self.span_cache and not self.assemblable(i, j)
+        })
+        if todo:
+            encoded = self._encode(["".join(self.pieces[i:j + 1]) for i, j in todo])
+            self.span_cache.update(zip(todo, encoded))
+            self.direct_spans += len(todo)
+
+    def span_ids(self, i, j):
+        key = (i, j)
+        ids = self.span_cache.get(key)
+        if ids is None:
+            if self.assemblable(i, j):
+                ids = []
+                for k in range(i, j + 1):
+                    ids.extend(self.piece_ids[k])
+                self.assembled_spans += 1
+            else:
+                ids = self._encode(["".join(self.pieces[i:j + 1])])[0]
+                self.direct_spans += 1
+            self.span_cache[key] = ids
+        return ids
+
+    def pair_ids(self, left, right):
+        body = self.span_ids(*left) + [self.sep_id] + self.span_ids(*right)
+        return [self.cls_id] + body[:self.max_length - 2] + [self.sep_id]
+
+    def encode_pair(self, left, right):
+        input_ids = self.pair_ids(left, right)
+        feature = {"input_ids": input_ids}
+        if "token_type_ids" in self.model_input_names:
+            feature["token_type_ids"] = [0] * len(input_ids)
+        if "attention_mask" in self.model_input_names:
+            feature["attention_mask"] = [1] * len(input_ids)
+        return feature
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "pieces": len(self.pieces),
+            "unsafe_boundaries": 0 if not self.enabled else self.safe_boundary.count(False),
+            "assembled_spans": self.assembled_spans,
+            "direct_spans": self.direct_spans
+        }
+
+    def _encode(self, texts):
+        if not texts:
+            return []
+        return self.tokenizer(texts, add_special_tokens=False)["input_ids"]
+
+    def _verify_pair_layout(self):
+        n = len(self.pieces)
+        if n < 2:
+            return True
+        k = n // 2 - 1
+        left_text = "".join(self.pieces[:k + 1])
+        right_text = "".join(self.pieces[k + 1:])
+        expected = self.tokenizer(
+            [f"{left_text} [SEP] {right_text}"],
+            truncation=True,
+            max_length=self.max_length
+        )["input_ids"][0]
+        return self.pair_ids((0, k), (k + 1, n - 1)) == expected
@@ -1,10 +1,23 @@
+import functools
+import json
 import logging
+import os
 import unicodedata
-from ..components.cky import process_cky, expand_tree_by_pred, expand_tree_from_cell, enumerate_all_trees_from_cell, normalize_bunsetsu, build_cky_table
-from .dep_model_service import batch_predict_dependencies
+from ..components.cky import normalize_bunsetsu, process_cky, expand_tree_by_pred, expand_tree_from_cell, enumerate_all_trees_from_cell, count_trees_by_cell, describe_cell, iter_tree_list_from_cell
+from ..components.parse_session import ParseSessionCache, make_session_id
+from .dep_model_service import batch_predict_dependencies, build_token_cache
 
 logger = logging.getLogger(__name__)
 
+_parse_sessions = ParseSessionCache(
+    max_entries=int(os.environ.get("CKY_SESSION_MAX_ENTRIES", 128)),
+    ttl_seconds=float(os.environ.get("CKY_SESSION_TTL_SECONDS", 1800)),
+    max_bytes=int(os.environ.get("CKY_SESSION_MAX_BYTES", 256 * 1024 * 1024))
+)
+
+def get_parse_session_cache():
+    return _parse_sessions
+
 def normalize_text(text: str) -> str:
     if not isinstance(text, str):
         return text
@@ -35,7 +48,7 @@ def normalize_bunsetsu_data(bunsetsu_data):
     
     return bunsetsu_data
 
-async def enrich_splits_with_deps(combinations):
+async def enrich_splits_with_deps(combinations, token_cache=None, morph_store=None):
 
     pairs = []
     pair_to_indices = []
@@ -44,13 +57,18 @@ async def enrich_splits_with_deps(combinations):
         for split_idx, split in enumerate(combo.get("splits", [])):
             left_text = split.get("left_text", "")
             right_text = split.get("right_text", "")
-            pairs.append({"left": left_text, "right": right_text})
+            pairs.append({
+                "left": left_text,
+                "right": right_text,
+                "left_span": split.get("left"),
+                "right_span": split.get("right")
+            })
             pair_to_indices.append((combo_idx, split_idx))
     
     logger.info(f"[CKY Service] Enriching {len(pairs)} splits with dependency predictions (batch mode)")
 
     if pairs:
-        predictions = await batch_predict_dependencies(pairs)
+        predictions = await batch_predict_dependencies(pairs, token_cache=token_cache, morph_store=morph_store)
 
         for (combo_idx, split_idx), pred_result in zip(pair_to_indices, predictions):
             combinations[combo_idx]["splits"][split_idx]["pred"] = pred_result["pred"]
@@ -58,7 +76,82 @@ async def enrich_splits_with_deps(combinations):
     
     return combinations
 
-async def cky_parse_service(bunsetsu_data, request=None):
+async def load_parse_session(bunsetsu_data, session_id=None, prune=False):
+    if not bunsetsu_data:
+        # データなしのときだけ session_id 単独の参照を信用する
+        session = _parse_sessions.get(session_id) if session_id else None
+        if session is None:
+            return None, {
+                "status": "error",
+                "message": f"Session '{session_id}' not found or expired" if session_id else "No bunsetsu data"
+            }
+        if session["pruned"] != prune:
+            return None, {
+                "status": "error",
+                "message": f"Session '{session_id}' was parsed with prune={session['pruned']}"
+            }
+        logger.info(f"[CKY Service] Reusing parse session {session_id}")
+        return session, None
+
+    # データがあれば内容ハッシュをキーにする（編集後の古い session_id は使わない）
+    bunsetsu_data = normalize_bunsetsu_data(bunsetsu_data)
+    content_id = make_session_id(bunsetsu_data, prune=prune)
+
+    if session_id and session_id != content_id:
+        return None, {
+            "status": "error",
+            "message": f"Session '{session_id}' does not match the submitted data (prune={prune})"
+        }
+
+    session = _parse_sessions.get(content_id)
+    if session is not None:
+        logger.info(f"[CKY Service] Reusing parse session {content_id}")
+        return session, None
+
+    bunsetsu_list = normalize_bunsetsu(bunsetsu_data)
+    token_cache = await build_token_cache([b["text"] for b in bunsetsu_list])
+    morph_store = bunsetsu_list.morph_store
+
+    if prune:
+        # 枝刈りモードでは chart 構築時に到達可能な split だけを推論済み
+        score_pairs = functools.partial(batch_predict_dependencies, token_cache=token_cache, morph_store=morph_store)
+        result = await process_cky(bunsetsu_data, score_pairs=score_pairs)
+    else:
+        result = await process_cky(bunsetsu_data)
+    if result["status"] != "success":
+        return None, result
+
+    if not prune:
+        result["combinations"] = await enrich_splits_with_deps(result.get("combinations", []), token_cache, morph_store)
+
+    session = {
+        "session_id": content_id,
+        "bunsetsu_list": result.get("bunsetsu", []),
+        "table": result.get("chart"),
+        "combinations": result["combinations"],
+        "split_index": result.get("split_index"),
+        "tree_index": result.get("trees", {}),
+        "tree_nodes": result.get("tree_nodes", {}),
+        "tree_counts": None,
+        "pruned": prune,
+        "result": result,
+        "response": None
+    }
+    _parse_sessions.put(content_id, session)
+    logger.info(f"[CKY Service] Created parse session {content_id} (prune={prune})")
+
+    return session, None
+
+def get_session_tree_counts(session):
+    if session.get("tree_counts") is None:
+        session["tree_counts"] = count_trees_by_cell(
+            session["table"], session["combinations"], len(session["bunsetsu_list"]),
+            session.get("split_index")
+        )
+        _parse_sessions.resize(session["session_id"], session)
+    return session["tree_counts"]
+
+async def cky_parse_service(bunsetsu_data, request=None, session_id=None, prune=False):
 
     bunsetsu_data = normalize_bunsetsu_data(bunsetsu_data)
     
@@ -74,23 +167,17 @@ async def cky_parse_service(bunsetsu_data, request=None):
     
     try:
 
-        result = await process_cky(bunsetsu_data)
-        
-        if result["status"] != "success":
-            logger.warning(f"[CKY Service] Error: {result['message']}")
-            return result
-
-        combinations = result.get("combinations", [])
-        print(f"[DEBUG] combinations count: {len(combinations)}")
-        if combinations:
-            print(f"[DEBUG] combinations[0] keys: {list(combinations[0].keys())}")
-            if "splits" in combinations[0]:
-                print(f"[DEBUG] combinations[0]['splits'] count: {len(combinations[0]['splits'])}")
-                if combinations[0]['splits']:
-                    print(f"[DEBUG] combinations[0]['splits'][0] keys: {list(combinations[0]['splits'][0].keys())}")
-        
-        enriched_combinations = await enrich_splits_with_deps(combinations)
-        result["combinations"] = enriched_combinations
+        session, error = await load_parse_session(bunsetsu_data, session_id, prune=prune)
+
+        if error is not None:
+            logger.warning(f"[CKY Service] Error: {error['message']}")
+            return error
+
+        if session["response"] is not None:
+            return session["response"]
+
+        result = session["result"]
+        enriched_combinations = session["combinations"]
         
         print(f"[DEBUG] enriched_combinations count: {len(enriched_combinations)}")
         if enriched_combinations:
@@ -169,51 +256,11 @@ async def cky_parse_service(bunsetsu_data, request=None):
                         cell["pred1_tree_count"] = 0
                         cell["pred0_tree_count"] = 0
 
-        from ..components.cky import normalize_bunsetsu, build_cky_table, enumerate_all_trees_from_cell
-        bunsetsu_list = normalize_bunsetsu(bunsetsu_data)
-        table = build_cky_table(bunsetsu_list)
+        table = session["table"]
 
-        from ..components.cky import enumerate_all_trees_from_cell
-        cell_expanded_tree_counts = {}
-        
         print(f"[DEBUG] Computing expanded tree counts for all cells...")
         n = len(cky_matrix)
-        for i in range(n):
-            for j in range(n):
-                if i >= j:
-                    continue
-                
-                cell = cky_matrix[i][j]
-                if not cell:
-                    continue
-                
-                try:
-
-                    expand_result = enumerate_all_trees_from_cell(table, enriched_combinations, i, j, bunsetsu_list)
-                    
-                    if expand_result and expand_result.get("tree_list"):
-                        tree_list = expand_result.get("tree_list", [])
-                        pred1_count = 0
-                        pred0_count = 0
-                        
-                        for tree_item in tree_list:
-                            tree_obj = tree_item.get("tree", {})
-                            pred = tree_obj.get("pred")
-                            if pred == 1:
-                                pred1_count += 1
-                            elif pred == 0:
-                                pred0_count += 1
-                        
-                        span_key = (i, j)
-                        cell_expanded_tree_counts[span_key] = {"pred1": pred1_count, "pred0": pred0_count}
-                        print(f"[DEBUG] Cell ({i},{j}): expanded_pred1={pred1_count}, expanded_pred0={pred0_count}")
-                    else:
-                        span_key = (i, j)
-                        cell_expanded_tree_counts[span_key] = {"pred1": 0, "pred0": 0}
-                except Exception as e:
-                    logger.warning(f"[CKY Service] Cell ({i},{j}) enumeration error: {str(e)}")
-                    span_key = (i, j)
-                    cell_expanded_tree_counts[span_key] = {"pred1": 0, "pred0": 0}
+        cell_expanded_tree_counts = get_session_tree_counts(session)
 
         print(f"[DEBUG] cell_expanded_tree_counts: {cell_expanded_tree_counts}")
         for i, row in enumerate(cky_matrix):
@@ -233,6 +280,7 @@ async def cky_parse_service(bunsetsu_data, request=None):
 
         response = {
             "status": result.get("status", "success"),
+            "session_id": session["session_id"],
 
             "input_data": {
                 "bunsetsu": result.get("bunsetsu", []),
@@ -243,6 +291,7 @@ async def cky_parse_service(bunsetsu_data, request=None):
                 "total_bunsetsu": result["summary"].get("total_bunsetsu", 0),
                 "total_cells": result["summary"].get("total_cells", 0),
                 "total_splits": result["summary"].get("total_splits", 0),
+                "pruned": session.get("pruned", False),
                 "total_root_trees": len(root_trees),
                 "total_subtree_trees": len(subtree_trees),
                 "total_all_trees": len(expanded_trees),
@@ -273,6 +322,9 @@ async def cky_parse_service(bunsetsu_data, request=None):
         logger.info(f"[CKY Service] Success - {response['summary']['total_cells']} cells, "
                    f"{response['summary']['total_splits']} splits enriched, "
                    f"{len(root_trees)} root trees + {len(subtree_trees)} subtrees with pred=1 expanded")
+
+        session["response"] = response
+        _parse_sessions.resize(session["session_id"], session)
         
         return response
     
@@ -283,34 +335,35 @@ async def cky_parse_service(bunsetsu_data, request=None):
             "message": f"サービスエラー: {str(e)}"
         }
 
-async def cky_expand_cell_service(bunsetsu_data, cell_i, cell_j, pred_threshold=1, request=None):
+async def cky_expand_cell_service(bunsetsu_data, cell_i, cell_j, pred_threshold=1, request=None, session_id=None, offset=0, limit=None, output_format="tree", prune=False):
     logger.info(f"[CKY Expand Cell Service] Expanding from cell ({cell_i}, {cell_j})")
     
     try:
 
-        result = await process_cky(bunsetsu_data)
+        session, error = await load_parse_session(bunsetsu_data, session_id, prune=prune)
         
-        if result["status"] != "success":
-            logger.warning(f"[CKY Expand Cell Service] Error: {result['message']}")
-            return result
-
-        combinations = result.get("combinations", [])
-        enriched_combinations = await enrich_splits_with_deps(combinations)
-
-        bunsetsu_list = normalize_bunsetsu(bunsetsu_data)
-        table = build_cky_table(bunsetsu_list)
+        if error is not None:
+            logger.warning(f"[CKY Expand Cell Service] Error: {error['message']}")
+            return error
 
         expand_result = enumerate_all_trees_from_cell(
-            table, enriched_combinations, cell_i, cell_j,
-            bunsetsu_list=bunsetsu_list
+            session["table"], session["combinations"], cell_i, cell_j,
+            bunsetsu_list=session["bunsetsu_list"],
+            offset=offset,
+            limit=limit,
+            tree_counts=get_session_tree_counts(session),
+            output_format=output_format,
+            split_index=session.get("split_index")
         )
         
         if expand_result.get("status") != "success":
             logger.warning(f"[CKY Expand Cell Service] Enumeration failed: {expand_result.get('message')}")
             return expand_result
+
+        expand_result["session_id"] = session["session_id"]
         
         tree_count = len(expand_result.get('tree_list', []))
-        logger.info(f"[CKY Expand Cell Service] Success - {tree_count} trees enumerated")
+        logger.info(f"[CKY Expand Cell Service] Success - {tree_count} of {expand_result.get('total_trees', 0)} trees enumerated")
         
         return expand_result
     
@@ -320,3 +373,52 @@ async def cky_expand_cell_service(bunsetsu_data, cell_i, cell_j, pred_threshold=
             "status": "error",
             "message": f"サービスエラー: {str(e)}"
         }
+
+async def cky_expand_cell_stream_service(bunsetsu_data, cell_i, cell_j, request=None, session_id=None, offset=0, limit=None, output_format="tree", prune=False):
+    logger.info(f"[CKY Expand Cell Stream] Streaming trees from cell ({cell_i}, {cell_j})")
+
+    try:
+
+        session, error = await load_parse_session(bunsetsu_data, session_id, prune=prune)
+
+        if error is not None:
+            logger.warning(f"[CKY Expand Cell Stream] Error: {error['message']}")
+            yield json.dumps(error, ensure_ascii=False) + "\n"
+            return
+
+        tree_counts = get_session_tree_counts(session)
+        header = describe_cell(
+            session["table"], session["combinations"], cell_i, cell_j,
+            bunsetsu_list=session["bunsetsu_list"],
+            tree_counts=tree_counts
+        )
+        header["session_id"] = session["session_id"]
+        header["offset"] = offset
+        header["limit"] = limit
+        header["format"] = output_format
+        yield json.dumps(header, ensure_ascii=False) + "\n"
+
+        if header["status"] != "success" or header["is_terminal"]:
+            return
+
+        tree_count = 0
+        for tree_item in iter_tree_list_from_cell(
+            session["table"], session["combinations"], cell_i, cell_j,
+            bunsetsu_list=session["bunsetsu_list"],
+            offset=offset,
+            limit=limit,
+            tree_counts=tree_counts,
+            output_format=output_format,
+            split_index=session.get("split_index")
+        ):
+            tree_count += 1
+            yield json.dumps(tree_item, ensure_ascii=False) + "\n"
+
+        logger.info(f"[CKY Expand Cell Stream] Success - {tree_count} of {header['total_trees']} trees streamed")
+
+    except Exception as e:
+        logger.error(f"[CKY Expand Cell Stream] Exception: {str(e)}")
+        yield json.dumps({
+            "status": "error",
+            "message": f"サービスエラー: {str(e)}"
+        }, ensure_ascii=False) + "\n"
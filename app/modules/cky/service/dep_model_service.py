@@ -1,30 +1,95 @@
+import asyncio
 import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from transformers import AutoTokenizer, AutoModelForSequenceClassification
 import torch
+from ..components.prediction_cache import PairPredictionCache, compute_model_revision
+from ..components.dep_model_variants import VARIANTS, load_variant, quantize_int8, variant_dir
+from ..components.token_cache import SentenceTokenCache
 
 logger = logging.getLogger(__name__)
 
 _dep_model = None
 _tokenizer = None
+_prediction_cache = None
+_model_variant = None
 
-async def load_dep_model(model_path="app/model/dep_model"):
-    global _dep_model, _tokenizer
+MAX_BATCH_SIZE = int(os.environ.get("DEP_MODEL_MAX_BATCH_SIZE", 64))
+MAX_BATCH_TOKENS = int(os.environ.get("DEP_MODEL_MAX_BATCH_TOKENS", 8192))
+PREDICTION_CACHE_PATH = os.environ.get("DEP_PREDICTION_CACHE_PATH")
+PREDICTION_CACHE_MAX_ENTRIES = int(os.environ.get("DEP_PREDICTION_CACHE_MAX_ENTRIES", 100000))
+PREDICTION_CACHE_PRUNE = os.environ.get("DEP_PREDICTION_CACHE_PRUNE", "0") in ("1", "true", "yes")
+SCHEDULER_MAX_WAIT_MS = float(os.environ.get("DEP_BATCH_MAX_WAIT_MS", 5))
+SCHEDULER_MAX_BATCH_PAIRS = int(os.environ.get("DEP_BATCH_MAX_PAIRS", 512))
+SCHEDULER_MAX_PENDING = int(os.environ.get("DEP_BATCH_MAX_PENDING", 64))
+INFERENCE_WORKERS = int(os.environ.get("DEP_INFERENCE_WORKERS", 1))
+INFERENCE_MAX_QUEUE = int(os.environ.get("DEP_INFERENCE_MAX_QUEUE", 8))
+TORCH_NUM_THREADS = os.environ.get("DEP_TORCH_NUM_THREADS")
+TORCH_INTEROP_THREADS = os.environ.get("DEP_TORCH_INTEROP_THREADS")
+MODEL_VARIANT = os.environ.get("DEP_MODEL_VARIANT", "fp32")
+MODEL_VARIANTS_DIR = os.environ.get("DEP_MODEL_VARIANTS_DIR")
+TOKEN_CACHE_ENABLED = os.environ.get("DEP_TOKEN_CACHE", "1") not in ("0", "false", "no")
+CASCADE_ENABLED = os.environ.get("DEP_CASCADE", "0") in ("1", "true", "yes")
+CASCADE_LOW = float(os.environ.get("DEP_CASCADE_LOW", 0.1))
+CASCADE_HIGH = float(os.environ.get("DEP_CASCADE_HIGH", 0.9))
+
+FUNC_POS = {"ADP", "AUX", "PART", "SCONJ", "CCONJ", "PUNCT"}
+SENTENCE_END = {"。", "．", "!", "?", "！", "？"}
+
+_batch_stats = {
+    "calls": 0,
+    "batches": 0,
+    "pairs": 0,
+    "real_tokens": 0,
+    "padded_tokens": 0,
+    "model_ms": 0.0,
+    "last_call": []
+}
+_batch_stats_lock = threading.Lock()
+
+_cascade_stats = {
+    "pairs": 0,
+    "rule": 0,
+    "model": 0
+}
+
+async def load_dep_model(model_path="app/model/dep_model", variant=None):
+    global _dep_model, _tokenizer, _prediction_cache, _model_variant
     
     try:
-        logger.info(f"[DepModel] Loading model from {model_path}...")
+        variant = variant or MODEL_VARIANT
+        if variant not in VARIANTS:
+            raise ValueError(f"Unknown dependency model variant '{variant}' (expected one of {', '.join(VARIANTS)})")
+        variants_dir = MODEL_VARIANTS_DIR or default_variants_dir(model_path)
+
+        logger.info(f"[DepModel] Loading model from {model_path} (variant={variant})...")
+
+        configure_torch_threads()
 
         _tokenizer = AutoTokenizer.from_pretrained(
             model_path,
             local_files_only=True
         )
-        _dep_model = AutoModelForSequenceClassification.from_pretrained(
-            model_path,
-            local_files_only=True
-        )
+        if variant in ("fp32", "int8") and not os.path.exists(os.path.join(variant_dir(variants_dir, variant), "variant.json")):
+            _dep_model = AutoModelForSequenceClassification.from_pretrained(
+                model_path,
+                local_files_only=True
+            )
+            _dep_model.eval()
+            if variant == "int8":
+                # prepare_dep_model.py の成果物が無ければその場で動的量子化する
+                _dep_model = quantize_int8(_dep_model)
+        else:
+            _dep_model = load_variant(variant, variants_dir)
+        _model_variant = variant
 
-        _dep_model.eval()
+        _prediction_cache = open_prediction_cache(model_path, variant, variants_dir)
         
-        logger.info("[DepModel] Model loaded successfully")
+        logger.info(f"[DepModel] Model loaded successfully (variant={variant})")
         return _dep_model, _tokenizer
     
     except Exception as e:
@@ -34,7 +99,330 @@ async def load_dep_model(model_path="app/model/dep_model"):
 def get_dep_model():
     return _dep_model, _tokenizer
 
-async def batch_predict_dependencies(pairs):
+def get_model_variant():
+    return _model_variant
+
+def default_variants_dir(model_path):
+    return os.path.join(os.path.dirname(os.path.abspath(model_path)), "dep_model_variants")
+
+def configure_torch_threads():
+    if TORCH_NUM_THREADS:
+        torch.set_num_threads(int(TORCH_NUM_THREADS))
+    if TORCH_INTEROP_THREADS:
+        try:
+            torch.set_interop_threads(int(TORCH_INTEROP_THREADS))
+        except RuntimeError as e:
+            # 並列処理が一度でも走った後は変更できない
+            logger.warning(f"[DepModel] Could not set interop threads: {str(e)}")
+    logger.info(f"[DepModel] torch threads: intra-op={torch.get_num_threads()}, "
+                f"inter-op={torch.get_num_interop_threads()}")
+
+class InferenceExecutor:
+    def __init__(self, workers=1, max_queue=8):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dep-inference")
+        self._loop = None
+        self._slots = None
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+
+    async def run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._slots = asyncio.Semaphore(self.workers + self.max_queue)
+
+        with self._lock:
+            self.queued += 1
+        try:
+            await self._slots.acquire()
+        except BaseException:
+            with self._lock:
+                self.queued -= 1
+            raise
+        try:
+            return await loop.run_in_executor(self._executor, self._call, fn, args)
+        finally:
+            self._slots.release()
+
+    def _call(self, fn, args):
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "queue_depth": self.queued,
+                "running": self.running,
+                "completed": self.completed
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+_inference_executor = InferenceExecutor(INFERENCE_WORKERS, INFERENCE_MAX_QUEUE)
+
+def get_inference_executor():
+    return _inference_executor
+
+def open_prediction_cache(model_path, variant="fp32", variants_dir=None):
+    if _prediction_cache is not None:
+        _prediction_cache.close()
+
+    # ディスクへの永続化は DEP_PREDICTION_CACHE_PATH を指定したときだけ（既定はメモリのみ）
+    db_path = PREDICTION_CACHE_PATH or None
+
+    revision = compute_model_revision(model_path)
+    if variant != "fp32":
+        path = variant_dir(variants_dir or default_variants_dir(model_path), variant)
+        revision = f"{variant}-{revision}"
+        if os.path.isdir(path):
+            revision = f"{revision}-{compute_model_revision(path)}"
+    try:
+        cache = PairPredictionCache(revision, db_path, PREDICTION_CACHE_MAX_ENTRIES, prune_stale=PREDICTION_CACHE_PRUNE)
+    except Exception as e:
+        logger.warning(f"[DepModel] Prediction cache at {db_path} unavailable, using memory only: {str(e)}")
+        cache = PairPredictionCache(revision, None, PREDICTION_CACHE_MAX_ENTRIES)
+
+    logger.info(f"[DepModel] Prediction cache ready (revision={revision}, db={cache.db_path})")
+    return cache
+
+def get_prediction_cache():
+    return _prediction_cache
+
+def plan_length_buckets(lengths, max_batch_size=None, max_batch_tokens=None):
+    max_batch_size = max_batch_size or MAX_BATCH_SIZE
+    max_batch_tokens = max_batch_tokens or MAX_BATCH_TOKENS
+
+    order = sorted(range(len(lengths)), key=lambda idx: lengths[idx])
+    batches = []
+    batch = []
+    batch_max_len = 0
+    for idx in order:
+        next_max_len = max(batch_max_len, lengths[idx])
+        if batch and (len(batch) >= max_batch_size or next_max_len * (len(batch) + 1) > max_batch_tokens):
+            batches.append(batch)
+            batch = []
+            next_max_len = lengths[idx]
+        batch.append(idx)
+        batch_max_len = next_max_len
+    if batch:
+        batches.append(batch)
+    return batches
+
+def record_batch_stats(batch_stats):
+    with _batch_stats_lock:
+        _batch_stats["calls"] += 1
+        for stat in batch_stats:
+            _batch_stats["batches"] += 1
+            _batch_stats["pairs"] += stat["size"]
+            _batch_stats["real_tokens"] += stat["real_tokens"]
+            _batch_stats["padded_tokens"] += stat["padded_tokens"]
+            _batch_stats["model_ms"] += stat["elapsed_ms"]
+        _batch_stats["last_call"] = batch_stats
+
+def get_batch_stats():
+    with _batch_stats_lock:
+        padded = _batch_stats["padded_tokens"]
+        return {
+            **_batch_stats,
+            "max_batch_size": MAX_BATCH_SIZE,
+            "max_batch_tokens": MAX_BATCH_TOKENS,
+            "padding_efficiency": _batch_stats["real_tokens"] / padded if padded else None
+        }
+
+class DynamicBatchScheduler:
+    def __init__(self, max_wait_ms=5, max_batch_pairs=512, max_pending=64):
+        self.max_wait_ms = max_wait_ms
+        self.max_batch_pairs = max_batch_pairs
+        self.max_pending = max_pending
+        self._loop = None
+        self._worker = None
+        self._pending = deque()
+        self._pending_pairs = 0
+        self._wakeup = None
+        self._slots = None
+        self.batches = 0
+        self.requests = 0
+        self.pairs = 0
+        self.unique_pairs = 0
+        self.wait_ms = 0.0
+
+    async def submit(self, pairs):
+        self._ensure_worker()
+
+        # max_pending 件を超える同時リクエストはここで待たせる（バックプレッシャー）
+        async with self._slots:
+            future = self._loop.create_future()
+            self._pending.append((pairs, future, time.perf_counter()))
+            self._pending_pairs += len(pairs)
+            self._wakeup.set()
+            return await future
+
+    def stats(self):
+        return {
+            "max_wait_ms": self.max_wait_ms,
+            "max_batch_pairs": self.max_batch_pairs,
+            "max_pending": self.max_pending,
+            "pending_requests": len(self._pending),
+            "pending_pairs": self._pending_pairs,
+            "batches": self.batches,
+            "requests": self.requests,
+            "pairs": self.pairs,
+            "unique_pairs": self.unique_pairs,
+            "avg_requests_per_batch": self.requests / self.batches if self.batches else None,
+            "avg_wait_ms": self.wait_ms / self.requests if self.requests else None
+        }
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._worker is not None and not self._worker.done():
+            return
+        self._loop = loop
+        self._pending = deque()
+        self._pending_pairs = 0
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.max_pending)
+        self._worker = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            if not self._pending:
+                self._wakeup.clear()
+                continue
+
+            deadline = time.perf_counter() + self.max_wait_ms / 1000
+            while self._pending_pairs < self.max_batch_pairs:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+
+            entries = [self._pending.popleft()]
+            size = len(entries[0][0])
+            while self._pending and size + len(self._pending[0][0]) <= self.max_batch_pairs:
+                entries.append(self._pending.popleft())
+                size += len(entries[-1][0])
+            self._pending_pairs -= size
+            if self._pending:
+                self._wakeup.set()
+            else:
+                self._wakeup.clear()
+
+            try:
+                await self._run_batch(entries)
+            except Exception as e:
+                logger.error(f"[DepModel] Scheduler batch error: {str(e)}")
+                for _, future, _ in entries:
+                    if not future.done():
+                        future.set_result(None)
+
+    async def _run_batch(self, entries):
+        started = time.perf_counter()
+        unique_pairs = []
+        positions = {}
+        for pairs, _, _ in entries:
+            for pair in pairs:
+                key = (pair.get("left", ""), pair.get("right", ""))
+                if key not in positions:
+                    positions[key] = len(unique_pairs)
+                    unique_pairs.append(pair)
+
+        model, tokenizer = get_dep_model()
+        predictions = None
+        if model is not None and tokenizer is not None:
+            predictions = await _inference_executor.run(predict_uncached, model, tokenizer, unique_pairs)
+
+        self.batches += 1
+        self.requests += len(entries)
+        self.unique_pairs += len(unique_pairs)
+        for pairs, future, submitted in entries:
+            self.pairs += len(pairs)
+            self.wait_ms += (started - submitted) * 1000
+            if future.done():
+                continue
+            if predictions is None:
+                future.set_result(None)
+            else:
+                future.set_result([
+                    dict(predictions[positions[(pair.get("left", ""), pair.get("right", ""))]])
+                    for pair in pairs
+                ])
+
+        logger.debug(f"[DepModel] Scheduler batch: {len(entries)} requests, {len(unique_pairs)} unique pairs")
+
+_scheduler = DynamicBatchScheduler(SCHEDULER_MAX_WAIT_MS, SCHEDULER_MAX_BATCH_PAIRS, SCHEDULER_MAX_PENDING)
+
+def get_batch_scheduler():
+    return _scheduler
+
+def rule_pred1_probability(pair, morph_store):
+    left_span = pair.get("left_span")
+    right_span = pair.get("right_span")
+    if left_span is None or right_span is None:
+        return None
+
+    left_types = morph_store.types_for(*left_span)
+    right_types = morph_store.types_for(*right_span)
+    if not left_types or not right_types:
+        return None
+    right_pos, _, _ = morph_store.pos_tags_for(*right_span)
+
+    # 右側が助詞・助動詞などで始まる（係り先を持たない付属語が宙に浮く）
+    if right_types[0] == "func" or (right_pos and right_pos[0] in FUNC_POS):
+        return 0.03
+    # 片側が付属語だけで内容語を含まない
+    if "core" not in left_types or "core" not in right_types:
+        return 0.05
+    # 左側が句点で終わっていれば右側には係らない
+    start, end = morph_store.span_range(*left_span)
+    if end > start and morph_store.texts[end - 1] in SENTENCE_END:
+        return 0.05
+    return 0.5
+
+def cascade_rule_stage(pairs, morph_store, low=None, high=None):
+    low = CASCADE_LOW if low is None else low
+    high = CASCADE_HIGH if high is None else high
+
+    decisions = []
+    for pair in pairs:
+        probability = rule_pred1_probability(pair, morph_store)
+        if probability is None or low < probability < high:
+            decisions.append(None)
+        elif probability >= high:
+            decisions.append({"pred": 1, "confidence": probability})
+        else:
+            decisions.append({"pred": 0, "confidence": 1 - probability})
+    return decisions
+
+def get_cascade_stats():
+    pairs = _cascade_stats["pairs"]
+    return {
+        **_cascade_stats,
+        "enabled": CASCADE_ENABLED,
+        "band": [CASCADE_LOW, CASCADE_HIGH],
+        "rule_share": _cascade_stats["rule"] / pairs if pairs else None,
+        "model_share": _cascade_stats["model"] / pairs if pairs else None
+    }
+
+async def batch_predict_dependencies(pairs, max_batch_size=None, max_batch_tokens=None, token_cache=None, morph_store=None):
     model, tokenizer = get_dep_model()
     
     if model is None or tokenizer is None:
@@ -43,43 +431,186 @@ async def batch_predict_dependencies(pairs):
     
     if not pairs:
         return []
-    
+
+    results = [None] * len(pairs)
+    model_positions = list(range(len(pairs)))
+    if CASCADE_ENABLED and morph_store is not None:
+        model_positions = []
+        for idx, decision in enumerate(cascade_rule_stage(pairs, morph_store)):
+            if decision is None:
+                model_positions.append(idx)
+            else:
+                results[idx] = decision
+
+        _cascade_stats["pairs"] += len(pairs)
+        _cascade_stats["rule"] += len(pairs) - len(model_positions)
+        _cascade_stats["model"] += len(model_positions)
+        if len(model_positions) < len(pairs):
+            logger.info(f"[DepModel] Cascade: rule stage decided {len(pairs) - len(model_positions)}/{len(pairs)} pairs")
+
+    cache = get_prediction_cache()
+    if cache is not None and model_positions:
+        lookup_pairs = [pairs[idx] for idx in model_positions]
+        if cache.persistent:
+            # SQLite を引くことがあるのでイベントループの外で
+            cached = await asyncio.to_thread(cache.get_many, lookup_pairs)
+        else:
+            cached = cache.get_many(lookup_pairs)
+        for idx, result in zip(model_positions, cached):
+            results[idx] = result
+
+    missing_pairs = []
+    missing_positions = {}
+    for idx, result in enumerate(results):
+        if result is None:
+            pair = pairs[idx]
+            key = (pair.get("left", ""), pair.get("right", ""))
+            if key not in missing_positions:
+                missing_positions[key] = []
+                missing_pairs.append(pair)
+            missing_positions[key].append(idx)
+
+    logger.debug(f"[DepModel] Prediction cache: {len(pairs) - sum(map(len, missing_positions.values()))} hits, "
+                 f"{len(missing_pairs)} unique pairs to predict")
+
+    if missing_pairs:
+        if token_cache is not None:
+            # トークナイザーは推論と同じワーカーで使う（イベントループを塞がず、同時利用もしない）
+            await _inference_executor.run(encode_pairs, missing_pairs, token_cache)
+        if max_batch_size is None and max_batch_tokens is None:
+            predictions = await _scheduler.submit(missing_pairs)
+        else:
+            predictions = await _inference_executor.run(
+                predict_uncached, model, tokenizer, missing_pairs, max_batch_size, max_batch_tokens
+            )
+        if predictions is None:
+            # 推論に失敗したペアだけ既定値にする（ルール段・キャッシュで決まった結果は残す）
+            logger.warning(f"[DepModel] Prediction failed for {len(missing_pairs)} pairs, using default predictions")
+            for positions in missing_positions.values():
+                for idx in positions:
+                    results[idx] = {"pred": 0, "confidence": 0.0}
+            return results
+        if cache is not None:
+            cache.put_many(missing_pairs, predictions)
+        for pair, prediction in zip(missing_pairs, predictions):
+            for idx in missing_positions[(pair.get("left", ""), pair.get("right", ""))]:
+                results[idx] = dict(prediction)
+
+    return results
+
+async def build_token_cache(pieces):
+    _, tokenizer = get_dep_model()
+    if tokenizer is None or not TOKEN_CACHE_ENABLED:
+        return None
+    return await _inference_executor.run(_build_token_cache, tokenizer, pieces)
+
+def _build_token_cache(tokenizer, pieces):
+    try:
+        token_cache = SentenceTokenCache(tokenizer, pieces)
+    except Exception as e:
+        logger.warning(f"[DepModel] Token cache disabled for this sentence: {str(e)}")
+        return None
+
+    if not token_cache.enabled:
+        logger.debug("[DepModel] Token cache layout check failed, tokenizing pair texts directly")
+        return None
+    return token_cache
+
+def encode_pairs(pairs, token_cache):
+    token_cache.prefetch([
+        tuple(pair[side]) for pair in pairs
+        if "encoding" not in pair and "left_span" in pair and "right_span" in pair
+        for side in ("left_span", "right_span")
+    ])
+    for pair in pairs:
+        if "encoding" not in pair and "left_span" in pair and "right_span" in pair:
+            pair["encoding"] = token_cache.encode_pair(pair["left_span"], pair["right_span"])
+    return pairs
+
+def predict_uncached(model, tokenizer, pairs, max_batch_size=None, max_batch_tokens=None):
     try:
 
-        input_texts = [f"{pair['left']} [SEP] {pair['right']}" for pair in pairs]
+        features = [pair.get("encoding") for pair in pairs]
+        to_encode = [idx for idx, feature in enumerate(features) if feature is None]
+        if to_encode:
+            input_texts = [f"{pairs[idx]['left']} [SEP] {pairs[idx]['right']}" for idx in to_encode]
 
-        inputs = tokenizer(
-            input_texts,
-            return_tensors="pt",
-            padding=True,
-            truncation=True,
-            max_length=512
-        )
+            encoded = tokenizer(
+                input_texts,
+                truncation=True,
+                max_length=512
+            )
+            for row, idx in enumerate(to_encode):
+                features[idx] = {key: encoded[key][row] for key in encoded.keys()}
+        lengths = [len(feature["input_ids"]) for feature in features]
+        batches = plan_length_buckets(lengths, max_batch_size, max_batch_tokens)
         
-        logger.debug(f"[DepModel] Batch processing {len(pairs)} pairs")
-
-        with torch.no_grad():
-            outputs = model(**inputs)
-
-        logits = outputs.logits
-        probs = torch.softmax(logits, dim=-1)
-
-        preds = torch.argmax(logits, dim=-1)
-        results = []
-        for i in range(len(pairs)):
-            pred = preds[i].item()
-            confidence = probs[i, pred].item()
-            results.append({
-                "pred": pred,
-                "confidence": confidence
-            })
+        logger.debug(f"[DepModel] Batch processing {len(pairs)} pairs in {len(batches)} length buckets")
+
+        results = [None] * len(pairs)
+        batch_stats = []
+        for batch in batches:
+            started = time.perf_counter()
+            inputs = tokenizer.pad(
+                [features[idx] for idx in batch],
+                padding=True,
+                return_tensors="pt"
+            )
+
+            with torch.no_grad():
+                outputs = model(**inputs)
+
+            logits = outputs.logits
+            probs = torch.softmax(logits, dim=-1)
+
+            preds = torch.argmax(logits, dim=-1)
+            for row, idx in enumerate(batch):
+                pred = preds[row].item()
+                confidence = probs[row, pred].item()
+                results[idx] = {
+                    "pred": pred,
+                    "confidence": confidence
+                }
+
+            stat = {
+                "size": len(batch),
+                "max_len": max(lengths[idx] for idx in batch),
+                "real_tokens": sum(lengths[idx] for idx in batch),
+                "padded_tokens": len(batch) * max(lengths[idx] for idx in batch),
+                "elapsed_ms": (time.perf_counter() - started) * 1000
+            }
+            stat["padding_efficiency"] = stat["real_tokens"] / stat["padded_tokens"]
+            batch_stats.append(stat)
+            logger.debug(f"[DepModel] Batch of {stat['size']} (max_len={stat['max_len']}) "
+                         f"in {stat['elapsed_ms']:.1f}ms, padding efficiency {stat['padding_efficiency']:.2f}")
+
+        record_batch_stats(batch_stats)
+        real_tokens = sum(stat["real_tokens"] for stat in batch_stats)
+        padded_tokens = sum(stat["padded_tokens"] for stat in batch_stats)
         
         logger.info(f"[DepModel] Batch prediction completed: {len(pairs)} pairs, "
                    f"pred=1: {sum(1 for r in results if r['pred'] == 1)}, "
-                   f"pred=0: {sum(1 for r in results if r['pred'] == 0)}")
+                   f"pred=0: {sum(1 for r in results if r['pred'] == 0)}, "
+                   f"{len(batches)} batches in {sum(stat['elapsed_ms'] for stat in batch_stats):.1f}ms, "
+                   f"padding efficiency {real_tokens / padded_tokens:.2f}")
         
         return results
     
     except Exception as e:
         logger.error(f"[DepModel] Batch prediction error: {str(e)}")
-        return [{"pred": 0, "confidence": 0.0} for _ in pairs]
+        return None
+
+def get_dep_model_health():
+    model, tokenizer = get_dep_model()
+    cache = get_prediction_cache()
+    batch_stats = get_batch_stats()
+    batch_stats.pop("last_call", None)
+    return {
+        "model_loaded": model is not None and tokenizer is not None,
+        "variant": _model_variant,
+        "inference": _inference_executor.stats(),
+        "scheduler": _scheduler.stats(),
+        "prediction_cache": cache.stats() if cache is not None else None,
+        "cascade": get_cascade_stats(),
+        "batching": batch_stats
+    }
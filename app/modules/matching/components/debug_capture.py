@@ -0,0 +1,142 @@
+"""
+トリプル抽出のサンプリング付きデバッグキャプチャ
+
+マッチごとにファイルを書き換える代わりに、サンプリングしたレコードを
+キュー経由で別スレッドからローテーション付き NDJSON に追記する。
+直近のレコードはメモリにも保持し、管理 API (/api/admin/debug-capture) から参照できる。
+
+  MATCH_DEBUG_SAMPLE_RATE  0.0 (既定: 無効) 〜 1.0
+  MATCH_DEBUG_PATH         ./logs/extract_triples_debug.ndjson
+  MATCH_DEBUG_MAX_BYTES    5 MB でローテーション
+  MATCH_DEBUG_BACKUPS      保持する世代数 (3)
+  MATCH_DEBUG_RECENT       メモリに保持する直近レコード数 (200)
+"""
+
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = float(os.environ.get("MATCH_DEBUG_SAMPLE_RATE", 0.0))
+SINK_PATH = os.environ.get("MATCH_DEBUG_PATH", os.path.join("logs", "extract_triples_debug.ndjson"))
+MAX_BYTES = int(os.environ.get("MATCH_DEBUG_MAX_BYTES", 5 * 1024 * 1024))
+BACKUPS = int(os.environ.get("MATCH_DEBUG_BACKUPS", 3))
+RECENT = int(os.environ.get("MATCH_DEBUG_RECENT", 200))
+QUEUE_SIZE = 10000
+
+class DebugCapture:
+    def __init__(self, sample_rate=0.0, path=None, max_bytes=MAX_BYTES, backups=BACKUPS, recent=RECENT):
+        self.sample_rate = sample_rate
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.recent = deque(maxlen=recent)
+        self._lock = threading.Lock()
+        self._queue = None
+        self._listener = None
+        self.seen = 0
+        self.captured = 0
+        self.dropped = 0
+
+    @property
+    def enabled(self):
+        return self.sample_rate > 0
+
+    def configure(self, sample_rate=None, path=None):
+        with self._lock:
+            if path is not None and path != self.path:
+                self._stop_sink()
+                self.path = path
+            if sample_rate is not None:
+                if not 0.0 <= sample_rate <= 1.0:
+                    raise ValueError("sample_rate must be between 0 and 1")
+                self.sample_rate = sample_rate
+
+    def capture(self, kind: str, record: Dict):
+        if self.sample_rate <= 0:
+            return
+        self.seen += 1
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+
+        entry = {"ts": time.time(), "kind": kind, **record}
+        self.recent.append(entry)
+        self.captured += 1
+
+        if not self.path:
+            return
+        try:
+            line = json.dumps(entry, ensure_ascii=False, default=str)
+            self._sink().put_nowait(logging.makeLogRecord({"msg": line, "levelno": logging.INFO}))
+        except queue.Full:
+            self.dropped += 1
+        except Exception as e:
+            self.dropped += 1
+            logger.debug(f"[DebugCapture] Could not queue record: {e}")
+
+    def query(self, limit: int = 50, kind: Optional[str] = None, pattern: Optional[str] = None) -> List[Dict]:
+        entries = [
+            entry for entry in list(self.recent)
+            if (kind is None or entry.get("kind") == kind)
+            and (pattern is None or entry.get("pattern") == pattern)
+        ]
+        return entries[-limit:] if limit else entries
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "path": self.path,
+            "max_bytes": self.max_bytes,
+            "backups": self.backups,
+            "seen": self.seen,
+            "captured": self.captured,
+            "dropped": self.dropped,
+            "recent": len(self.recent),
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0
+        }
+
+    def close(self):
+        with self._lock:
+            self._stop_sink()
+
+    def _sink(self):
+        if self._queue is not None:
+            return self._queue
+        with self._lock:
+            if self._queue is None:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                handler = logging.handlers.RotatingFileHandler(
+                    self.path, maxBytes=self.max_bytes, backupCount=self.backups, encoding="utf-8"
+                )
+                handler.setFormatter(logging.Formatter("%(message)s"))
+
+                # ファイル書き込みは QueueListener のスレッドで行う（呼び出し側はキューに積むだけ）
+                sink = queue.Queue(QUEUE_SIZE)
+                self._listener = logging.handlers.QueueListener(sink, handler)
+                self._listener.start()
+                self._queue = sink
+        return self._queue
+
+    def _stop_sink(self):
+        if self._listener is not None:
+            self._listener.stop()
+            for handler in self._listener.handlers:
+                handler.close()
+        self._listener = None
+        self._queue = None
+
+_capture = DebugCapture(SAMPLE_RATE, SINK_PATH)
+
+def get_debug_capture() -> DebugCapture:
+    return _capture
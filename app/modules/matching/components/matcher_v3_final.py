@@ -4,7 +4,7 @@ Matcher V3 - 最終版：CKY precomputed flat_sequence を使用
 設計原則:
   1. CKY で各ノードの flat_sequence を事前計算（pred=0で止まった構造を反映）
   2. マッチャーは flat_sequence をそのまま使用
-  3. パターンを線形トークンに分解
+  3. パターンを線形トークンに分解（pattern_compiler で事前コンパイル）
   4. 線形マッチング：slot と literal を順に消費
   5. マッチしたらバインディングを抽出
 
@@ -14,11 +14,17 @@ Matcher V3 - 最終版：CKY precomputed flat_sequence を使用
   - 拡張性：flat_sequence はマッチング以外にも利用可能
 """
 
-import re
 import logging
 import yaml
 import os
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple, Union
+
+from .debug_capture import get_debug_capture
+from .pattern_automaton import PatternAutomaton
+from .pattern_compiler import (
+    LITERAL, SLOT, WILDCARD_CONNECTIVE, CompiledPattern, SlotSpec, compile_pattern
+)
+from .tree_index import TreeIndex
 
 logger = logging.getLogger(__name__)
 
@@ -38,11 +44,12 @@ class PatternMatcherV3Final:
         self.logger = logger
 
         self.parallel_connectives = self._load_parallel_connectives()
+        self.prefilter_stats = None
 
     def match_and_extract(
         self,
         tree: Dict,
-        pattern_str: str,
+        pattern: Union[CompiledPattern, str],
         pattern_id: Optional[int] = None
     ) -> Optional[Dict]:
         """
@@ -50,7 +57,7 @@ class PatternMatcherV3Final:
         
         Args:
             tree: CKY が生成したツリー（flat_sequence を含む）
-            pattern_str: パターン文字列 "[X1]は[X2]を[Y1]" など
+            pattern: コンパイル済みパターン（文字列 "[X1]は[X2]を[Y1]" なら compile_pattern を通す）
             pattern_id: パターンID（ロギング用）
         
         Returns:
@@ -71,16 +78,17 @@ class PatternMatcherV3Final:
                 self.logger.debug(f"[MatcherV3F] Tree span: {tree.get('span', 'unknown')}, text: '{tree.get('text', 'unknown')}'")
                 return None
 
-            pattern_tokens = self._tokenize_pattern(pattern_str)
-            if not pattern_tokens:
+            compiled = compile_pattern(pattern) if isinstance(pattern, str) else pattern
+            pattern_str = compiled.pattern
+            if not compiled.tokens:
                 self.logger.warning(f"[MatcherV3F] Pattern {pattern_id}: No tokens in pattern")
                 return None
 
-            self.logger.debug(f"[MatcherV3F] Pattern {pattern_id}: tokens={len(pattern_tokens)}, flat_seq len={len(flat_seq)}")
-            self.logger.debug(f"[MatcherV3F] Pattern tokens: {pattern_tokens}")
+            self.logger.debug(f"[MatcherV3F] Pattern {pattern_id}: tokens={len(compiled.tokens)}, flat_seq len={len(flat_seq)}")
+            self.logger.debug(f"[MatcherV3F] Pattern tokens: {compiled.tokens}")
             self.logger.debug(f"[MatcherV3F] Flat sequence: {flat_seq}")
 
-            match_result = self._try_match(pattern_tokens, flat_seq, pattern_str)
+            match_result = self._try_match(compiled, flat_seq)
             if not match_result:
                 self.logger.debug(f"[MatcherV3F] Pattern {pattern_id}: NO MATCH")
                 return None
@@ -88,7 +96,7 @@ class PatternMatcherV3Final:
             bindings = match_result["bindings"]
             self.logger.debug(f"[MatcherV3F] Pattern {pattern_id}: Bindings = {bindings}")
             
-            triples = self._extract_triples(bindings, pattern_str, tree)
+            triples = self._extract_triples(bindings, compiled, tree)
             self.logger.debug(f"[MatcherV3F] Pattern {pattern_id}: Triples = {triples}")
 
             self.logger.info(f"[MatcherV3F] Pattern {pattern_id}: MATCH - {bindings}")
@@ -104,76 +112,77 @@ class PatternMatcherV3Final:
             self.logger.error(f"[MatcherV3F] Error: {e}", exc_info=True)
             return None
 
-    def _tokenize_pattern(self, pattern_str: str) -> List[Dict]:
-        """
-        パターンを [slot] と literal に分割
-        
-        例: "[X1]は[X2]を[Y1]" →
-            [
-              {type: "slot", name: "X1"},
-              {type: "literal", chars: ["は"]},
-              {type: "slot", name: "X2"},
-              {type: "literal", chars: ["を"]},
-              {type: "slot", name: "Y1"}
-            ]
-        
-        ★特別な処理:
-        - "&" は wildcard トークンとして分離
-          "[X1]&[X2]" → [{slot:X1}, {wildcard}, {slot:X2}]
-        - "*N" プレフィックスは親参照として保存
-          "[*1Y1]" → {type: "slot", name: "Y1", parent_depth: 1}
+    def match_all(
+        self,
+        tree: Dict,
+        automaton: PatternAutomaton,
+        pattern_ids: Optional[set] = None
+    ) -> Dict[str, Dict]:
         """
-        tokens = []
-        parts = re.split(r'(\[[^\]]+\])', pattern_str)
+        automaton の全パターンを flat_sequence の 1 回の走査でマッチング
 
-        for part in parts:
-            if not part:
-                continue
+        リテラル署名の事前フィルタでマッチし得ないパターンを除外してから走査し、
+        候補（マッチする開始位置が見つかったパターン）だけバインディングとトリプルを抽出する。
+        各結果は match_and_extract と同じ形式。フィルタの除外率は self.prefilter_stats に残す。
 
-            if re.match(r'\[[^\]]+\]', part):
+        Args:
+            tree: CKY が生成したツリー（flat_sequence を含む）
+            automaton: PatternAutomaton
+            pattern_ids: 対象を絞る場合のパターンID集合（None なら全パターン）
 
-                slot_content = part[1:-1]
+        Returns:
+            {pattern_id: {"match": True, "pattern": ..., "bindings": ..., "triples": ...}}
+        """
+        try:
+            flat_seq = tree.get("flat_sequence")
+            if not flat_seq:
+                self.logger.warning(f"[MatcherV3F] No flat_sequence in tree")
+                return {}
 
-                parent_depth = 0
-                if slot_content.startswith('*'):
-                    match = re.match(r'\*(\d+)(.+)', slot_content)
-                    if match:
-                        parent_depth = int(match.group(1))
-                        slot_content = match.group(2)
-                
-                slot_name = slot_content.split('-')[0] if '-' in slot_content else slot_content
-                tag = slot_content.split('-')[1] if '-' in slot_content else None
-
-                tokens.append({
-                    "type": "slot",
-                    "name": slot_name,
-                    "tag": tag,
-                    "parent_depth": parent_depth
-                })
-            else:
+            allowed, literal_chars, self.prefilter_stats = automaton.prefilter.filter(flat_seq, self)
+            if pattern_ids is not None:
+                allowed &= automaton.prefilter.mask_of(pattern_ids)
+            candidates = automaton.scan(flat_seq, self, allowed, literal_chars)
+        except Exception as e:
+            self.logger.error(f"[MatcherV3F] Error: {e}", exc_info=True)
+            return {}
 
-                if part:
+        self.logger.info(
+            f"[MatcherV3F] Prefilter rejected {self.prefilter_stats['rejected']}/{self.prefilter_stats['patterns']} patterns, "
+            f"{len(candidates)} candidates"
+        )
 
-                    for char in part:
-                        if char == "&":
-                            tokens.append({
-                                "type": "wildcard_connective"
-                            })
-                        else:
+        # ツリー距離の索引は候補パターン間で共有（最初に距離を引くときに構築）
+        tree_index = TreeIndex(tree, self._extract_core_text)
 
-                            tokens.append({
-                                "type": "literal",
-                                "chars": [char]
-                            })
+        results = {}
+        for pattern_id, start_pos in candidates.items():
+            try:
+                compiled = automaton.patterns[pattern_id]
+                match_result = self._match_from_position(compiled, flat_seq, start_pos)
+                if not match_result:
+                    continue
+
+                bindings = match_result["bindings"]
+                triples = self._extract_triples(bindings, compiled, tree, tree_index)
+                self.logger.info(f"[MatcherV3F] Pattern {pattern_id}: MATCH - {bindings}")
 
-        return tokens
+                results[pattern_id] = {
+                    "match": True,
+                    "pattern": compiled.pattern,
+                    "bindings": bindings,
+                    "triples": triples
+                }
+            except Exception as e:
+                self.logger.error(f"[MatcherV3F] Error: {e}", exc_info=True)
+        return results
 
-    def _try_match(self, pattern_tokens: List[Dict], flat_seq: List[Dict], pattern_str: str = "") -> Optional[Dict]:
+    def _try_match(self, compiled: CompiledPattern, flat_seq: List[Dict]) -> Optional[Dict]:
         """
         ウィンドウマッチング：各位置から試行
         """
         for start_pos in range(len(flat_seq)):
-            result = self._match_from_position(pattern_tokens, flat_seq, start_pos, pattern_str)
+            result = self._match_from_position(compiled, flat_seq, start_pos)
             if result:
                 return result
 
@@ -181,10 +190,9 @@ class PatternMatcherV3Final:
 
     def _match_from_position(
         self,
-        pattern_tokens: List[Dict],
+        compiled: CompiledPattern,
         flat_seq: List[Dict],
-        start_pos: int,
-        pattern_str: str = ""
+        start_pos: int
     ) -> Optional[Dict]:
         """
         指定位置からマッチング試行
@@ -199,20 +207,11 @@ class PatternMatcherV3Final:
         seq_pos = start_pos
         current_slot_name = None
 
-        slot_info = {}
-        if pattern_str:
-            slots = re.findall(r'\[([^\]]+)\]', pattern_str)
-            for slot_expr in slots:
-                parts = slot_expr.split('-')
-                slot_name = parts[0].strip()
-                tag = parts[1].strip() if len(parts) > 1 else None
-                slot_info[slot_name] = {"tag": tag}
-
-        for token in pattern_tokens:
-            if token["type"] == "slot":
+        for token in compiled.tokens:
+            if token.kind == SLOT:
 
-                slot_name = token["name"]
-                parent_depth = token.get("parent_depth", 0)
+                slot_name = token.name
+                parent_depth = token.parent_depth
                 core_texts = []
 
                 while seq_pos < len(flat_seq) and flat_seq[seq_pos]["type"] == "core":
@@ -229,7 +228,7 @@ class PatternMatcherV3Final:
 
                 slot_value = "".join(core_texts)
 
-                tag = slot_info.get(slot_name, {}).get("tag")
+                tag = token.match_tag
                 if tag == "サ変" and not self._is_shen_compatible(slot_value):
                     self.logger.debug(f"[Match] Fail: slot '{slot_name}' = '{slot_value}' is not サ変 compatible")
                     return None
@@ -245,7 +244,7 @@ class PatternMatcherV3Final:
                 
                 current_slot_name = slot_name
 
-            elif token["type"] == "wildcard_connective":
+            elif token.kind == WILDCARD_CONNECTIVE:
 
                 if seq_pos >= len(flat_seq):
                     self.logger.debug(f"[Match] Fail: wildcard_connective at end of sequence")
@@ -265,27 +264,27 @@ class PatternMatcherV3Final:
                     self.logger.debug(f"[Match] Fail: wildcard_connective - '{func_text}' is not a connective (type={seq_type})")
                     return None
 
-            elif token["type"] == "literal":
+            elif token.kind == LITERAL:
 
-                for char in token["chars"]:
-                    if seq_pos >= len(flat_seq):
-                        self.logger.debug(f"[Match] Fail: literal '{char}' - sequence ended")
-                        return None
+                char = token.char
+                if seq_pos >= len(flat_seq):
+                    self.logger.debug(f"[Match] Fail: literal '{char}' - sequence ended")
+                    return None
 
-                    if flat_seq[seq_pos]["type"] != "func":
-                        self.logger.debug(f"[Match] Fail: literal '{char}' - expected func, got {flat_seq[seq_pos]['type']}")
-                        return None
+                if flat_seq[seq_pos]["type"] != "func":
+                    self.logger.debug(f"[Match] Fail: literal '{char}' - expected func, got {flat_seq[seq_pos]['type']}")
+                    return None
 
-                    func_text = flat_seq[seq_pos]["text"]
+                func_text = flat_seq[seq_pos]["text"]
 
-                    if self._is_connective_match(char, func_text):
-                        seq_pos += 1
-                    elif char in func_text:
+                if self._is_connective_match(char, func_text):
+                    seq_pos += 1
+                elif char in func_text:
 
-                        seq_pos += 1
-                    else:
-                        self.logger.debug(f"[Match] Fail: literal '{char}' not in func '{func_text}' (connectives also checked)")
-                        return None
+                    seq_pos += 1
+                else:
+                    self.logger.debug(f"[Match] Fail: literal '{char}' not in func '{func_text}' (connectives also checked)")
+                    return None
 
         self.logger.debug(f"[Match] Success: bindings={bindings}, consumed seq[{start_pos}:{seq_pos}]")
         return {
@@ -297,8 +296,9 @@ class PatternMatcherV3Final:
     def _extract_triples(
         self,
         bindings: Dict,
-        pattern_str: str,
-        tree: Dict = None
+        compiled: CompiledPattern,
+        tree: Dict = None,
+        tree_index: Optional[TreeIndex] = None
     ) -> List[Tuple[str, str, str]]:
         """
         バインディングからトリプル抽出
@@ -314,59 +314,31 @@ class PatternMatcherV3Final:
         ★拡張機能:
           - [Y-サ変]: Y の値が サ変可能か確認
           - [*1Y1]: 親ノード（兄弟ノードが左にある場合）の Y1 を参照
+
+        tree_index は Y-X 間のツリー距離用（省略時はここで 1 度だけ作り、全 Y×X で共有）
         """
+        pattern_str = compiled.pattern
         self.logger.debug(f"[ExtractTriples] ===== START =====")
         self.logger.debug(f"[ExtractTriples] Pattern: {pattern_str}")
         self.logger.debug(f"[ExtractTriples] All bindings: {bindings}")
 
-        import json
-        debug_info = {
-            "pattern": pattern_str,
-            "tree_exists": tree is not None,
-            "tree_span": tree.get("span") if tree else None,
-            "bindings": bindings
-        }
-        try:
-            with open("debug_extract_triples.json", "w", encoding="utf-8") as f:
-                json.dump(debug_info, f, indent=2, ensure_ascii=False)
-        except Exception as e:
-            self.logger.debug(f"[ExtractTriples] Could not write debug file: {e}")
-        
         triples = []
 
-        slots = re.findall(r'\[([^\]]+)\]', pattern_str)
-        slot_info = {}
-        slot_bases = []
-        
-        for slot_expr in slots:
-            parts = slot_expr.split('-')
-            base_name = parts[0].strip()
-            tag = parts[1].strip() if len(parts) > 1 else None
-
-            parent_depth = 0
-            if base_name.startswith('*'):
-                match = re.match(r'\*(\d+)(.+)', base_name)
-                if match:
-                    parent_depth = int(match.group(1))
-                    base_name = match.group(2)
-            
-            slot_info[base_name] = {
-                "base": base_name,
-                "tag": tag,
-                "parent_depth": parent_depth
-            }
-            slot_bases.append(base_name)
+        slot_info = compiled.slot_specs
+        slot_bases = compiled.slots
+        y_slots = compiled.y_slots
+        x_slots = compiled.x_slots
 
-        y_slots = [s for s in slot_bases if s.startswith('Y')]
-        x_slots = [s for s in slot_bases if s.startswith('X')]
+        if tree and tree_index is None:
+            tree_index = TreeIndex(tree, self._extract_core_text)
 
         parent_bindings = {}
-        if tree and any(info.get("parent_depth", 0) > 0 for info in slot_info.values()):
+        if tree and compiled.has_parent_refs:
             parent_bindings = self._get_parent_slot_values(tree, slot_info, bindings)
 
         for y_slot in y_slots:
 
-            if slot_info[y_slot].get("parent_depth", 0) > 0:
+            if slot_info[y_slot].parent_depth > 0:
                 y_text = parent_bindings.get(y_slot)
             else:
                 y_text = bindings.get(y_slot)
@@ -379,7 +351,7 @@ class PatternMatcherV3Final:
             distances = []
             for x_slot in x_slots:
 
-                if slot_info[x_slot].get("parent_depth", 0) > 0:
+                if slot_info[x_slot].parent_depth > 0:
                     x_text = parent_bindings.get(x_slot)
                 else:
                     x_text = bindings.get(x_slot)
@@ -389,7 +361,7 @@ class PatternMatcherV3Final:
 
                 if tree:
                     self.logger.debug(f"[ExtractTriples] Computing distance: Y='{y_text}', X='{x_text}'")
-                    distance_from_pred = self._calculate_tree_distance_v3(tree, y_text, x_text, bindings)
+                    distance_from_pred = self._calculate_tree_distance_v3(tree, y_text, x_text, bindings, tree_index)
                     if distance_from_pred is not None:
                         self.logger.info(f"[ExtractTriples] X={x_slot}({x_text}): tree distance={distance_from_pred}")
                     else:
@@ -430,12 +402,23 @@ class PatternMatcherV3Final:
                 self.logger.debug(f"[ExtractTriples] Y={y_slot}({y_text}), O={o_text}, S=φ")
                 triples.append(("φ", y_text, o_text))
 
+        debug_capture = get_debug_capture()
+        if debug_capture.enabled:
+            debug_capture.capture("extract_triples", {
+                "pattern": pattern_str,
+                "tree_exists": tree is not None,
+                "tree_span": tree.get("span") if tree else None,
+                "tree_text": tree.get("text") if tree else None,
+                "bindings": bindings,
+                "triples": triples
+            })
+
         return triples
 
     def _get_parent_slot_values(
         self,
         tree: Dict,
-        slot_info: Dict,
+        slot_info: Dict[str, SlotSpec],
         bindings: Dict
     ) -> Dict[str, str]:
         """
@@ -466,7 +449,7 @@ class PatternMatcherV3Final:
             node_text = node.get("text", "")
 
             for slot_name, info in slot_info.items():
-                if info.get("parent_depth", 0) > 0:
+                if info.parent_depth > 0:
 
                     if slot_name in bindings:
 
@@ -904,7 +887,8 @@ class PatternMatcherV3Final:
         tree: Dict,
         y_text: str,
         x_text: str,
-        bindings: Dict = None
+        bindings: Dict = None,
+        tree_index: Optional[TreeIndex] = None
     ) -> Optional[int]:
         """
         V3: Y を根とした距離計算
@@ -919,6 +903,7 @@ class PatternMatcherV3Final:
             y_text: Y の値（根）
             x_text: X の値（対象）
             bindings: バインディング情報
+            tree_index: tree の TreeIndex（同じツリーで繰り返し呼ぶ場合に使い回す）
         
         Returns:
             Y からの子孫距離
@@ -929,32 +914,14 @@ class PatternMatcherV3Final:
             self.logger.debug(f"[TreeDist-v3] FAILED: tree is None or not dict")
             return None
 
-        parent_map, span_map, node_registry = self._build_tree_parent_map(tree)
-        
-        if not node_registry:
-            return None
+        if tree_index is None:
+            tree_index = TreeIndex(tree, self._extract_core_text)
 
-        def find_best_node(target_text):
-            target_core = self._extract_core_text(target_text)
-            
-            for nid, node in node_registry.items():
-                node_text = node.get("text", "")
-                node_core = self._extract_core_text(node_text)
-                
-                if node_core == target_core:
-                    return nid
-                if node_text == target_text:
-                    return nid
-            
-            for nid, node in node_registry.items():
-                node_text = node.get("text", "")
-                if target_text in node_text:
-                    return nid
-            
+        if not len(tree_index):
             return None
-        
-        y_nid = find_best_node(y_text)
-        x_nid = find_best_node(x_text)
+
+        y_nid = tree_index.find_node(y_text)
+        x_nid = tree_index.find_node(x_text)
         
         self.logger.debug(f"[TreeDist-v3] Found: y_nid={y_nid}, x_nid={x_nid}")
         
@@ -962,59 +929,10 @@ class PatternMatcherV3Final:
             self.logger.debug(f"[TreeDist-v3] Nodes not found")
             return None
 
-        def is_descendant(parent_id, child_id, parent_map):
-            """child_id が parent_id の子孫かを確認"""
-            current = child_id
-            while current in parent_map:
-                current = parent_map[current]
-                if current == parent_id:
-                    return True
-            return False
-
-        if is_descendant(y_nid, x_nid, parent_map):
-
-            depth = 0
-            current = x_nid
-            while current != y_nid and current in parent_map:
-                current = parent_map[current]
-                depth += 1
-            
-            self.logger.debug(f"[TreeDist-v3] X is descendant of Y: depth={depth}")
-            return depth
-
-        y_ancestors = [y_nid]
-        current = y_nid
-        while current in parent_map:
-            current = parent_map[current]
-            y_ancestors.append(current)
+        # X が Y の子孫なら LCA は Y 自身になり、距離は深さの差
+        distance = tree_index.distance(y_nid, x_nid)
         
-        x_ancestors = [x_nid]
-        current = x_nid
-        while current in parent_map:
-            current = parent_map[current]
-            x_ancestors.append(current)
-
-        y_set = set(y_ancestors)
-        common_ancestor = None
-        x_depth_to_lca = 0
-        
-        for i, anc in enumerate(x_ancestors):
-            if anc in y_set:
-                common_ancestor = anc
-                x_depth_to_lca = i
-                break
-        
-        if common_ancestor is None:
-            self.logger.debug(f"[TreeDist-v3] No common ancestor")
-            return None
-
-        y_depth_to_lca = y_ancestors.index(common_ancestor)
-
-        distance = y_depth_to_lca + x_depth_to_lca
-        
-        self.logger.debug(
-            f"[TreeDist-v3] Y->LCA={y_depth_to_lca}, X->LCA={x_depth_to_lca}, total={distance}"
-        )
+        self.logger.debug(f"[TreeDist-v3] y_nid={y_nid}, x_nid={x_nid}, total={distance}")
         
         return distance
 
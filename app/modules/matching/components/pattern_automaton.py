@@ -0,0 +1,141 @@
+"""
+複数パターン同時マッチング：コンパイル済みパターンの骨格 (slot / literal / &) をトライにまとめる
+
+  [X1]は[Y1]     ┐
+  [X2]は[Y3]した ┼ root ─slot─ "は" ─slot─ (終端: 0, 1) ─"し"─ "た" ─ (終端: 2)
+  [X1]は[Y2]した ┘
+
+スロット名や親参照はマッチ可否に影響しないので骨格から外し、サ変タグだけを辺に残す。
+flat_sequence を開始位置ごとに 1 回たどれば、マッチし得る全パターンとその開始位置が得られる。
+（スロットは core の連続を最長で取るので、開始位置が決まれば遷移は決定的）
+"""
+
+from typing import Dict, List, Optional, Set
+
+from .pattern_compiler import LITERAL, SLOT, CompiledPattern, compile_struct_groups
+from .pattern_prefilter import LiteralSignatureIndex
+
+class _Node:
+    __slots__ = ("children", "terminals")
+
+    def __init__(self):
+        self.children = {}
+        self.terminals = []
+
+def _edge_key(token):
+    if token.kind == SLOT:
+        return (SLOT, token.match_tag == "サ変")
+    if token.kind == LITERAL:
+        return (LITERAL, token.char)
+    return (token.kind,)
+
+class PatternAutomaton:
+    def __init__(self, compiled_patterns: Optional[Dict[str, CompiledPattern]] = None):
+        self.root = _Node()
+        self.patterns = {}
+        self.nodes = 1
+        self.prefilter = LiteralSignatureIndex()
+        for pattern_id, compiled in (compiled_patterns or {}).items():
+            self.add(pattern_id, compiled)
+
+    def add(self, pattern_id: str, compiled: CompiledPattern):
+        if not compiled.tokens:
+            return
+        node = self.root
+        for token in compiled.tokens:
+            key = _edge_key(token)
+            child = node.children.get(key)
+            if child is None:
+                child = node.children[key] = _Node()
+                self.nodes += 1
+            node = child
+        node.terminals.append(pattern_id)
+        self.patterns[pattern_id] = compiled
+        self.prefilter.add(pattern_id, compiled)
+
+    def scan(
+        self,
+        flat_seq: List[Dict],
+        matcher,
+        pattern_mask: Optional[int] = None,
+        literal_chars: Optional[Set[str]] = None
+    ) -> Dict[str, int]:
+        """
+        {pattern_id: 最初にマッチする開始位置}
+
+        matcher は並列接続詞・サ変の判定に使う (PatternMatcherV3Final)
+        pattern_mask / literal_chars は事前フィルタの結果（対象パターンのマスクと、ツリーで満たせるリテラル文字）
+        """
+        n = len(flat_seq)
+        bits = self.prefilter.bits
+        types = [item["type"] for item in flat_seq]
+        texts = [item["text"] for item in flat_seq]
+
+        # core_end[p]: p から始まる core の連続の終端
+        core_end = list(range(n + 1))
+        for p in range(n - 1, -1, -1):
+            if types[p] == "core":
+                core_end[p] = core_end[p + 1]
+
+        shen = {}
+        first_start = {}
+        visited = set()
+
+        for start in range(n):
+            stack = [(self.root, start)]
+            while stack:
+                node, pos = stack.pop()
+                # 同じ (ノード, 位置) に早い開始位置から到達済みなら、その先も記録済み
+                state = (id(node), pos)
+                if state in visited:
+                    continue
+                visited.add(state)
+
+                for pattern_id in node.terminals:
+                    if pattern_id not in first_start and (pattern_mask is None or pattern_mask & bits[pattern_id]):
+                        first_start[pattern_id] = start
+
+                for key, child in node.children.items():
+                    kind = key[0]
+                    if kind == SLOT:
+                        end = core_end[pos]
+                        if end == pos:
+                            continue
+                        if key[1]:
+                            compatible = shen.get((pos, end))
+                            if compatible is None:
+                                compatible = shen[(pos, end)] = matcher._is_shen_compatible("".join(texts[pos:end]))
+                            if not compatible:
+                                continue
+                        stack.append((child, end))
+                    elif kind == LITERAL:
+                        char = key[1]
+                        if literal_chars is not None and char not in literal_chars:
+                            continue
+                        if pos >= n or types[pos] != "func":
+                            continue
+                        if matcher._is_connective_match(char, texts[pos]) or char in texts[pos]:
+                            stack.append((child, pos + 1))
+                    else:
+                        if pos >= n or types[pos] not in ("func", "core"):
+                            continue
+                        if matcher._is_any_connective(texts[pos]):
+                            stack.append((child, pos + 1))
+
+        return first_start
+
+    def stats(self) -> Dict:
+        return {"patterns": len(self.patterns), "nodes": self.nodes}
+
+_automata = {}
+
+def get_pattern_automaton(struct_groups: Dict) -> PatternAutomaton:
+    """struct_groups ごとに 1 度だけ構築（STRUCT_GROUPS は再ロード時に差し替えられる）"""
+    cached = _automata.get(id(struct_groups))
+    if cached is not None and cached[0] is struct_groups and cached[1] == len(struct_groups):
+        return cached[2]
+
+    automaton = PatternAutomaton(compile_struct_groups(struct_groups))
+    _automata.clear()
+    _automata[id(struct_groups)] = (struct_groups, len(struct_groups), automaton)
+    return automaton
@@ -0,0 +1,159 @@
+"""
+パターンコンパイラ：representative_pattern を一度だけ解析して不変オブジェクトにする
+
+  "[X1]は[*1Y1-サ変]を" →
+    CompiledPattern(
+      tokens=(slot X1, literal は, slot Y1 (parent_depth=1), literal を),
+      slots=("X1", "Y1"),
+      slot_specs={"X1": SlotSpec(...), "Y1": SlotSpec(tag="サ変", parent_depth=1)},
+      literals=("は", "を"),
+      ...
+    )
+
+マッチャー (PatternMatcherV3Final) はコンパイル済みパターンだけを扱う。
+"""
+
+import re
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Dict, Mapping, NamedTuple, Optional, Tuple
+
+SLOT = "slot"
+LITERAL = "literal"
+WILDCARD_CONNECTIVE = "wildcard_connective"
+
+_SLOT_SPLIT = re.compile(r'(\[[^\]]+\])')
+_SLOT_FIND = re.compile(r'\[([^\]]+)\]')
+_PARENT_REF = re.compile(r'\*(\d+)(.+)')
+
+class PatternToken(NamedTuple):
+    """
+    線形マッチング用トークン
+
+    kind:
+      slot                : core 要素を連続取得（name / parent_depth / match_tag）
+      literal             : func 要素に char が含まれるか（並列接続詞も可）
+      wildcard_connective : func/core 要素が任意の並列接続詞か（パターンの &）
+    """
+    kind: str
+    name: Optional[str] = None
+    tag: Optional[str] = None
+    parent_depth: int = 0
+    match_tag: Optional[str] = None
+    char: Optional[str] = None
+
+class SlotSpec(NamedTuple):
+    base: str
+    tag: Optional[str]
+    parent_depth: int
+
+class CompiledPattern(NamedTuple):
+    pattern: str
+    tokens: Tuple[PatternToken, ...]
+    slots: Tuple[str, ...]
+    slot_specs: Mapping[str, SlotSpec]
+    y_slots: Tuple[str, ...]
+    x_slots: Tuple[str, ...]
+    literals: Tuple[str, ...]
+    has_parent_refs: bool
+
+def _tokenize(pattern_str: str):
+    """
+    "[X1]&[*1Y1-サ変]は" → slot / wildcard_connective / literal (1 文字ずつ)
+    """
+    tokens = []
+    for part in _SLOT_SPLIT.split(pattern_str):
+        if not part:
+            continue
+
+        if _SLOT_SPLIT.match(part):
+            slot_content = part[1:-1]
+
+            parent_depth = 0
+            if slot_content.startswith('*'):
+                match = _PARENT_REF.match(slot_content)
+                if match:
+                    parent_depth = int(match.group(1))
+                    slot_content = match.group(2)
+
+            slot_name = slot_content.split('-')[0] if '-' in slot_content else slot_content
+            tag = slot_content.split('-')[1] if '-' in slot_content else None
+            tokens.append((slot_name, tag, parent_depth))
+        else:
+            for char in part:
+                tokens.append(char)
+    return tokens
+
+def _slot_specs(pattern_str: str):
+    """トリプル抽出用のスロット情報（*N を外した base 名ごと、後勝ち）"""
+    specs = {}
+    bases = []
+    for slot_expr in _SLOT_FIND.findall(pattern_str):
+        parts = slot_expr.split('-')
+        base_name = parts[0].strip()
+        tag = parts[1].strip() if len(parts) > 1 else None
+
+        parent_depth = 0
+        if base_name.startswith('*'):
+            match = _PARENT_REF.match(base_name)
+            if match:
+                parent_depth = int(match.group(1))
+                base_name = match.group(2)
+
+        specs[base_name] = SlotSpec(base_name, tag, parent_depth)
+        bases.append(base_name)
+    return specs, bases
+
+def _match_tags(pattern_str: str) -> Dict[str, Optional[str]]:
+    # マッチ時のタグ判定はスロット式の '-' より前をそのまま名前として引く
+    # （"[*1Y1-サ変]" は "*1Y1" になり、スロット名 "Y1" とは一致しない）
+    match_tags = {}
+    for slot_expr in _SLOT_FIND.findall(pattern_str):
+        parts = slot_expr.split('-')
+        match_tags[parts[0].strip()] = parts[1].strip() if len(parts) > 1 else None
+    return match_tags
+
+@lru_cache(maxsize=None)
+def compile_pattern(pattern_str: str) -> CompiledPattern:
+    match_tags = _match_tags(pattern_str)
+
+    tokens = []
+    literals = []
+    for item in _tokenize(pattern_str):
+        if isinstance(item, tuple):
+            name, tag, parent_depth = item
+            tokens.append(PatternToken(SLOT, name=name, tag=tag, parent_depth=parent_depth,
+                                       match_tag=match_tags.get(name)))
+        elif item == "&":
+            tokens.append(PatternToken(WILDCARD_CONNECTIVE))
+        else:
+            tokens.append(PatternToken(LITERAL, char=item))
+            literals.append(item)
+
+    specs, bases = _slot_specs(pattern_str)
+    return CompiledPattern(
+        pattern=pattern_str,
+        tokens=tuple(tokens),
+        slots=tuple(bases),
+        slot_specs=MappingProxyType(specs),
+        y_slots=tuple(s for s in bases if s.startswith('Y')),
+        x_slots=tuple(s for s in bases if s.startswith('X')),
+        literals=tuple(literals),
+        has_parent_refs=any(spec.parent_depth > 0 for spec in specs.values())
+    )
+
+def pattern_string(pattern_item) -> str:
+    if isinstance(pattern_item, str):
+        return pattern_item
+    if isinstance(pattern_item, dict):
+        return pattern_item.get("representative_pattern", "") or ""
+    return ""
+
+def compile_struct_groups(struct_groups: Dict) -> Dict[str, CompiledPattern]:
+    """struct_groups の各 representative_pattern をコンパイル（空のパターンは含めない）"""
+    compiled = {}
+    for pattern_id, pattern_item in struct_groups.items():
+        pattern_str = pattern_string(pattern_item)
+        if pattern_str:
+            compiled[str(pattern_id)] = compile_pattern(pattern_str)
+    return compiled
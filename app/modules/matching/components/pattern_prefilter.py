@@ -0,0 +1,73 @@
+"""
+リテラル署名による事前フィルタ
+
+各パターンが必要とするリテラル文字と & (並列接続詞ワイルドカード) からパターンへの転置インデックス。
+ツリーの func 要素に現れない文字を要求するパターンはマッチし得ないので、走査前に除外する。
+
+  "に" → {0, 4, ...}
+  "さ" → {0, 4, 7, ...}
+  "&"  → {100, 101, ...}
+
+パターン集合はパターンごとに 1 ビットを割り当てた整数で持つ（1 万パターンでも和集合が軽い）
+"""
+
+from typing import Dict, Iterable, List, Set, Tuple
+
+from .pattern_compiler import WILDCARD_CONNECTIVE, CompiledPattern
+
+class LiteralSignatureIndex:
+    def __init__(self):
+        self.bits = {}
+        self.by_literal = {}
+        self.by_wildcard = 0
+        self.all_mask = 0
+
+    def add(self, pattern_id: str, compiled: CompiledPattern):
+        bit = self.bits.get(pattern_id)
+        if bit is None:
+            bit = self.bits[pattern_id] = 1 << len(self.bits)
+            self.all_mask |= bit
+        for char in set(compiled.literals):
+            self.by_literal[char] = self.by_literal.get(char, 0) | bit
+        if any(token.kind == WILDCARD_CONNECTIVE for token in compiled.tokens):
+            self.by_wildcard |= bit
+
+    def mask_of(self, pattern_ids: Iterable[str]) -> int:
+        mask = 0
+        for pattern_id in pattern_ids:
+            mask |= self.bits.get(pattern_id, 0)
+        return mask
+
+    def filter(self, flat_seq: List[Dict], matcher) -> Tuple[int, Set[str], Dict]:
+        """
+        (マッチし得るパターンのマスク, ツリーで満たせるリテラル文字, 統計)
+
+        リテラルの判定は _match_from_position と同じ（func に含まれる、または並列接続詞として一致）
+        """
+        func_texts = {item["text"] for item in flat_seq if item["type"] == "func"}
+
+        # リテラルは 1 文字なので、まず func に含まれる文字をまとめて引く
+        func_chars = set("".join(func_texts))
+        available = {char for char in self.by_literal if char in func_chars}
+        for char in self.by_literal.keys() - available:
+            if any(matcher._is_connective_match(char, text) for text in func_texts):
+                available.add(char)
+
+        rejected = 0
+        for char, mask in self.by_literal.items():
+            if char not in available:
+                rejected |= mask
+        if self.by_wildcard and not any(
+            item["type"] in ("func", "core") and matcher._is_any_connective(item["text"])
+            for item in flat_seq
+        ):
+            rejected |= self.by_wildcard
+
+        total = len(self.bits)
+        rejected_count = bin(rejected).count("1")
+        stats = {
+            "patterns": total,
+            "rejected": rejected_count,
+            "rejection_rate": rejected_count / total if total else 0.0
+        }
+        return self.all_mask & ~rejected, available, stats
@@ -0,0 +1,115 @@
+"""
+ツリー距離計算用のインデックス（1 ツリーにつき 1 回構築）
+
+  - ノード ID は前順走査の順（_build_tree_parent_map と同じ）
+  - text / core テキスト → 最初のノード ID のハッシュ索引
+  - Euler tour + sparse table による O(1) の LCA と深さ
+
+距離は _calculate_tree_distance_v3 と同じ定義:
+  depth(Y) + depth(X) - 2 * depth(LCA)   （X が Y の子孫なら depth(X) - depth(Y)）
+"""
+
+from typing import Callable, Dict, Optional
+
+class TreeIndex:
+    def __init__(self, tree: Dict, core_text: Callable[[str], str]):
+        self.tree = tree
+        self.core_text = core_text
+        self._built = False
+
+    def _build(self):
+        texts = []
+        depth = []
+        euler = []
+        first = []
+        by_text = {}
+        by_core = {}
+
+        # 前順でノード ID を振りつつ Euler tour を作る（再帰の代わりに明示スタック）
+        stack = [(self.tree, -1, 0, None)]
+        while stack:
+            node, parent_id, node_depth, children = stack.pop()
+            if children is None:
+                if not isinstance(node, dict):
+                    continue
+                node_id = len(texts)
+                text = node.get("text", "")
+                texts.append(text)
+                depth.append(node_depth)
+                first.append(len(euler))
+                euler.append(node_id)
+                by_text.setdefault(text, node_id)
+                by_core.setdefault(self.core_text(text), node_id)
+
+                children = iter(node.get("children", []))
+                stack.append((node, parent_id, node_depth, (node_id, children)))
+                continue
+
+            node_id, remaining = children
+            for child in remaining:
+                stack.append((node, parent_id, node_depth, (node_id, remaining)))
+                stack.append((child, node_id, node_depth + 1, None))
+                break
+            else:
+                if parent_id >= 0:
+                    euler.append(parent_id)
+
+        self.texts = texts
+        self.depth = depth
+        self.first = first
+        self.by_text = by_text
+        self.by_core = by_core
+        self._substring_cache = {}
+
+        # sparse[k][i]: euler[i : i + 2^k] の中で最も浅いノード
+        sparse = [euler]
+        span = 1
+        while span * 2 <= len(euler):
+            previous = sparse[-1]
+            row = []
+            for i in range(len(euler) - span * 2 + 1):
+                a = previous[i]
+                b = previous[i + span]
+                row.append(a if depth[a] <= depth[b] else b)
+            sparse.append(row)
+            span *= 2
+        self.sparse = sparse
+        self._built = True
+
+    def __len__(self):
+        if not self._built:
+            self._build()
+        return len(self.texts)
+
+    def find_node(self, target_text: str) -> Optional[int]:
+        """
+        _calculate_tree_distance_v3 の find_best_node と同じ規則:
+          前順で最初の「core テキスト一致 または テキスト完全一致」、無ければ最初の部分一致
+        """
+        if not self._built:
+            self._build()
+
+        core_id = self.by_core.get(self.core_text(target_text))
+        text_id = self.by_text.get(target_text)
+        if core_id is not None or text_id is not None:
+            return min(node_id for node_id in (core_id, text_id) if node_id is not None)
+
+        if target_text not in self._substring_cache:
+            self._substring_cache[target_text] = next(
+                (node_id for node_id, text in enumerate(self.texts) if target_text in text), None
+            )
+        return self._substring_cache[target_text]
+
+    def lca(self, a: int, b: int) -> int:
+        if not self._built:
+            self._build()
+        left, right = sorted((self.first[a], self.first[b]))
+        k = (right - left + 1).bit_length() - 1
+        row = self.sparse[k]
+        x = row[left]
+        y = row[right - (1 << k) + 1]
+        return x if self.depth[x] <= self.depth[y] else y
+
+    def distance(self, a: int, b: int) -> int:
+        ancestor = self.lca(a, b)
+        return self.depth[a] + self.depth[b] - 2 * self.depth[ancestor]
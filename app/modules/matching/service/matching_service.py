@@ -35,9 +35,11 @@ async def matching_service(
             "pattern_status": {}
         }
     
-    from app.modules.matching.components.matcher_v3_final import PatternMatcherV3Final
+    from modules.matching.components.matcher_v3_final import PatternMatcherV3Final
+    from modules.matching.components.pattern_automaton import get_pattern_automaton
     
     matcher = PatternMatcherV3Final()
+    automaton = get_pattern_automaton(struct_groups)
     
     pattern_status = {}
     matched_patterns = []
@@ -48,6 +50,13 @@ async def matching_service(
         selected_pattern_ids = set(int(pid) for pid in selected_patterns if pid)
     else:
         selected_pattern_ids = None
+
+    # 全パターンを 1 回の走査でマッチングし、候補だけトリプル抽出する
+    results = matcher.match_all(
+        tree,
+        automaton,
+        pattern_ids={str(pid) for pid in selected_pattern_ids} if selected_pattern_ids is not None else None
+    )
     
     for pattern_id_str, pattern_item in struct_groups.items():
         pattern_id = int(pattern_id_str)
@@ -68,7 +77,7 @@ async def matching_service(
             pattern_status[pattern_id] = "dark_gray"
             continue
         
-        result = matcher.match_and_extract(tree, pattern_str, pattern_id=pattern_id)
+        result = results.get(str(pattern_id_str))
         
         if result and result.get("match"):
             pattern_status[pattern_id] = "light"
@@ -101,5 +110,6 @@ async def matching_service(
         "triples": all_triples,
         "triples_by_pattern": triples_by_pattern,
         "matched_patterns": matched_patterns,
-        "pattern_status": pattern_status
+        "pattern_status": pattern_status,
+        "prefilter": matcher.prefilter_stats
     }
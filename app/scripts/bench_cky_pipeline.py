@@ -0,0 +1,88 @@
+"""
+CKY 解析パイプライン (cky_parse_service) の壁時計時間とピーク RSS を分節数ごとに測る
+
+  python app/scripts/bench_cky_pipeline.py [--sizes 10 20 40] [--rebuild] [--timeout 300]
+
+各サイズは別プロセスで実行する（ピーク RSS をサイズごとに分けるため）。
+--rebuild を付けると、解析後に normalize_bunsetsu + build_cky_table で表を作り直す
+（セッションの chart を使い回す前のパイプラインが余分に行っていた処理）。
+依存モデルは app/model/dep_model があれば読み込み、無ければ pred=0 のフォールバックで測る。
+"""
+from pathlib import Path
+import argparse
+import asyncio
+import contextlib
+import copy
+import io
+import json
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = Path(__file__).resolve().parent
+APP_DIR = ROOT.parent
+for path in (str(APP_DIR), str(ROOT)):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from bench_data import make_bunsetsu_data
+
+def run_one(n, rebuild, seed):
+    import startup
+    from modules.cky.components.cky import build_cky_table, normalize_bunsetsu
+    from modules.cky.service.cky_service import cky_parse_service
+    from modules.cky.service.dep_model_service import get_dep_model
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        asyncio.run(startup.setup_dep_model())
+    model, _ = get_dep_model()
+
+    data = make_bunsetsu_data(n, seed)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = asyncio.run(cky_parse_service(copy.deepcopy(data)))
+        if rebuild:
+            build_cky_table(normalize_bunsetsu(copy.deepcopy(data)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "bunsetsu": n,
+        "status": result.get("status"),
+        "seconds": round(elapsed, 3),
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024,
+        "model_loaded": model is not None
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the CKY parse pipeline")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 20, 40])
+    parser.add_argument("--rebuild", action="store_true", help="also rebuild the CKY table after parsing")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        print(json.dumps(run_one(args.child, args.rebuild, args.seed)))
+        return
+
+    print(f"{'bunsetsu':>8} {'seconds':>9} {'peak RSS':>9}  status")
+    for n in args.sizes:
+        command = [sys.executable, __file__, "--child", str(n), "--seed", str(args.seed)]
+        if args.rebuild:
+            command.append("--rebuild")
+        try:
+            completed = subprocess.run(command, capture_output=True, text=True, timeout=args.timeout)
+        except subprocess.TimeoutExpired:
+            print(f"{n:>8} {'-':>9} {'-':>9}  timeout after {args.timeout:.0f}s")
+            continue
+        if completed.returncode != 0:
+            print(f"{n:>8} {'-':>9} {'-':>9}  failed: {completed.stderr.strip().splitlines()[-1:]}")
+            continue
+        row = json.loads(completed.stdout.strip().splitlines()[-1])
+        note = "" if row["model_loaded"] else " (dependency model not loaded, pred=0 fallback)"
+        print(f"{n:>8} {row['seconds']:>8.3f}s {row['peak_rss_mb']:>6} MB  {row['status']}{note}")
+
+if __name__ == "__main__":
+    main()
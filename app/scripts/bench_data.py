@@ -0,0 +1,24 @@
+"""
+ベンチマーク用の合成分節データ（/api/cky の data と同じ形式）
+
+  make_bunsetsu_data(n) → [{"bunsetu": [{"text": "太郎", "pos": "NOUN", "tag": "名詞", "type": "core"}, ...]}, ...]
+"""
+import random
+
+CORES = ["太郎", "本", "読む", "東京", "会議", "説明", "する", "大学", "研究", "発表"]
+FUNCS = ["は", "が", "を", "に", "で", "と", "した", "された", "の", "によって", "および"]
+
+def make_bunsetsu_data(n, seed=0):
+    rnd = random.Random(seed)
+    data = []
+    for _ in range(n):
+        morphs = []
+        for _ in range(rnd.randint(1, 2)):
+            morphs.append({"text": rnd.choice(CORES), "pos": "NOUN", "tag": "名詞", "type": "core"})
+        for _ in range(rnd.randint(0, 2)):
+            morph = {"text": rnd.choice(FUNCS), "pos": "ADP", "tag": "助詞", "type": "func"}
+            if rnd.random() < 0.2:
+                morph["stem_type"] = "sa_hen"
+            morphs.append(morph)
+        data.append({"bunsetu": morphs})
+    return data
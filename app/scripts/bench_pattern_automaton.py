@@ -0,0 +1,154 @@
+"""
+パターンごとのループ (match_and_extract) と PatternAutomaton による一括マッチング (match_all) を比べる
+
+  python app/scripts/bench_pattern_automaton.py [--patterns 454 10000] [--sentences sentences.txt] [--trees 300]
+
+ツリーは分節データを process_cky にかけ、全体セルから列挙したツリーの flat_sequence を持つノード。
+split の pred は依存モデル (app/model/dep_model) があればその予測、無ければ全 split を pred=1 として展開する
+（pred=0 だけだとツリーが全体セル 1 ノードになり、マッチングの負荷を測れない）。
+--sentences（1 行 1 文）を渡すと GiNZA で分節化した文を使い、無ければ合成の分節データを使う。
+パターン数が struct_groups より多い場合は、実パターンに一般的な助詞からなるランダムな骨格を足す。
+両者の結果が一致するかも確認する。
+"""
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import logging
+import random
+import sys
+import time
+
+ROOT = Path(__file__).resolve().parent
+APP_DIR = ROOT.parent
+for path in (str(APP_DIR), str(ROOT)):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from bench_data import make_bunsetsu_data
+from modules.cky.components.cky import iter_tree_list_from_cell, process_cky
+from modules.matching.components.matcher_v3_final import PatternMatcherV3Final
+from modules.matching.components.pattern_automaton import PatternAutomaton
+from modules.matching.components.pattern_compiler import compile_struct_groups
+
+STRUCT_GROUPS_PATH = APP_DIR / "model" / "struct_groups_indexed_all.json"
+SYNTHETIC_FUNCS = ["は", "が", "を", "に", "で", "と", "の", "した", "された", "によって", "から", "まで", "ている", "、", "&"]
+
+def synthetic_struct_groups(struct_groups, size, seed=1):
+    rnd = random.Random(seed)
+    patterns = [item["representative_pattern"] for item in struct_groups.values()]
+    groups = {}
+    for idx in range(size):
+        if idx < len(patterns):
+            groups[str(idx)] = {"representative_pattern": patterns[idx]}
+            continue
+        parts = []
+        for slot in range(rnd.randint(2, 4)):
+            tag = "-サ変" if rnd.random() < 0.05 else ""
+            parts.append(f"[{rnd.choice('XY')}{slot + 1}{tag}]")
+            if rnd.random() < 0.9:
+                parts.append(rnd.choice(SYNTHETIC_FUNCS))
+        groups[str(idx)] = {"representative_pattern": "".join(parts)}
+    return groups
+
+def load_bunsetsu_data(sentences_path, seed):
+    if sentences_path is None:
+        return [make_bunsetsu_data(n, seed + s) for n in (2, 3, 4, 5, 6) for s in range(20)]
+
+    import startup
+    from modules.bunsetu.components.ginza import segment_bunsetu
+
+    nlp = startup.setup_ginza()
+    with open(sentences_path, "r", encoding="utf-8") as f:
+        sentences = [line.strip() for line in f if line.strip()]
+    return [asyncio.run(segment_bunsetu(sentence, nlp)) for sentence in sentences]
+
+def walk(tree):
+    if isinstance(tree, dict):
+        yield tree
+        for child in tree.get("children", []) or []:
+            yield from walk(child)
+
+def load_dep_model():
+    import startup
+    from modules.cky.service.dep_model_service import get_dep_model
+
+    asyncio.run(startup.setup_dep_model())
+    model, _ = get_dep_model()
+    return model is not None
+
+def collect_trees(datas, use_model, per_sentence=8):
+    from modules.cky.service.cky_service import enrich_splits_with_deps
+
+    trees = []
+    for data in datas:
+        result = asyncio.run(process_cky(data))
+        if result["status"] != "success":
+            continue
+        if use_model:
+            asyncio.run(enrich_splits_with_deps(result["combinations"], morph_store=result["bunsetsu"].morph_store))
+        else:
+            for combo in result["combinations"]:
+                for split in combo.get("splits", []):
+                    split["pred"] = 1
+        n = len(result["bunsetsu"])
+        items = iter_tree_list_from_cell(
+            result["chart"], result["combinations"], 0, n - 1,
+            bunsetsu_list=result["bunsetsu"], limit=per_sentence, split_index=result["split_index"]
+        )
+        for item in items:
+            trees.extend(node for node in walk(item["tree"]) if node.get("flat_sequence"))
+    return trees
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-pattern matching against PatternAutomaton")
+    parser.add_argument("--patterns", type=int, nargs="+", default=[454, 10000])
+    parser.add_argument("--sentences", help="text file with one sentence per line (segmented with GiNZA)")
+    parser.add_argument("--trees", type=int, default=300, help="number of trees to match")
+    parser.add_argument("--loop-trees", type=int, default=60, help="trees for the per-pattern loop above 1000 patterns")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    with open(STRUCT_GROUPS_PATH, "r", encoding="utf-8") as f:
+        struct_groups = json.load(f)
+    use_model = load_dep_model()
+    trees = collect_trees(load_bunsetsu_data(args.sentences, args.seed), use_model)[:args.trees]
+    matcher = PatternMatcherV3Final()
+    print(f"{len(trees)} trees (pred: {'dependency model' if use_model else 'all splits pred=1, model not loaded'})")
+
+    for size in args.patterns:
+        groups = struct_groups if size == len(struct_groups) else synthetic_struct_groups(struct_groups, size)
+        compiled = compile_struct_groups(groups)
+
+        start = time.perf_counter()
+        automaton = PatternAutomaton(compiled)
+        build = time.perf_counter() - start
+
+        subset = trees if size <= 1000 else trees[:args.loop_trees]
+        start = time.perf_counter()
+        looped = [
+            {pid: result for pid, pattern in compiled.items() if (result := matcher.match_and_extract(tree, pattern, pid))}
+            for tree in subset
+        ]
+        loop = (time.perf_counter() - start) / len(subset)
+
+        start = time.perf_counter()
+        combined = [matcher.match_all(tree, automaton) for tree in subset]
+        match_all = (time.perf_counter() - start) / len(subset)
+
+        start = time.perf_counter()
+        for tree in subset:
+            automaton.scan(tree["flat_sequence"], matcher)
+        scan = (time.perf_counter() - start) / len(subset)
+
+        print(
+            f"patterns={len(compiled):6} trees={len(subset)} matches={sum(map(len, looped))} "
+            f"build={build * 1000:.1f}ms nodes={automaton.nodes} "
+            f"loop={loop * 1000:.2f}ms/tree match_all={match_all * 1000:.2f}ms/tree "
+            f"(scan only {scan * 1000:.3f}ms) speedup={loop / match_all:.1f}x identical={looped == combined}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+SplitIndex（span / tree_id → split の索引）と、以前の combinations 全走査による参照を比べる
+
+  python app/scripts/bench_split_index.py [--sizes 20 30 50] [--tree-id-samples 2000]
+
+  build_combinations_list / SplitIndex の構築時間
+  全 (i, j, split_idx) の pred 参照:   全走査 vs get_split_pred_from_combinations(split_index=...)
+  tree_id 参照 (サンプル):            全走査 vs SplitIndex.find_tree_id
+"""
+from pathlib import Path
+import argparse
+import sys
+import time
+
+ROOT = Path(__file__).resolve().parent
+APP_DIR = ROOT.parent
+for path in (str(APP_DIR), str(ROOT)):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from bench_data import make_bunsetsu_data
+from modules.cky.components.cky import (
+    SplitIndex, build_cky_table, build_combinations_list, get_split_pred_from_combinations, normalize_bunsetsu
+)
+
+def scan_pred(combinations, span_i, span_j, split_idx):
+    # 索引導入前の get_split_pred_from_combinations と同じ全走査
+    for combo in combinations:
+        if combo.get("span") == [span_i, span_j]:
+            splits = combo["splits"]
+            if split_idx < len(splits):
+                return splits[split_idx].get("pred", 0)
+    return None
+
+def scan_tree_id(combinations, tree_id):
+    # 索引導入前の find_split_by_tree_id と同じ全走査
+    for combo in combinations:
+        for split in combo["splits"]:
+            if split.get("tree_id") == tree_id:
+                return split, combo
+    return None, None
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - start) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark span / tree_id split lookups")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[20, 30, 50])
+    parser.add_argument("--tree-id-samples", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    for n in args.sizes:
+        table = build_cky_table(normalize_bunsetsu(make_bunsetsu_data(n, args.seed)))
+        combinations, build_ms = timed(lambda: build_combinations_list(table, n))
+        split_index, index_ms = timed(lambda: SplitIndex(combinations))
+
+        queries = [(i, j, k) for i in range(n) for j in range(i + 1, n) for k in range(j - i)]
+        tree_ids = [split["tree_id"] for combo in combinations for split in combo["splits"]]
+        sample = tree_ids[::max(1, len(tree_ids) // args.tree_id_samples)]
+
+        _, scan_pred_ms = timed(lambda: [scan_pred(combinations, *query) for query in queries])
+        _, index_pred_ms = timed(lambda: [
+            get_split_pred_from_combinations(combinations, i, j, k, split_index=split_index) for i, j, k in queries
+        ])
+        _, scan_tree_ms = timed(lambda: [scan_tree_id(combinations, tree_id) for tree_id in sample])
+        _, index_tree_ms = timed(lambda: [split_index.find_tree_id(tree_id) for tree_id in sample])
+
+        print(f"n={n}: {len(combinations)} combos, {len(tree_ids)} splits")
+        print(f"  build_combinations_list {build_ms:9.1f} ms")
+        print(f"  SplitIndex build        {index_ms:9.1f} ms")
+        print(f"  {len(queries):>6} pred lookups    {scan_pred_ms:9.1f} ms scan -> {index_pred_ms:7.1f} ms index")
+        print(f"  {len(sample):>6} tree_id lookups {scan_tree_ms:9.1f} ms scan -> {index_tree_ms:7.2f} ms index")
+
+if __name__ == "__main__":
+    main()
@@ -26,6 +26,9 @@ logger.warning(f"[Startup] ログファイルを作成: {log_filename}")
 
 logging.getLogger("app").setLevel(logging.INFO)
 
+# matching_service はマッチャーを modules.matching 経由で読み込む（以前の app.modules と同じく INFO を出す）
+logging.getLogger("modules.matching.components").setLevel(logging.INFO)
+
 logging.getLogger("app.modules.matching.components.matcher_minimal").setLevel(logging.WARNING)
 
 logging.getLogger("app.modules.matching.components.matcher_v3").setLevel(logging.INFO)
@@ -33,10 +36,21 @@ logging.getLogger("app.modules.matching.components.matcher_v3").setLevel(logging
 STRUCT_GROUPS = {}
 PARALLEL_CONNECTIVES = {}
 
-def setup_ginza():
+# group_into_bunsetsu は pos_ / tag_ / morph / 係り受け (children) しか読まないため
+# 固有表現 (ner) と文節スパン (bunsetu_recognizer) はロードしない
+GINZA_PROFILES = {
+    "full": [],
+    "segmentation": ["ner", "bunsetu_recognizer"]
+}
+GINZA_PROFILE = os.environ.get("GINZA_PROFILE", "segmentation")
+
+def setup_ginza(profile=None):
+    profile = profile or GINZA_PROFILE
     try:
-        nlp = spacy.load("ja_ginza")
-        logger.info("Ginza model loaded successfully")
+        if profile not in GINZA_PROFILES:
+            raise ValueError(f"Unknown GINZA_PROFILE '{profile}' (expected one of {sorted(GINZA_PROFILES)})")
+        nlp = spacy.load("ja_ginza", exclude=GINZA_PROFILES[profile])
+        logger.info(f"Ginza model loaded successfully (profile={profile}, pipes={nlp.pipe_names})")
         return nlp
     except Exception as e:
         logger.error(f"Failed to load ginza model: {e}")
@@ -54,6 +68,11 @@ def setup_matching_module():
             STRUCT_GROUPS = json.load(f)
         logger.info(f"[Startup] Loaded {len(STRUCT_GROUPS)} patterns from {struct_groups_path}")
 
+        # パターンのコンパイルはここで 1 回だけ（matching_service は同じ STRUCT_GROUPS でこのオートマトンを使う）
+        from modules.matching.components.pattern_automaton import get_pattern_automaton
+        automaton = get_pattern_automaton(STRUCT_GROUPS)
+        logger.info(f"[Startup] Compiled {len(automaton.patterns)} patterns ({automaton.nodes} automaton nodes)")
+
         connectives_path = os.path.join(app_dir, "model", "parallel_connectives.yml")
         with open(connectives_path, "r", encoding="utf-8") as f:
             PARALLEL_CONNECTIVES = yaml.safe_load(f)
@@ -1,7 +1,10 @@
+const EXPAND_CELL_PAGE_SIZE = 200;
+
 let ckyState = {
     result: null,
     selectedTreeId: null,
-    bunsetsuList: null
+    bunsetsuList: null,
+    expanded: null
 };
 
 function initCKY() {
@@ -18,6 +21,7 @@ function updateCKYContent(content) {
 function resetCKY() {
     ckyState.result = null;
     ckyState.selectedTreeId = null;
+    ckyState.expanded = null;
     updateCKYContent('<div class="empty-state">編集後のデータを送信してください</div>');
 }
 
@@ -218,12 +222,14 @@ async function expandTreeFromCell(i, j) {
     let data = (typeof getCurrentData === 'function') ? getCurrentData() : ckyState.bunsetsuList;
     if (!data || data.length === 0) return;
 
+    ckyState.expanded = null;
     try {
-        const resp = await API.ckyExpandCell(data, [i, j], 1);
+        const resp = await API.ckyExpandCell(data, [i, j], 1, null, 0, EXPAND_CELL_PAGE_SIZE);
         if (resp.status !== 'success') {
             displayExpandedTrees(null, i, j);
             return;
         }
+        ckyState.expanded = { data, i, j, result: resp };
         displayExpandedTrees(resp, i, j);
     } catch (err) {
         console.error('[CKY] Expand error:', err);
@@ -231,7 +237,32 @@ async function expandTreeFromCell(i, j) {
     }
 }
 
-function displayExpandedTrees(result, i, j) {
+async function loadMoreExpandedTrees(button) {
+    const expanded = ckyState.expanded;
+    if (!expanded) return;
+
+    const { data, i, j, result } = expanded;
+    const activeIdx = parseInt(document.querySelector('.tree-option.active')?.dataset.treeIdx ?? '0');
+    button.disabled = true;
+    try {
+        const resp = await API.ckyExpandCell(data, [i, j], 1, null, result.tree_list.length, EXPAND_CELL_PAGE_SIZE);
+        if (resp.status !== 'success' || ckyState.expanded !== expanded) {
+            button.disabled = false;
+            return;
+        }
+        result.tree_list = result.tree_list.concat(resp.tree_list || []);
+        result.total_trees = resp.total_trees;
+        const scrollTop = document.querySelector('.trees-selector-panel')?.scrollTop ?? 0;
+        displayExpandedTrees(result, i, j, activeIdx);
+        const panel = document.querySelector('.trees-selector-panel');
+        if (panel) panel.scrollTop = scrollTop;
+    } catch (err) {
+        console.error('[CKY] Load more error:', err);
+        button.disabled = false;
+    }
+}
+
+function displayExpandedTrees(result, i, j, activeIdx = 0) {
     const section = document.querySelector('#cell-expanded-section');
     if (!section) return;
 
@@ -240,6 +271,7 @@ function displayExpandedTrees(result, i, j) {
         return;
     }
 
+    const hasMore = result.total_trees > result.tree_list.length;
     let html = `<div class="expanded-trees-layout"><h3>セル (${i}, ${j}) : ${result.cell_text}</h3>`;
 
     if (result.is_terminal) {
@@ -250,12 +282,17 @@ function displayExpandedTrees(result, i, j) {
         result.tree_list.forEach((tree, idx) => {
             const pred = tree.root_pred ?? 'unknown';
             const predClass = pred === 1 ? 'pred-1' : pred === 0 ? 'pred-0' : '';
-            html += `<button class="tree-option ${idx === 0 ? 'active' : ''} ${predClass}" data-tree-idx="${idx}">`;
+            html += `<button class="tree-option ${idx === activeIdx ? 'active' : ''} ${predClass}" data-tree-idx="${idx}">`;
             html += `<div class="tree-option-header">#${tree.tree_number} Tree ${tree.tree_number}</div>`;
             html += `<div class="tree-option-split-left">${tree.left_split}</div>`;
             html += `<div class="tree-option-split-right">${tree.right_split}</div>`;
             html += `</button>`;
         });
+        if (hasMore) {
+            const next = Math.min(EXPAND_CELL_PAGE_SIZE, result.total_trees - result.tree_list.length);
+            html += `<p class="table-note">先頭 ${result.tree_list.length} / ${result.total_trees} 件を表示</p>`;
+            html += `<button class="tree-load-more">次の ${next} 件を読み込む</button>`;
+        }
         html += `</div>`;
         html += `<div class="trees-display-panel"><canvas id="tree-canvas" class="tree-canvas"></canvas></div>`;
         html += `</div>`;
@@ -267,12 +304,20 @@ function displayExpandedTrees(result, i, j) {
     section.innerHTML = html;
 
     if (result.tree_list && result.tree_list.length > 0) {
-        updateCellBatchCount(i, j, result.tree_list);
+        if (!hasMore) {
+            updateCellBatchCount(i, j, result.tree_list);
+        }
         bindTreeListEvents(result);
-        drawTreeOnCanvas(result.tree_list[0].tree);
+        const loadMore = section.querySelector('.tree-load-more');
+        if (loadMore) {
+            loadMore.addEventListener('click', () => loadMoreExpandedTrees(loadMore));
+        }
+
+        const activeTree = result.tree_list[activeIdx] || result.tree_list[0];
+        drawTreeOnCanvas(activeTree.tree);
 
         if (typeof initializeMatching === 'function') {
-            initializeMatching(result.tree_list[0].tree, ckyState.bunsetsuList);
+            initializeMatching(activeTree.tree, ckyState.bunsetsuList);
         }
     }
 }
@@ -28,11 +28,11 @@ const API = {
         return response.json();
     },
 
-    async ckyExpandCell(data, cell, pred_threshold = 1) {
+    async ckyExpandCell(data, cell, pred_threshold = 1, session_id = null, offset = 0, limit = null) {
         const response = await fetch('/api/cky/expand-cell', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ data, cell, pred_threshold })
+            body: JSON.stringify({ data, cell, pred_threshold, session_id, offset, limit })
         });
 
         if (!response.ok) {
@@ -0,0 +1,42 @@
+"""
+GINZA_PROFILE=segmentation（ner / bunsetu_recognizer を除外）の分節結果が
+フルパイプラインと同じかを確認する回帰テスト
+"""
+import pytest
+
+spacy = pytest.importorskip("spacy")
+pytest.importorskip("ja_ginza")
+
+from modules.bunsetu.components.ginza import group_into_bunsetsu, segment_bunsetu_batch
+
+SAMPLE_TEXTS = [
+    "この装置は来月の会議に向けて確認したが、問題があった。",
+    "出演者の山田と佐藤が東京の大学で受賞・受章した。",
+    "政府は新しい方針を発表し、専門家がその影響を分析している。",
+    "アミターブ・バッチャンが主演した映画は、インドで大きな話題になった。",
+    "彼女は３月に京都大学（京大）を卒業し、研究所で働きたいと考えている。",
+]
+
+@pytest.fixture(scope="module")
+def pipelines(tmp_path_factory):
+    # startup は import 時にカレントディレクトリへ logs/ を作るので一時ディレクトリで読み込む
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.chdir(tmp_path_factory.mktemp("startup"))
+        import startup
+        profiles = {name: startup.setup_ginza(name) for name in ("full", "segmentation")}
+    if any(nlp is None for nlp in profiles.values()):
+        pytest.skip("ja_ginza could not be loaded")
+    return profiles
+
+def test_segmentation_profile_excludes_unused_pipes(pipelines):
+    assert "ner" not in pipelines["segmentation"].pipe_names
+    assert "bunsetu_recognizer" not in pipelines["segmentation"].pipe_names
+
+@pytest.mark.parametrize("text", SAMPLE_TEXTS)
+def test_segmentation_profile_matches_full_pipeline(pipelines, text):
+    expected = group_into_bunsetsu(pipelines["full"](text))
+    assert group_into_bunsetsu(pipelines["segmentation"](text)) == expected
+
+def test_segmentation_profile_matches_full_pipeline_batch(pipelines):
+    expected = list(segment_bunsetu_batch(SAMPLE_TEXTS, pipelines["full"]))
+    assert list(segment_bunsetu_batch(SAMPLE_TEXTS, pipelines["segmentation"])) == expected
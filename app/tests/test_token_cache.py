@@ -0,0 +1,92 @@
+"""
+SentenceTokenCache.encode_pair が "left [SEP] right" の直接トークン化と一致するか
+
+サンプル文のすべての (i, k, j)（左 span = i..k, 右 span = k+1..j）で比べる。
+トークナイザーは app/model/dep_model があればそれを使い、無ければサンプル文から語彙を作った
+BERT 形式のトークナイザー（MeCab + WordPiece / Basic + WordPiece）を使う。
+"""
+import os
+
+import pytest
+
+transformers = pytest.importorskip("transformers")
+
+from modules.cky.components.token_cache import SentenceTokenCache
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "model", "dep_model")
+SPECIAL_TOKENS = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"]
+
+SENTENCES = [
+    ["この装置は", "来月の", "会議に", "向けて", "確認したが、", "問題が", "あった。"],
+    ["出演者の", "山田と", "佐藤が", "東京の", "大学で", "受賞・受章した。"],
+    ["政府は", "新しい", "方針を", "発表し、", "専門家が", "その", "影響を", "分析している。"],
+]
+
+def write_vocab(path, words):
+    # 語の一部を語彙から外して WordPiece の分割（分節境界をまたぐ ## 片）が起きるようにする
+    words = sorted(set(words))
+    chars = sorted({char for word in words for char in word})
+    vocab = SPECIAL_TOKENS + [word for idx, word in enumerate(words) if idx % 3] + chars + ["##" + char for char in chars]
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(dict.fromkeys(vocab)) + "\n")
+
+def sample_words(word_tokenize):
+    return [word for pieces in SENTENCES for word in word_tokenize("".join(pieces))]
+
+def mecab_tokenizer(tmp_path):
+    pytest.importorskip("fugashi")
+    pytest.importorskip("unidic_lite")
+    vocab_file = str(tmp_path / "vocab.txt")
+    write_vocab(vocab_file, [])
+    options = dict(word_tokenizer_type="mecab", mecab_kwargs={"mecab_dic": "unidic_lite"})
+    base = transformers.BertJapaneseTokenizer(vocab_file, **options)
+    write_vocab(vocab_file, sample_words(base.word_tokenizer.tokenize))
+    return transformers.BertJapaneseTokenizer(vocab_file, **options)
+
+def basic_words(tokenizer, text):
+    if hasattr(tokenizer, "basic_tokenizer"):
+        return tokenizer.basic_tokenizer.tokenize(text)
+    backend = tokenizer.backend_tokenizer
+    return [word for word, _ in backend.pre_tokenizer.pre_tokenize_str(backend.normalizer.normalize_str(text))]
+
+def basic_tokenizer(tmp_path):
+    vocab_file = str(tmp_path / "vocab.txt")
+    write_vocab(vocab_file, [])
+    base = transformers.BertTokenizer(vocab_file)
+    write_vocab(vocab_file, sample_words(lambda text: basic_words(base, text)))
+    return transformers.BertTokenizer(vocab_file)
+
+@pytest.fixture(params=["model", "mecab", "basic"])
+def tokenizer(request, tmp_path):
+    if request.param == "model":
+        if not os.path.isdir(MODEL_DIR):
+            pytest.skip("app/model/dep_model is not available")
+        return transformers.AutoTokenizer.from_pretrained(MODEL_DIR, local_files_only=True)
+    if request.param == "mecab":
+        return mecab_tokenizer(tmp_path)
+    return basic_tokenizer(tmp_path)
+
+@pytest.mark.parametrize("prefetch", [False, True])
+@pytest.mark.parametrize("pieces", SENTENCES)
+def test_encode_pair_matches_direct_tokenization(tokenizer, pieces, prefetch):
+    cache = SentenceTokenCache(tokenizer, pieces)
+    assert cache.enabled
+
+    n = len(pieces)
+    triples = [(i, k, j) for i in range(n) for j in range(i + 1, n) for k in range(i, j)]
+    if prefetch:
+        cache.prefetch([span for i, k, j in triples for span in ((i, k), (k + 1, j))])
+
+    for i, k, j in triples:
+        left_text = "".join(pieces[i:k + 1])
+        right_text = "".join(pieces[k + 1:j + 1])
+        expected = tokenizer([f"{left_text} [SEP] {right_text}"], truncation=True, max_length=512)["input_ids"][0]
+        assert cache.encode_pair((i, k), (k + 1, j))["input_ids"] == expected, (i, k, j)
+
+def test_long_spans_are_tokenized_directly(tokenizer):
+    pieces = SENTENCES[0]
+    cache = SentenceTokenCache(tokenizer, pieces)
+    direct_spans = cache.direct_spans
+    cache.span_ids(1, 4)
+    assert not cache.assemblable(1, 4)
+    assert cache.direct_spans == direct_spans + 1